@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Coût de routage d'un callback selon le nombre d'actions enregistrées.
+
+Compare l'ancienne chaîne de filtres aiogram (F.data.startswith(...)
+évalués dans l'ordre jusqu'au premier qui correspond) à la table de
+dispatch (unpack_cb + recherche dans un dictionnaire), pour un bouton en
+tête, au milieu et en fin de chaîne. Mesure aussi pack/unpack et la taille
+des données de callback par rapport à l'ancien format texte.
+
+Usage:
+  python benchmarks/bench_callback_dispatch.py [--n 8,32,128,512]
+"""
+from __future__ import annotations
+import argparse
+import os
+import sys
+import timeit
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from aiogram import F
+
+import jefflebot_fr as app
+
+
+def linear_chain(n: int):
+    filters = [F.data.startswith(f"act{i}:") for i in range(n)]
+
+    def route(call):
+        for i, f in enumerate(filters):
+            if f.resolve(call):
+                return i
+        return None
+    return route
+
+
+def table(n: int):
+    actions = {f"act{i}": i for i in range(n)}
+
+    def route(call):
+        action, args = app.unpack_cb(call.data)
+        return actions.get(action)
+    return route
+
+
+def per_call_ns(fn, arg, number=20000) -> float:
+    return min(timeit.repeat(lambda: fn(arg), number=number, repeat=3)) / number * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", default="8,32,128,512")
+    args = parser.parse_args()
+
+    print(f"{'actions':>8} {'position':>9} {'chaîne (ns)':>12} {'table (ns)':>11}")
+    for n in map(int, args.n.split(",")):
+        chain, tbl = linear_chain(n), table(n)
+        for label, pos in (("début", 0), ("milieu", n // 2), ("fin", n - 1)):
+            legacy = SimpleNamespace(data=f"act{pos}:1024")
+            packed = SimpleNamespace(data=app.pack_cb(f"act{pos}", 1024))
+            assert chain(legacy) == tbl(packed) == pos
+            print(f"{n:>8} {label:>9} {per_call_ns(chain, legacy):>12.0f} {per_call_ns(tbl, packed):>11.0f}")
+
+    cursor = (1, 2_000_000_000, 123_456)
+    packed = app.pack_cb("ls.prod", *cursor)
+    legacy = "lst:prod:n:" + ":".join(map(str, cursor))
+    print()
+    print(f"pack_cb   {per_call_ns(lambda c: app.pack_cb('ls.prod', *c), cursor):7.0f} ns")
+    print(f"unpack_cb {per_call_ns(app.unpack_cb, packed):7.0f} ns")
+    print(f"curseur 3 champs : {len(packed)} octets compacts vs {len(legacy)} octets texte (limite {app.CALLBACK_DATA_MAX})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Temps de démarrage à froid, mesuré dans des processus Python neufs.
+
+Pour chaque essai : import du module, create_app() (bot + dispatcher, sans
+base), puis migrate() et première requête sur un fichier SQLite existant.
+
+Usage:
+  python benchmarks/bench_cold_start.py [--runs 5]
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+PROBE = r"""
+import json, time
+t0 = time.perf_counter()
+import jefflebot_fr as app
+t1 = time.perf_counter()
+a = app.create_app()
+t2 = time.perf_counter()
+with a.context():
+    app.migrate()
+    with app.db() as s:
+        s.query(app.Product).first()
+t3 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "create_app": t2 - t1, "first_query": t3 - t2}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    samples = {"import": [], "create_app": [], "first_query": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DB_URL=f"sqlite:///{tmp}/cold.db", PYTHONPATH=ROOT)
+        for _ in range(args.runs):
+            out = subprocess.run([sys.executable, "-c", PROBE], env=env, capture_output=True, text=True, check=True)
+            for key, value in json.loads(out.stdout.strip().splitlines()[-1]).items():
+                samples[key].append(value * 1000)
+    for key, values in samples.items():
+        print(f"{key:<12} médiane {statistics.median(values):7.1f} ms   min {min(values):7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Débit d'écriture concurrent selon le profil SQLite (DB_PROFILE).
+
+Plusieurs threads simulent caisse, paie et formulaires admin : chacun
+enchaîne des transactions courtes (écriture comptable + mouvement de stock)
+sur le même fichier. On mesure transactions/s et erreurs « database is locked ».
+
+Usage:
+  python benchmarks/bench_db_profiles.py [--writers 8] [--tx 300]
+"""
+from __future__ import annotations
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("DB_URL", "sqlite://")
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+import jefflebot_fr as app
+
+
+def run_profile(profile: str, writers: int, tx_per_writer: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        eng = app.make_engine(f"sqlite:///{tmp}/bench.db", profile=profile)
+        app.Base.metadata.create_all(eng)
+        factory = sessionmaker(bind=eng, autoflush=False)
+        errors = [0]
+        lock = threading.Lock()
+
+        def writer(n: int):
+            for i in range(tx_per_writer):
+                try:
+                    with factory() as s:
+                        s.add(app.LedgerEntry(entry_type=app.LedgerType.INCOME.value, amount=1000, description=f"bench {n}/{i}"))
+                        s.add(app.StockMovement(product_id=None, qty_change=-1, reason="vente"))
+                        s.commit()
+                except OperationalError:
+                    with lock:
+                        errors[0] += 1
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - t0
+        eng.dispose()
+    done = writers * tx_per_writer - errors[0]
+    return {"profile": profile, "tx_s": done / elapsed, "errors": errors[0], "elapsed": elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--tx", type=int, default=300, help="transactions par writer")
+    parser.add_argument("--profiles", default=",".join(app.SQLITE_PROFILES))
+    args = parser.parse_args()
+    print(f"{'profil':<8} {'tx/s':>10} {'verrous':>8} {'durée (s)':>10}")
+    for profile in args.profiles.split(","):
+        r = run_profile(profile, args.writers, args.tx)
+        print(f"{r['profile']:<8} {r['tx_s']:>10.0f} {r['errors']:>8} {r['elapsed']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Latence des validations de panier pendant que tournent des lectures analytiques.
+
+Base SQLite fichier pré-remplie (--ledger écritures comptables, --orders
+commandes de la semaine). Des threads « analytiques » enchaînent /cash et
+/stats (handlers réels, sous l'identité de l'admin) pendant que le thread
+principal valide --checkouts paniers de --items articles (cb_cart_checkout).
+On compare, pour chaque profil SQLite (DB_PROFILE) :
+  - « primaire »   : lectures et écritures sur la même base ;
+  - « instantané » : lectures sur <base>_read.db, rafraîchie toutes les
+    --refresh secondes par refresh_read_snapshot() dans un thread à part.
+Chiffres : latence de validation (médiane, p95, p99, max) et nombre de
+lectures analytiques terminées pendant la mesure.
+
+Usage:
+  python benchmarks/bench_read_routing.py [--profiles tuned,legacy] [--readers 2]
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("DB_URL", "sqlite://")
+
+import jefflebot_fr as app
+
+ADMIN = app.ADMIN_CHAT_ID
+CUSTOMER = 1000
+
+
+class Stub:
+    def __init__(self, uid: int, text: str = ""):
+        self.text = text
+        self.from_user = SimpleNamespace(id=uid, first_name="Bench", last_name="", username="bench")
+        self.message = self
+
+    async def answer(self, *a, **kw):
+        pass
+
+    async def edit_text(self, *a, **kw):
+        pass
+
+
+def seed(path: str, ledger: int, orders: int, products: int):
+    app.configure_database(f"sqlite:///{path}")
+    app.migrate()
+    now = app.dt.datetime.utcnow()
+    with app.db() as s:
+        s.add(app.User(tg_id=CUSTOMER, first_name="Client"))
+        s.execute(app.insert(app.Product), [
+            {"name": f"Produit {i}", "sku": f"P{i}", "price": 100 + i, "stock_qty": 10 ** 9} for i in range(products)
+        ])
+        s.execute(app.insert(app.LedgerEntry), [
+            {"entry_type": app.LedgerType.INCOME.value if i % 3 else app.LedgerType.EXPENSE.value, "amount": 1000 + i % 97}
+            for i in range(ledger)
+        ])
+        s.execute(app.insert(app.Order), [
+            {"customer_name": "x", "total": 500 + i % 50, "created_at": now - app.dt.timedelta(minutes=i % 5000)}
+            for i in range(orders)
+        ])
+        s.commit()
+
+
+def fill_cart(items: int, products: int, k: int):
+    cart = app.ensure_open_cart(CUSTOMER)
+    with app.db() as s:
+        s.execute(app.insert(app.CartItem), [
+            {"cart_id": cart.id, "product_id": 1 + (k * items + j) % products, "qty": 1} for j in range(items)
+        ])
+        s.commit()
+
+
+def analytics(stop: threading.Event, done: list):
+    async def loop():
+        app._actor.set(ADMIN)
+        while not stop.is_set():
+            await app.cmd_cash(Stub(ADMIN, "/cash"))
+            await app.cmd_stats(Stub(ADMIN, "/stats"))
+            done.append(1)
+    asyncio.run(loop())
+
+
+def refresher(stop: threading.Event, every: float):
+    while not stop.wait(every):
+        app.refresh_read_snapshot()
+
+
+def run(profile: str, snapshot: bool, args) -> dict:
+    os.environ["DB_PROFILE"] = profile
+    app.READ_SNAPSHOT_S = max(1, int(args.refresh)) if snapshot else 0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "shop.db")
+        seed(path, args.ledger, args.orders, args.products)
+        if snapshot:
+            app.refresh_read_snapshot()
+        stop, done = threading.Event(), []
+        threads = [threading.Thread(target=analytics, args=(stop, done)) for _ in range(args.readers)]
+        if snapshot:
+            threads.append(threading.Thread(target=refresher, args=(stop, args.refresh)))
+        for t in threads:
+            t.start()
+        time.sleep(0.5)
+        latencies, errors = [], 0
+        app._actor.set(CUSTOMER)
+        call = Stub(CUSTOMER)
+        for k in range(args.checkouts):
+            fill_cart(args.items, args.products, k)
+            t0 = time.perf_counter()
+            try:
+                asyncio.run(app.cb_cart_checkout(call, None))
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - t0) * 1000)
+        stop.set()
+        for t in threads:
+            t.join()
+        app.configure_database("sqlite://")
+    latencies.sort()
+    q = statistics.quantiles(latencies, n=100)
+    return {"p50": q[49], "p95": q[94], "p99": q[98], "max": latencies[-1], "reads": len(done), "errors": errors}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", default="tuned,legacy")
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--checkouts", type=int, default=300)
+    parser.add_argument("--items", type=int, default=5)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--ledger", type=int, default=300_000)
+    parser.add_argument("--orders", type=int, default=20_000)
+    parser.add_argument("--refresh", type=float, default=2.0, help="période de l'instantané (s)")
+    args = parser.parse_args()
+
+    print(f"{'profil':>7} {'lectures':>11} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} "
+          f"{'max (ms)':>9} {'analytiques':>12} {'échecs':>7}")
+    for profile in args.profiles.split(","):
+        for snapshot in (False, True):
+            r = run(profile, snapshot, args)
+            print(f"{profile:>7} {'instantané' if snapshot else 'primaire':>11} {r['p50']:>9.1f} {r['p95']:>9.1f} "
+                  f"{r['p99']:>9.1f} {r['max']:>9.1f} {r['reads']:>12} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
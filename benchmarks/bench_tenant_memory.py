@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Mémoire par boutique : un processus par boutique vs runtime multi-boutiques.
+
+Chaque mesure tourne dans un processus Python neuf (RSS lu dans
+/proc/self/status). Pour chaque boutique : base SQLite dédiée, migrate(),
+--products produits, index de recherche construit et une recherche, comme
+après quelques minutes de trafic. On compare :
+  - « séparés » : N fois le RSS d'un processus mono-boutique ;
+  - « partagé »  : RSS d'un seul processus servant N boutiques, avec toutes
+    les boutiques chaudes puis avec TENANT_WARM_MAX réduit.
+
+Usage:
+  python benchmarks/bench_tenant_memory.py [--tenants 1,10,50] [--warm 8]
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+PROBE = r"""
+import json, os, sys
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+import jefflebot_fr as app
+n, warm, products, tmp = int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3]), sys.argv[4]
+base = rss_mb()
+tenants = [
+    app.Tenant(f"t{i}", app.AppConfig(bot_token=f"{1000 + i}:X", admin_chat_id=1, db_url=f"sqlite:///{tmp}/t{i}.db"))
+    for i in range(n)
+]
+registry = app.TenantRegistry(tenants, warm_max=warm)
+for t in registry:
+    with app.using_tenant(t):
+        t.migrate()
+        with app.db() as s:
+            s.add_all(app.Product(name=f"Produit {k} {t.key}", sku=f"{t.key}-{k}", price=100 + k) for k in range(products))
+            s.commit()
+        app.search_index().search("produit")
+print(json.dumps({"base": base, "rss": rss_mb()}))
+"""
+
+
+def probe(n: int, warm: int, products: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, PYTHONPATH=ROOT, DB_URL="sqlite://")
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE, str(n), str(warm), str(products), tmp],
+            env=env, capture_output=True, text=True, check=True,
+        )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tenants", default="1,10,50")
+    parser.add_argument("--warm", type=int, default=8, help="TENANT_WARM_MAX pour la variante bornée")
+    parser.add_argument("--products", type=int, default=500)
+    args = parser.parse_args()
+
+    single = probe(1, 1, args.products)["rss"]
+    print(f"processus mono-boutique : {single:.1f} Mo\n")
+    print(f"{'boutiques':>9} {'séparés (Mo)':>13} {'partagé (Mo)':>13} {'Mo/boutique':>12} "
+          f"{'borné (Mo)':>11} {'Mo/boutique':>12}")
+    for n in map(int, args.tenants.split(",")):
+        hot = probe(n, n, args.products)
+        bounded = probe(n, min(args.warm, n), args.products)
+        print(f"{n:>9} {single * n:>13.1f} {hot['rss']:>13.1f} {(hot['rss'] - hot['base']) / n:>12.2f} "
+              f"{bounded['rss']:>11.1f} {(bounded['rss'] - bounded['base']) / n:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
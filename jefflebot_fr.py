@@ -18,21 +18,46 @@ Dépendances:
 - aiogram>=3.6
 - SQLAlchemy>=2.0
 - python-dotenv (optionnel)
+- numpy (prévisions de réassort, importé à la demande)
+- pyarrow (export Parquet, importé à la demande)
 
 Exécution locale:
   pip install aiogram SQLAlchemy python-dotenv
+  python jefflebot_fr.py migrate   # création / mise à jour du schéma
+  python jefflebot_fr.py export    # export Parquet incrémental (--full : tout)
+  python jefflebot_fr.py rollups   # recalcul des cumuls paie / présence
   python jefflebot_fr.py
+  TENANTS_FILE=tenants.json python jefflebot_fr.py   # plusieurs boutiques, un processus
 """
 from __future__ import annotations
+import time
+
+_IMPORT_T0 = time.perf_counter()
+
 import asyncio
-import csv
+import base64
 import datetime as dt
+import html
+import json
+import logging
 import os
+import re
+import sys
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from decimal import Decimal
 from enum import Enum
-from typing import Optional, List, Dict
+from functools import lru_cache, partial
+from inspect import signature
+from typing import Optional, List, Dict, Tuple, Callable
 
-from aiogram import Bot, Dispatcher, F, Router
+from aiogram import BaseMiddleware, Bot, Dispatcher, F, Router
 from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
 from aiogram.filters import CommandStart, Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
@@ -44,15 +69,24 @@ from aiogram.types import (
     ReplyKeyboardMarkup as RKM,
     KeyboardButton as KB,
     ReplyKeyboardRemove,
-    InputFile,
+    FSInputFile,
+    BufferedInputFile,
+    InlineQuery,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
 )
 from aiogram.client.default import DefaultBotProperties  # ✅ pour aiogram >= 3.7
 
 from sqlalchemy import (
-    create_engine, Column, Integer, String, Text, DateTime, ForeignKey,
-    Boolean, Numeric
+    create_engine, Column, Integer, String, Text, Date, DateTime, ForeignKey,
+    Boolean, Numeric, select, func, and_, or_, literal, event, inspect,
+    MetaData, Table, Index, delete, update, insert, exists, case, text
 )
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker, Session
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.sql import Select
 
 # ---------------------------------------------------------------------------
 # Configuration (intégrée comme demandé)
@@ -61,13 +95,166 @@ BOT_TOKEN = "8236506331:AAGqGfGObPuseFANFHcMLytwXi8kgOWLsT4"
 ADMIN_CHAT_ID = 7542162173
 DB_URL = os.getenv("DB_URL", "sqlite:///jefflebot.db")
 
+log = logging.getLogger("jefflebot")
+
+# ---------------------------------------------------------------------------
+# Moteur & pool de connexions (réglages choisis par variables d'environnement)
+# ---------------------------------------------------------------------------
+# DB_PROFILE=tuned (défaut) active WAL & co pour SQLite ; DB_PROFILE=legacy
+# reproduit le moteur d'origine (réglages par défaut de SQLite).
+SQLITE_PROFILES: Dict[str, Dict[str, object]] = {
+    "legacy": {},
+    "tuned": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+    },
+    "safe": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+    },
+    # copie de lecture (instantané) : aucune écriture possible
+    "snapshot": {
+        "query_only": 1,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+    },
+}
+
+def env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+def env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on", "oui"}
+
+def sqlite_pragmas(profile: Optional[str] = None) -> Dict[str, object]:
+    name = profile or os.getenv("DB_PROFILE", "tuned")
+    if name not in SQLITE_PROFILES:
+        raise ValueError(f"DB_PROFILE inconnu: {name} (choix: {', '.join(SQLITE_PROFILES)})")
+    pragmas = dict(SQLITE_PROFILES[name])
+    if profile is None:
+        overrides = {
+            "journal_mode": os.getenv("SQLITE_JOURNAL_MODE"),
+            "synchronous": os.getenv("SQLITE_SYNCHRONOUS"),
+            "busy_timeout": os.getenv("SQLITE_BUSY_TIMEOUT_MS"),
+            "mmap_size": os.getenv("SQLITE_MMAP_SIZE"),
+            "cache_size": os.getenv("SQLITE_CACHE_SIZE"),
+        }
+        pragmas.update({k: v for k, v in overrides.items() if v})
+    return pragmas
+
+def make_engine(url: str, profile: Optional[str] = None,
+                pool_size: Optional[int] = None, max_overflow: Optional[int] = None) -> Engine:
+    """Crée le moteur SQLAlchemy adapté au SGBD de ``url``.
+
+    SQLite : PRAGMA du profil appliqués à chaque nouvelle connexion (WAL,
+    synchronous, busy_timeout, mmap…). Autres SGBD : pool dimensionné par
+    DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_TIMEOUT / DB_POOL_RECYCLE /
+    DB_POOL_PRE_PING. ``pool_size`` / ``max_overflow`` priment sur
+    l'environnement (pools réduits des boutiques en mode multi-boutiques).
+    """
+    if make_url(url).get_backend_name() != "sqlite":
+        return create_engine(
+            url,
+            echo=False,
+            future=True,
+            pool_size=env_int("DB_POOL_SIZE", 5) if pool_size is None else pool_size,
+            max_overflow=env_int("DB_MAX_OVERFLOW", 10) if max_overflow is None else max_overflow,
+            pool_timeout=env_int("DB_POOL_TIMEOUT", 30),
+            pool_recycle=env_int("DB_POOL_RECYCLE", 1800),
+            pool_pre_ping=env_bool("DB_POOL_PRE_PING", True),
+        )
+    pragmas = sqlite_pragmas(profile)
+    in_memory = make_url(url).database in (None, "", ":memory:")
+    pool_kwargs: Dict[str, object] = {}
+    if pool_size is not None and not in_memory:
+        pool_kwargs = {"pool_size": pool_size, "max_overflow": max_overflow or 0}
+    if not pragmas:
+        return create_engine(url, echo=False, future=True, **pool_kwargs)
+    kwargs: Dict[str, object] = {"connect_args": {"check_same_thread": False}, **pool_kwargs}
+    if in_memory:
+        # Base en mémoire : une seule connexion partagée, sinon chaque session
+        # verrait une base vide.
+        kwargs["poolclass"] = StaticPool
+    eng = create_engine(url, echo=False, future=True, **kwargs)
+
+    @event.listens_for(eng, "connect")
+    def _apply_pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        for key, value in pragmas.items():
+            cur.execute(f"PRAGMA {key}={value}")
+        cur.close()
+
+    return eng
+
 # ---------------------------------------------------------------------------
 # Base de données (SQLAlchemy)
 # ---------------------------------------------------------------------------
-engine = create_engine(DB_URL, echo=False, future=True)
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+# Le moteur est créé au premier accès (get_engine) : importer le module ne
+# touche pas la base. Le schéma est créé par migrate(), étape explicite.
+_engine: Optional[Engine] = None
+_engine_url = DB_URL
+_archive_engine: Optional[Engine] = None
+# expire_on_commit=False : les handlers relisent les objets après fermeture de session
+SessionLocal = sessionmaker(autoflush=False, autocommit=False, expire_on_commit=False)
 Base = declarative_base()
 
+def configure_database(url: str, read_url: Optional[str] = None):
+    global _engine, _engine_url, _archive_engine, _reads
+    for eng in (_engine, _archive_engine):
+        if eng is not None:
+            eng.dispose()
+    _engine, _engine_url, _archive_engine = None, url, None
+    _reads.release()
+    _reads = ReadRoutes(read_url)
+
+# Mode multi-boutiques : la boutique de l'update en cours (posée par
+# TenantMiddleware ou using_tenant) fournit moteur, admin et caches. En mode
+# mono-boutique, l'application de create_app (AppMiddleware, App.context)
+# joue ce rôle ; sans l'une ni l'autre (CLI, tests), ce sont les globales
+# ci-dessus.
+_tenant: ContextVar[Optional["Tenant"]] = ContextVar("tenant", default=None)
+_app: ContextVar[Optional["App"]] = ContextVar("app", default=None)
+
+def current_shop():
+    """Tenant ou App de l'update en cours ; None : globales du module."""
+    tenant = _tenant.get()
+    return tenant if tenant is not None else _app.get()
+
+def get_engine() -> Engine:
+    global _engine
+    shop = current_shop()
+    if shop is not None:
+        return shop.get_engine()
+    if _engine is None:
+        _engine = make_engine(_engine_url)
+    return _engine
+
+def current_db_url() -> str:
+    shop = current_shop()
+    return shop.config.db_url if shop is not None else _engine_url
+
+def tenant_path(directory: str) -> str:
+    """Sous-dossier propre à la boutique courante (sauvegardes, exports)."""
+    tenant = _tenant.get()
+    return os.path.join(directory, tenant.key) if tenant is not None else directory
+
+_shop_locks: Dict[str, object] = {}
+
+def shop_lock(name: str, factory: Callable = threading.Lock):
+    """Verrou nommé propre à la boutique courante (créé au premier appel)."""
+    shop = current_shop()
+    locks = shop.locks if shop is not None else _shop_locks
+    lock = locks.get(name)
+    return lock if lock is not None else locks.setdefault(name, factory())
+
 class UserRole(str, Enum):
     CUSTOMER = "customer"
     WORKER = "worker"
@@ -89,6 +276,13 @@ class ShiftStatus(str, Enum):
     PRESENT = "PRESENT"
     ABSENT = "ABSENT"
 
+class JobStatus(str, Enum):
+    RECEIVED = "recu"
+    SHORTLISTED = "preselection"
+    INTERVIEW = "entretien"
+    HIRED = "retenu"
+    REJECTED = "refuse"
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True)
@@ -96,7 +290,7 @@ class User(Base):
     first_name = Column(String(128))
     last_name = Column(String(128))
     username = Column(String(128))
-    role = Column(String(32), default=UserRole.CUSTOMER.value)
+    role = Column(String(32), default=UserRole.CUSTOMER.value, index=True)
     created_at = Column(DateTime, default=dt.datetime.utcnow)
 
 class Product(Base):
@@ -117,7 +311,7 @@ class StockMovement(Base):
     reason = Column(String(255))
     ref_type = Column(String(64), nullable=True)
     ref_id = Column(Integer, nullable=True)
-    created_at = Column(DateTime, default=dt.datetime.utcnow)
+    created_at = Column(DateTime, default=dt.datetime.utcnow, index=True)
     product = relationship("Product")
 
 class Cart(Base):
@@ -151,8 +345,8 @@ class Order(Base):
 class OrderItem(Base):
     __tablename__ = "order_items"
     id = Column(Integer, primary_key=True)
-    order_id = Column(Integer, ForeignKey("orders.id"))
-    product_id = Column(Integer, ForeignKey("products.id"))
+    order_id = Column(Integer, ForeignKey("orders.id"), index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), index=True)
     qty = Column(Integer, default=1)
     unit_price = Column(Numeric(12,2), default=0)
     product = relationship("Product")
@@ -188,13 +382,15 @@ class Shift(Base):
 
 class JobApplication(Base):
     __tablename__ = "job_applications"
+    __table_args__ = (Index("ix_job_applications_status_created", "status", "created_at"),)
     id = Column(Integer, primary_key=True)
+    applicant_tg_id = Column(Integer, nullable=True)
     applicant_name = Column(String(255))
     contact = Column(String(255))
     position = Column(String(255))
     resume = Column(Text)
-    status = Column(String(64), default="recu")
-    created_at = Column(DateTime, default=dt.datetime.utcnow)
+    status = Column(String(64), default=JobStatus.RECEIVED.value)
+    created_at = Column(DateTime, default=dt.datetime.utcnow, index=True)
 
 class Post(Base):
     __tablename__ = "posts"
@@ -202,23 +398,233 @@ class Post(Base):
     text = Column(Text)
     created_at = Column(DateTime, default=dt.datetime.utcnow)
 
-Base.metadata.create_all(engine)
+class AppMeta(Base):
+    """Petites valeurs d'état persistantes (filigranes des traitements incrémentaux)."""
+    __tablename__ = "app_meta"
+    key = Column(String(64), primary_key=True)
+    value = Column(String(255))
+
+class SalesHourly(Base):
+    __tablename__ = "sales_hourly"
+    hour = Column(DateTime, primary_key=True)
+    orders = Column(Integer, default=0)
+    revenue = Column(Numeric(14,2), default=0)
+
+class OutboxMessage(Base):
+    """Notification à envoyer, écrite dans la transaction de l'événement métier."""
+    __tablename__ = "outbox"
+    __table_args__ = (Index("ix_outbox_pending", "sent_at", "dead_at", "next_attempt_at"),)
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(Integer)
+    kind = Column(String(32), default="message")
+    text = Column(Text)
+    amount = Column(Numeric(12,2), nullable=True)
+    created_at = Column(DateTime, default=dt.datetime.utcnow)
+    next_attempt_at = Column(DateTime, default=dt.datetime.utcnow)
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+    dead_at = Column(DateTime, nullable=True)
+
+class ProductSalesDaily(Base):
+    __tablename__ = "product_sales_daily"
+    day = Column(Date, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    qty = Column(Integer, default=0)
+    revenue = Column(Numeric(14,2), default=0)
+
+class SalesRollupDirty(Base):
+    """Jour dont des commandes déjà agrégées ont changé, à recalculer."""
+    __tablename__ = "sales_rollup_dirty"
+    day = Column(Date, primary_key=True)
+
+class WorkerDaily(Base):
+    """Cumul par travailleur et par jour, tenu à jour par record_payroll /
+    record_shift dans la transaction de l'écriture."""
+    __tablename__ = "worker_daily"
+    __table_args__ = (Index("ix_worker_daily_day", "day"),)
+    worker_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    paid = Column(Numeric(14,2), default=0)
+    payments = Column(Integer, default=0)
+    present = Column(Integer, default=0)
+    absent = Column(Integer, default=0)
+
+def _add_missing_columns(conn, schema: Optional[str] = None):
+    """ALTER TABLE … ADD COLUMN pour les colonnes ajoutées au modèle depuis
+    la création de la table (nullable, sans valeur par défaut côté base)."""
+    insp = inspect(conn)
+    quote = conn.dialect.identifier_preparer.quote
+    for table in Base.metadata.sorted_tables:
+        existing = {c["name"] for c in insp.get_columns(table.name, schema=schema)}
+        name = f"{quote(schema)}.{quote(table.name)}" if schema else quote(table.name)
+        for col in table.columns:
+            if col.name not in existing:
+                conn.execute(text(f"ALTER TABLE {name} ADD COLUMN {quote(col.name)} {col.type.compile(conn.dialect)}"))
+
+def migrate(eng: Optional[Engine] = None):
+    """Crée les tables manquantes, les colonnes puis les index ajoutés depuis
+    (create_all ne touche pas aux tables existantes)."""
+    eng = eng or get_engine()
+    schema = (eng.get_execution_options().get("schema_translate_map") or {}).get(None)
+    had_worker_daily = inspect(eng).has_table(WorkerDaily.__tablename__, schema=schema)
+    Base.metadata.create_all(eng)
+    with eng.begin() as conn:
+        _add_missing_columns(conn, schema)
+        for table in Base.metadata.sorted_tables:
+            for idx in table.indexes:
+                idx.create(conn, checkfirst=True)
+    if not had_worker_daily:
+        # Cumuls créés sur une base existante : recalculés depuis l'historique.
+        with SessionLocal(bind=eng) as s:
+            rebuild_worker_daily(s)
+            s.commit()
 
 def db() -> Session:
-    return SessionLocal()
+    return SessionLocal(bind=get_engine())
+
+# --- Lectures analytiques : réplique ou instantané ---
+# Les lectures lourdes (stats, trésorerie, inventaire, exports, audiences de
+# diffusion) passent par db_read() : réplique DB_READ_URL si définie, sinon,
+# pour une base SQLite fichier avec READ_SNAPSHOT_S > 0, la copie
+# <base>_read.db rafraîchie par l'API de sauvegarde. Écritures et parcours
+# qui relisent ce qu'ils viennent d'écrire restent sur db(). Un utilisateur
+# qui vient de valider une écriture relit le primaire tant que la copie est
+# antérieure à cette écriture ; sans copie prête, tout va au primaire.
+DB_READ_URL = os.getenv("DB_READ_URL", "")
+READ_SNAPSHOT_S = env_int("READ_SNAPSHOT_S", 0)
+READ_REPLICA_LAG_S = env_int("READ_REPLICA_LAG_S", 5)
+
+# Utilisateur de l'update en cours (ActorMiddleware), pour la lecture de ses écritures.
+_actor: ContextVar[Optional[int]] = ContextVar("actor", default=None)
+
+class ReadRoutes:
+    """Moteur de lecture d'une boutique, fraîcheur de sa copie et dernière
+    écriture de chaque utilisateur (ordre d'insertion = ordre chronologique).
+    ``schema`` : boutique en mode schéma, la réplique est lue dans ce schéma."""
+
+    def __init__(self, url: Optional[str] = None, schema: Optional[str] = None):
+        self.url = url or None
+        self.schema = schema
+        self.engine: Optional[Engine] = None
+        self.snapshot_at: Optional[float] = None
+        self.last_write: Dict[Optional[int], float] = {}
+        self._lock = threading.Lock()  # commits validés depuis plusieurs threads (to_thread)
+
+    def fresh_as_of(self) -> Optional[float]:
+        """Instant (time.time) avant lequel toute écriture validée est visible en lecture."""
+        if self.url:
+            return time.time() - READ_REPLICA_LAG_S
+        return self.snapshot_at
+
+    def note_write(self, user_id: Optional[int]):
+        with self._lock:
+            writes = self.last_write
+            writes.pop(user_id, None)
+            writes[user_id] = time.time()
+            horizon = self.fresh_as_of()
+            # Appelé après chaque commit : ne doit jamais lever (dict vidé si
+            # l'horizon dépasse l'écriture courante, ex. READ_REPLICA_LAG_S=0).
+            while writes and horizon is not None:
+                oldest = next(iter(writes))
+                if writes[oldest] >= horizon:
+                    break
+                del writes[oldest]
+
+    def engine_for(self, user_id: Optional[int]) -> Optional[Engine]:
+        horizon = self.fresh_as_of()
+        if horizon is None or self.last_write.get(user_id, 0.0) >= horizon:
+            return None
+        if self.engine is None:
+            if self.url:
+                engine = make_engine(self.url)
+                if self.schema:
+                    engine = engine.execution_options(schema_translate_map={None: self.schema})
+                self.engine = engine
+            else:
+                self.engine = make_engine(f"sqlite:///{read_snapshot_path()}", profile="snapshot")
+        return self.engine
+
+    def release(self):
+        if self.engine is not None:
+            self.engine.dispose()
+            self.engine = None
+
+_reads = ReadRoutes(DB_READ_URL)
+
+def read_routes() -> ReadRoutes:
+    shop = current_shop()
+    return shop.reads if shop is not None else _reads
+
+def read_snapshot_path() -> Optional[str]:
+    """Fichier de l'instantané de lecture, si la boutique en utilise un."""
+    if READ_SNAPSHOT_S <= 0 or read_routes().url:
+        return None
+    url = make_url(current_db_url())
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return None
+    root, ext = os.path.splitext(url.database)
+    return f"{root}_read{ext or '.db'}"
+
+@event.listens_for(Session, "after_commit")
+def _note_commit(session):
+    # Après le COMMIT du SGBD : une copie commencée ensuite contient l'écriture.
+    # Sans actor (tâches de fond), l'entrée None ne concerne que les lectures
+    # faites hors update. Les sessions de db_read() sur la copie ne comptent pas.
+    routes = read_routes()
+    if routes.engine is None or session.bind is not routes.engine:
+        routes.note_write(_actor.get())
+
+def db_read() -> Session:
+    """Session de lecture seule : copie de lecture si assez fraîche pour
+    l'utilisateur courant, sinon le primaire. Ne jamais y écrire."""
+    return SessionLocal(bind=read_routes().engine_for(_actor.get()) or get_engine())
+
+def meta_get(s: Session, key: str, default: Optional[str] = None) -> Optional[str]:
+    row = s.get(AppMeta, key)
+    return row.value if row else default
+
+def meta_set(s: Session, key: str, value) -> None:
+    row = s.get(AppMeta, key)
+    if row is None:
+        s.add(AppMeta(key=key, value=str(value)))
+    else:
+        row.value = str(value)
+
+def meta_swap(s: Session, key: str, old: Optional[str], new) -> bool:
+    """meta_set conditionnel : n'écrit que si la valeur vaut toujours ``old``
+    (None : clé absente). False si un autre processus l'a changée entre-temps."""
+    if old is None:
+        try:
+            s.execute(insert(AppMeta).values(key=key, value=str(new)))
+        except IntegrityError:
+            return False
+        return True
+    res = s.execute(update(AppMeta).where(AppMeta.key == key, AppMeta.value == old).values(value=str(new)))
+    return res.rowcount == 1
+
+def enqueue_notification(s: Session, chat_id: int, text: str, kind: str = "message", amount=None) -> OutboxMessage:
+    """Ajoute un message à l'outbox ; il part seulement si ``s`` est validée."""
+    msg = OutboxMessage(chat_id=chat_id, kind=kind, text=text, amount=amount)
+    s.add(msg)
+    return msg
+
+def new_user(tg_user) -> User:
+    """Utilisateur à créer d'après le profil Telegram (message ou callback)."""
+    return User(
+        tg_id=tg_user.id,
+        first_name=tg_user.first_name or "",
+        last_name=tg_user.last_name or "",
+        username=tg_user.username or "",
+        role=UserRole.ADMIN.value if tg_user.id == admin_chat_id() else UserRole.CUSTOMER.value,
+    )
 
 async def get_or_create_user(message: Message) -> User:
     with db() as s:
         u = s.query(User).filter_by(tg_id=message.from_user.id).one_or_none()
         if u:
             return u
-        u = User(
-            tg_id=message.from_user.id,
-            first_name=message.from_user.first_name or "",
-            last_name=message.from_user.last_name or "",
-            username=message.from_user.username or "",
-            role=UserRole.ADMIN.value if message.from_user.id == ADMIN_CHAT_ID else UserRole.CUSTOMER.value,
-        )
+        u = new_user(message.from_user)
         s.add(u)
         s.commit()
         return u
@@ -232,6 +638,81 @@ def main_menu(is_admin: bool) -> RKM:
         buttons.append([KB(text="🛠️ Admin")])
     return RKM(keyboard=buttons, resize_keyboard=True)
 
+# ---------------------------------------------------------------------------
+# Données de callback compactes & table de dispatch
+# ---------------------------------------------------------------------------
+# Format : « action~charge » où la charge est une suite d'entiers non signés
+# encodés en varint puis en base64url (sans remplissage). Un seul handler
+# aiogram reçoit tous les callbacks et route par dictionnaire sur l'action.
+CB_SEP = "~"
+CALLBACK_DATA_MAX = 64
+CALLBACK_ACTIONS: Dict[str, Tuple[Callable, bool]] = {}
+# Anciens boutons (« add:12 », « cart:open »…) encore présents dans les chats.
+LEGACY_CALLBACKS = {
+    "add": "a", "page": "pg", "cartinc": "ci", "cartdec": "cd", "cartdel": "cx",
+    "cart:open": "co", "cart:back": "cb", "cart:checkout": "ck", "noop": "_",
+}
+
+def pack_cb(action: str, *values: int) -> str:
+    if not values:
+        return action
+    buf = bytearray()
+    for v in values:
+        if v < 0:
+            raise ValueError("callback: entiers positifs uniquement")
+        while v >= 0x80:
+            buf.append((v & 0x7F) | 0x80)
+            v >>= 7
+        buf.append(v)
+    data = action + CB_SEP + base64.urlsafe_b64encode(bytes(buf)).rstrip(b"=").decode("ascii")
+    if len(data.encode()) > CALLBACK_DATA_MAX:
+        raise ValueError(f"callback_data trop long ({len(data)} octets): {action}")
+    return data
+
+def unpack_cb(data: str) -> Tuple[str, Tuple[int, ...]]:
+    action, sep, payload = data.partition(CB_SEP)
+    if not sep:
+        return _unpack_legacy(data)
+    raw = base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))
+    values, v, shift = [], 0, 0
+    for byte in raw:
+        v |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(v)
+            v, shift = 0, 0
+    return action, tuple(values)
+
+def _unpack_legacy(data: str) -> Tuple[str, Tuple[int, ...]]:
+    if data in LEGACY_CALLBACKS:
+        return LEGACY_CALLBACKS[data], ()
+    head, _, rest = data.partition(":")
+    if head == "admin":
+        return "adm." + rest, ()
+    if head in LEGACY_CALLBACKS and rest.isdigit():
+        return LEGACY_CALLBACKS[head], (int(rest),)
+    return data, ()
+
+CB_EXPIRED = "Ce bouton a expiré, rouvrez le menu."
+
+@lru_cache(maxsize=None)
+def callback_arity(handler: Callable) -> Tuple[int, int]:
+    """Nombre d'entiers accepté par ``handler(call, state, *entiers)`` : (min, max)."""
+    params = list(signature(handler).parameters.values())[2:]
+    if any(p.kind is p.VAR_POSITIONAL for p in params):
+        return 0, sys.maxsize
+    return sum(p.default is p.empty for p in params), len(params)
+
+def callback_action(action: str, admin: bool = False):
+    """Enregistre ``handler(call, state, *entiers)`` pour une action de callback."""
+    def deco(fn):
+        if action in CALLBACK_ACTIONS:
+            raise ValueError(f"action de callback déjà enregistrée: {action}")
+        CALLBACK_ACTIONS[action] = (fn, admin)
+        return fn
+    return deco
+
 PAGE_SIZE = 6
 
 def paginated_products_keyboard(page: int = 0) -> IKM:
@@ -241,40 +722,404 @@ def paginated_products_keyboard(page: int = 0) -> IKM:
         items = q.offset(page * PAGE_SIZE).limit(PAGE_SIZE).all()
     kb = []
     for p in items:
-        kb.append([IKB(text=f"➕ {p.name} ({p.price} CFA)", callback_data=f"add:{p.id}")])
+        kb.append([IKB(text=f"➕ {p.name} ({p.price} CFA)", callback_data=pack_cb("a", p.id))])
     nav = []
     if page > 0:
-        nav.append(IKB(text="⬅️", callback_data=f"page:{page-1}"))
+        nav.append(IKB(text="⬅️", callback_data=pack_cb("pg", page - 1)))
     if (page + 1) * PAGE_SIZE < total:
-        nav.append(IKB(text="➡️", callback_data=f"page:{page+1}"))
+        nav.append(IKB(text="➡️", callback_data=pack_cb("pg", page + 1)))
     if nav:
         kb.append(nav)
-    kb.append([IKB(text="🧺 Voir le panier", callback_data="cart:open")])
+    kb.append([IKB(text="🧺 Voir le panier", callback_data="co")])
     return IKM(inline_keyboard=kb)
 
+# ---------------------------------------------------------------------------
+# Recherche produits (index de préfixes en mémoire)
+# ---------------------------------------------------------------------------
+SEARCH_LIMIT = 10
+
+def normalize_text(text: str) -> str:
+    """Minuscules sans accents : « Crème Brûlée » -> « creme brulee »."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return re.findall(r"\w+", normalize_text(text or ""))
+
+class PrefixIndex:
+    """Index inversé jeton -> ids, interrogé par préfixe via une liste triée (bisect)."""
+
+    def __init__(self):
+        self._postings: Dict[str, set] = {}
+        self._tokens: List[str] = []
+        self._doc_tokens: Dict[int, set] = {}
+
+    def __len__(self) -> int:
+        return len(self._doc_tokens)
+
+    def add(self, doc_id: int, text: str):
+        self.remove(doc_id)
+        tokens = set(tokenize(text))
+        self._doc_tokens[doc_id] = tokens
+        for t in tokens:
+            ids = self._postings.get(t)
+            if ids is None:
+                ids = self._postings[t] = set()
+                insort(self._tokens, t)
+            ids.add(doc_id)
+
+    def remove(self, doc_id: int):
+        for t in self._doc_tokens.pop(doc_id, ()):
+            ids = self._postings[t]
+            ids.discard(doc_id)
+            if not ids:
+                del self._postings[t]
+                del self._tokens[bisect_left(self._tokens, t)]
+
+    def _prefix_ids(self, prefix: str) -> set:
+        out: set = set()
+        i = bisect_left(self._tokens, prefix)
+        while i < len(self._tokens) and self._tokens[i].startswith(prefix):
+            out |= self._postings[self._tokens[i]]
+            i += 1
+        return out
+
+    def search(self, query: str) -> set:
+        """Ids dont chaque mot de la requête préfixe au moins un jeton."""
+        result: Optional[set] = None
+        # Les termes longs sont les plus sélectifs : on les intersecte d'abord.
+        for term in sorted(set(tokenize(query)), key=len, reverse=True):
+            ids = self._prefix_ids(term)
+            result = ids if result is None else result & ids
+            if not result:
+                return set()
+        return result or set()
+
+class ProductSearch:
+    """Index des produits (nom + SKU), construit au premier usage puis tenu à jour
+    par les événements ORM, sans requête SQL par recherche."""
+
+    def __init__(self):
+        self.index: Optional[PrefixIndex] = None
+        self.entries: Dict[int, Tuple[str, object, bool]] = {}
+
+    def _put(self, pid: int, name: str, sku: str, price, active: bool):
+        self.index.add(pid, f"{name or ''} {sku or ''}")
+        self.entries[pid] = (name or "", price, bool(active))
+
+    def ensure_built(self):
+        if self.index is not None:
+            return
+        self.index = PrefixIndex()
+        with db() as s:
+            rows = s.execute(select(Product.id, Product.name, Product.sku, Product.price, Product.is_active))
+            for r in rows:
+                self._put(r.id, r.name, r.sku, r.price, r.is_active)
+
+    def apply(self, changes: Dict[int, Optional[tuple]]):
+        if self.index is None:
+            return
+        for pid, values in changes.items():
+            if values is None:
+                self.index.remove(pid)
+                self.entries.pop(pid, None)
+            else:
+                self._put(pid, *values)
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT) -> List[Tuple[int, str, object]]:
+        self.ensure_built()
+        hits = []
+        for pid in self.index.search(query):
+            name, price, active = self.entries[pid]
+            if active:
+                hits.append((pid, name, price))
+        hits.sort(key=lambda h: normalize_text(h[1]))
+        return hits[:limit]
+
+product_search = ProductSearch()
+
+def search_index() -> ProductSearch:
+    shop = current_shop()
+    return shop.search if shop is not None else product_search
+_SEARCH_FIELDS = ("name", "sku", "price", "is_active")
+
+def _queue_search_change(target: Product, deleted: bool = False):
+    session = inspect(target).session
+    if session is None:
+        return
+    pending = session.info.setdefault("search_changes", {})
+    pending[target.id] = None if deleted else (target.name, target.sku, target.price, target.is_active)
+
+@event.listens_for(Product, "after_insert")
+def _product_inserted(mapper, connection, target):
+    _queue_search_change(target)
+
+@event.listens_for(Product, "after_update")
+def _product_updated(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[f].history.has_changes() for f in _SEARCH_FIELDS):
+        _queue_search_change(target)
+
+@event.listens_for(Product, "after_delete")
+def _product_deleted(mapper, connection, target):
+    _queue_search_change(target, deleted=True)
+
+@event.listens_for(Session, "after_commit")
+def _apply_search_changes(session):
+    changes = session.info.pop("search_changes", None)
+    if changes:
+        search_index().apply(changes)
+
+@event.listens_for(Session, "after_rollback")
+def _drop_search_changes(session):
+    session.info.pop("search_changes", None)
+    session.info.pop("job_search_changes", None)
+
+class JobSearch:
+    """Index des candidatures : texte intégral (nom, contact, poste, CV) et poste
+    seul, pour les filtres de /jobs sans LIKE '%…%' sur toute la table."""
+
+    def __init__(self):
+        self.text: Optional[PrefixIndex] = None
+        self.position: Optional[PrefixIndex] = None
+
+    def _put(self, app_id: int, name: str, contact: str, position: str, resume: str):
+        self.text.add(app_id, " ".join(filter(None, (name, contact, position, resume))))
+        self.position.add(app_id, position or "")
+
+    def ensure_built(self):
+        if self.text is not None:
+            return
+        self.text, self.position = PrefixIndex(), PrefixIndex()
+        with db() as s:
+            rows = s.execute(select(
+                JobApplication.id, JobApplication.applicant_name, JobApplication.contact,
+                JobApplication.position, JobApplication.resume,
+            ))
+            for r in rows:
+                self._put(*r)
+
+    def apply(self, changes: Dict[int, Optional[tuple]]):
+        if self.text is None:
+            return
+        for app_id, values in changes.items():
+            if values is None:
+                self.text.remove(app_id)
+                self.position.remove(app_id)
+            else:
+                self._put(app_id, *values)
+
+    def match(self, query: Optional[str] = None, position: Optional[str] = None) -> set:
+        """Ids correspondant à ``query`` (tous champs) et à ``position`` (poste)."""
+        self.ensure_built()
+        ids: Optional[set] = None
+        for index, terms in ((self.text, query), (self.position, position)):
+            if terms:
+                hits = index.search(terms)
+                ids = hits if ids is None else ids & hits
+        return ids if ids is not None else set()
+
+job_search = JobSearch()
+
+def job_search_index() -> JobSearch:
+    shop = current_shop()
+    return shop.job_search if shop is not None else job_search
+
+@event.listens_for(JobApplication, "after_insert")
+def _job_inserted(mapper, connection, target):
+    session = inspect(target).session
+    if session is not None:
+        pending = session.info.setdefault("job_search_changes", {})
+        pending[target.id] = (target.applicant_name, target.contact, target.position, target.resume)
+
+@event.listens_for(Session, "after_commit")
+def _apply_job_search_changes(session):
+    changes = session.info.pop("job_search_changes", None)
+    if changes:
+        job_search_index().apply(changes)
+
 def cart_keyboard(cart_id: int) -> IKM:
     with db() as s:
-        items = s.query(CartItem).filter_by(cart_id=cart_id).all()
+        items = cart_lines(s, cart_id)
     kb = []
     for it in items:
         kb.append([
-            IKB(text=f"➖ {it.product.name}", callback_data=f"cartdec:{it.id}"),
-            IKB(text=f"{it.qty}", callback_data="noop"),
-            IKB(text=f"➕", callback_data=f"cartinc:{it.id}"),
-            IKB(text=f"🗑️", callback_data=f"cartdel:{it.id}"),
+            IKB(text=f"➖ {it.name}", callback_data=pack_cb("cd", it.id)),
+            IKB(text=f"{it.qty}", callback_data="_"),
+            IKB(text=f"➕", callback_data=pack_cb("ci", it.id)),
+            IKB(text=f"🗑️", callback_data=pack_cb("cx", it.id)),
         ])
-    kb.append([IKB(text="✅ Valider la commande", callback_data="cart:checkout")])
-    kb.append([IKB(text="🔙 Continuer achats", callback_data="cart:back")])
+    kb.append([IKB(text="✅ Valider la commande", callback_data="ck")])
+    kb.append([IKB(text="🔙 Continuer achats", callback_data="cb")])
     return IKM(inline_keyboard=kb)
 
 def admin_keyboard() -> IKM:
     return IKM(inline_keyboard=[
-        [IKB(text="📚 Produits", callback_data="admin:products"), IKB(text="📦 Stock", callback_data="admin:stock")],
-        [IKB(text="🧾 Comptabilité", callback_data="admin:ledger"), IKB(text="💰 Paie", callback_data="admin:payroll")],
-        [IKB(text="👷 Travailleurs", callback_data="admin:workers"), IKB(text="📰 Annonces", callback_data="admin:posts")],
-        [IKB(text="📊 Statistiques", callback_data="admin:stats"), IKB(text="📤 Export CSV", callback_data="admin:export")],
+        [IKB(text="📚 Produits", callback_data="adm.products"), IKB(text="📦 Stock", callback_data="adm.stock")],
+        [IKB(text="🧾 Comptabilité", callback_data="adm.ledger"), IKB(text="💰 Paie", callback_data="adm.payroll")],
+        [IKB(text="👷 Travailleurs", callback_data="adm.workers"), IKB(text="📰 Annonces", callback_data="adm.posts")],
+        [IKB(text="👔 Recrutement", callback_data="adm.jobs")],
+        [IKB(text="📊 Statistiques", callback_data="adm.stats"), IKB(text="📤 Export CSV", callback_data="adm.export")],
     ])
 
+def day_bounds(day: dt.date) -> Tuple[dt.datetime, dt.datetime]:
+    return dt.datetime.combine(day, dt.time.min), dt.datetime.combine(day, dt.time.max)
+
+# ---------------------------------------------------------------------------
+# Listes admin paginées (keyset)
+# ---------------------------------------------------------------------------
+LIST_PAGE_SIZE = 25
+MESSAGE_LIMIT = 4096
+LISTINGS: Dict[str, "Listing"] = {}
+
+class Listing:
+    """Liste admin paginée par clé (keyset), sans OFFSET ni chargement d'objets ORM.
+
+    ``query`` renvoie un SELECT des seules colonnes affichées, l'id unique en
+    premier ; ``order`` liste les colonnes de tri ``(colonne, desc)`` et se
+    termine par ce même id. Le curseur transporté dans les boutons est l'id
+    de la ligne en bord de page, ce qui tient dans les 64 octets de Telegram.
+    Les filtres éventuels (trop longs pour un bouton) sont gardés dans les
+    données FSM sous la clé ``ls.<key>`` et passés à ``query(**filtres)``.
+    ``read=True`` lit sur la copie de lecture (db_read).
+    """
+
+    def __init__(
+        self,
+        key: str,
+        title: str,
+        empty_text: str,
+        query: Callable[[], Select],
+        order: List[Tuple[object, bool]],
+        render: Callable[[object], str],
+        footer: Optional[Callable[[Session], str]] = None,
+        read: bool = False,
+    ):
+        self.key = key
+        self.title = title
+        self.empty_text = empty_text
+        self.query = query
+        self.order = order
+        self.render = render
+        self.footer = footer
+        self.session = db_read if read else db
+        LISTINGS[key] = self
+        CALLBACK_ACTIONS["ls." + key] = (self.on_callback, True)
+
+    def _after(self, values: tuple, forward: bool):
+        clauses = []
+        for i, (col, desc) in enumerate(self.order):
+            prefix = [c == v for (c, _), v in zip(self.order[:i], values[:i])]
+            bound = literal(values[i], col.type)
+            step = col > bound if desc != forward else col < bound
+            clauses.append(and_(*prefix, step))
+        return or_(*clauses)
+
+    def _fetch(self, s: Session, cursor: Optional[int], forward: bool, filters: Optional[dict]) -> Optional[list]:
+        q = self.query(**(filters or {}))
+        if cursor is not None:
+            id_col = self.order[-1][0]
+            anchor = s.execute(
+                q.with_only_columns(*[c for c, _ in self.order]).where(id_col == cursor)
+            ).first()
+            if anchor is None:
+                return None
+            q = q.where(self._after(tuple(anchor), forward))
+        q = q.order_by(*[c.desc() if desc == forward else c.asc() for c, desc in self.order])
+        return s.execute(q.limit(LIST_PAGE_SIZE + 1)).all()
+
+    def page(self, cursor: Optional[int] = None, forward: bool = True,
+             filters: Optional[dict] = None) -> Tuple[Optional[str], Optional[IKM]]:
+        with self.session() as s:
+            rows = self._fetch(s, cursor, forward, filters)
+            if rows is None or (not rows and not forward):
+                # Curseur disparu (ligne supprimée ou filtre changé) : on repart du début.
+                cursor, forward = None, True
+                rows = self._fetch(s, None, True, filters)
+            footer = self.footer(s) if self.footer and rows else None
+        if not rows:
+            return None, None
+        more = len(rows) > LIST_PAGE_SIZE
+        rows = rows[:LIST_PAGE_SIZE]
+        budget = MESSAGE_LIMIT - len(self.title) - len(footer or "") - 16
+        shown, lines = [], []
+        for row in rows:
+            line = self.render(row)
+            budget -= len(line) + 1
+            if budget < 0 and shown:
+                more = True
+                break
+            shown.append(row)
+            lines.append(line)
+        if not forward:
+            shown.reverse()
+            lines.reverse()
+        has_prev = more if not forward else cursor is not None
+        has_next = more if forward else True
+        nav = []
+        if has_prev:
+            nav.append(IKB(text="⬅️", callback_data=pack_cb("ls." + self.key, 0, shown[0][0])))
+        if has_next:
+            nav.append(IKB(text="➡️", callback_data=pack_cb("ls." + self.key, 1, shown[-1][0])))
+        text = "\n".join([self.title, *lines] + ([footer] if footer else []))
+        return text, IKM(inline_keyboard=[nav]) if nav else None
+
+    async def on_callback(self, call: CallbackQuery, state: FSMContext, forward: int = 1, cursor: Optional[int] = None):
+        filters = (await state.get_data()).get("ls." + self.key)
+        text, kb = self.page(cursor, bool(forward), filters)
+        if text is None:
+            await call.message.edit_text(self.empty_text)
+        else:
+            await call.message.edit_text(text, reply_markup=kb)
+        await call.answer()
+
+def _today_between(col):
+    start, end = day_bounds(dt.datetime.utcnow().date())
+    return col.between(start, end)
+
+Listing(
+    "prod", "📚 <b>Produits</b>:", "Aucun produit",
+    query=lambda: select(Product.id, Product.name, Product.sku, Product.price, Product.stock_qty, Product.is_active),
+    order=[(Product.is_active, True), (Product.name, False), (Product.id, False)],
+    render=lambda r: f"• {html.escape(r.name or '')} ({html.escape(r.sku or '')}) – {r.price} CFA – Stock: {r.stock_qty} – {'✅' if r.is_active else '🚫'}",
+)
+Listing(
+    "inv", "📦 <b>Inventaire</b>:", "Inventaire vide",
+    query=lambda: select(Product.id, Product.name, Product.sku, Product.stock_qty),
+    order=[(Product.name, False), (Product.id, False)],
+    render=lambda r: f"• {html.escape(r.name or '')} ({html.escape(r.sku or '')}) – Stock: {r.stock_qty}",
+    read=True,
+)
+Listing(
+    "pay", "💰 <b>Paies du jour</b>:", "Aucune paie aujourd'hui",
+    query=lambda: (
+        select(Payroll.id, User.tg_id, Payroll.amount, Payroll.method)
+        .outerjoin(User, Payroll.worker_id == User.id)
+        .where(_today_between(Payroll.date))
+    ),
+    order=[(Payroll.id, False)],
+    render=lambda r: f"• {r.tg_id} – {r.amount} via {r.method}",
+    footer=lambda s: "Total: <b>{} CFA</b>".format(round(float(s.scalar(
+        select(func.coalesce(func.sum(Payroll.amount), 0)).where(_today_between(Payroll.date))
+    )), 2)),
+)
+Listing(
+    "wrk", "👷 <b>Travailleurs du jour</b>:", "Aucun enregistrement aujourd'hui",
+    query=lambda: (
+        select(Shift.id, User.tg_id, Shift.status, Shift.role)
+        .outerjoin(User, Shift.worker_id == User.id)
+        .where(_today_between(Shift.date))
+    ),
+    order=[(Shift.id, False)],
+    render=lambda r: f"• {r.tg_id} – {r.status} – {html.escape(r.role or '-')}",
+)
+
+async def send_listing(message: Message, key: str, filters: Optional[dict] = None):
+    text, kb = LISTINGS[key].page(filters=filters)
+    if text is None:
+        return await message.answer(LISTINGS[key].empty_text)
+    await message.answer(text, reply_markup=kb)
+
 class JobForm(StatesGroup):
     name = State()
     contact = State()
@@ -303,19 +1148,177 @@ class StockAdjustForm(StatesGroup):
     qty = State()
     reason = State()
 
-# ✅ Correction ici pour aiogram >= 3.7
-bot = Bot(
-    BOT_TOKEN,
-    default=DefaultBotProperties(parse_mode=ParseMode.HTML)
-)
 router = Router()
-dp = Dispatcher()
-dp.include_router(router)
+
+def admin_chat_id() -> int:
+    shop = current_shop()
+    return shop.config.admin_chat_id if shop is not None else ADMIN_CHAT_ID
 
 def is_admin(user_id: int) -> bool:
-    return user_id == ADMIN_CHAT_ID
+    return user_id == admin_chat_id()
+
+# ---------------------------------------------------------------------------
+# Anti-flood : seau à jetons par utilisateur, coût par handler
+# ---------------------------------------------------------------------------
+# Chaque utilisateur dispose de THROTTLE_BURST jetons rechargés à
+# THROTTLE_RATE jetons/s ; un événement coûte THROTTLE_COSTS[nom du handler
+# ou action de callback] (1 par défaut). Sans jetons, l'événement est
+# abandonné avant d'atteindre la base. L'admin n'est jamais limité.
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "1.0"))
+THROTTLE_BURST = float(os.getenv("THROTTLE_BURST", "8"))
+THROTTLE_MAX_USERS = env_int("THROTTLE_MAX_USERS", 10000)
+THROTTLE_COSTS: Dict[str, float] = {
+    "track_by_id": 2.0,
+    "cmd_search": 1.0,
+    "inline_search": 0.5,
+    "a": 1.0,
+    "pg": 1.0,
+    "co": 2.0,
+    "ck": 4.0,
+    "_": 0.0,
+}
+
+class TokenBuckets:
+    """Seaux à jetons en mémoire bornée : LRU de THROTTLE_MAX_USERS entrées,
+    les seaux inactifs (donc pleins) sont oubliés au fil de l'eau."""
+
+    def __init__(self, rate: float, burst: float, max_users: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self._idle_after = burst / rate if rate > 0 else float("inf")
+        self._buckets: "OrderedDict[int, List[float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def take(self, user_id: int, cost: float, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.pop(user_id, None)
+        tokens = self.burst if bucket is None else min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[user_id] = [tokens, now]
+        self._expire(now)
+        return allowed
+
+    def _expire(self, now: float):
+        buckets = self._buckets
+        while buckets:
+            oldest_id, (_, last) = next(iter(buckets.items()))
+            if len(buckets) <= self.max_users and now - last < self._idle_after:
+                break
+            del buckets[oldest_id]
+
+class ThrottleMiddleware(BaseMiddleware):
+    def __init__(self, buckets: TokenBuckets):
+        self.buckets = buckets
+        self.throttled: Counter = Counter()
+        self.passed = 0
+
+    @staticmethod
+    def cost_key(event, data) -> str:
+        if isinstance(event, CallbackQuery):
+            try:
+                return unpack_cb(event.data or "")[0]
+            except ValueError:
+                return "?"
+        handler = data.get("handler")
+        return getattr(getattr(handler, "callback", None), "__name__", "?")
 
-def ensure_open_cart(user_id: int) -> Cart:
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is None or is_admin(user.id):
+            return await handler(event, data)
+        key = self.cost_key(event, data)
+        if self.buckets.take(user.id, THROTTLE_COSTS.get(key, 1.0)):
+            self.passed += 1
+            return await handler(event, data)
+        self.throttled[key] += 1
+        if isinstance(event, CallbackQuery):
+            try:
+                await event.answer("⏳ Doucement…")
+            except Exception:
+                pass
+        return None
+
+class ActorMiddleware(BaseMiddleware):
+    """Expose l'auteur de l'update (_actor) au routage des lectures."""
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        token = _actor.set(user.id if user is not None else None)
+        try:
+            return await handler(event, data)
+        finally:
+            _actor.reset(token)
+
+throttle = ThrottleMiddleware(TokenBuckets(THROTTLE_RATE, THROTTLE_BURST, THROTTLE_MAX_USERS))
+for _observer in (router.message, router.callback_query, router.inline_query):
+    _observer.middleware(ActorMiddleware())
+    _observer.middleware(throttle)
+
+async def answer_chunks(message: Message, lines: List[str], reply_markup: Optional[IKM] = None):
+    """Envoie des lignes en autant de messages que nécessaire (limite 4096) ;
+    ``reply_markup`` accompagne le dernier."""
+    chunk: List[str] = []
+    size = 0
+    for line in lines:
+        if chunk and size + len(line) + 1 > MESSAGE_LIMIT:
+            await message.answer("\n".join(chunk))
+            chunk, size = [], 0
+        chunk.append(line)
+        size += len(line) + 1
+    if chunk:
+        await message.answer("\n".join(chunk), reply_markup=reply_markup)
+
+def fit_lines(lines: List[str], limit: int = MESSAGE_LIMIT) -> str:
+    """Lignes entières tenant dans ``limit`` caractères, puis « … (+N) » pour
+    les N omises : couper dans une ligne peut casser une balise ou une entité
+    HTML, et Telegram refuse alors le message."""
+    text = "\n".join(lines)
+    if len(text) <= limit:
+        return text
+    room = limit - 16  # place pour « … (+N) »
+    kept: List[str] = []
+    size = 0
+    for line in lines:
+        if size + len(line) + 1 > room:
+            break
+        kept.append(line)
+        size += len(line) + 1
+    if not kept:
+        # Première ligne trop longue à elle seule : texte brut, coupé hors entité.
+        plain = re.sub(r"<[^>]*>", "", lines[0])[:room - 1]
+        kept = [re.sub(r"&[^;\s]*$", "", plain) + "…"]
+    omitted = len(lines) - len(kept)
+    return "\n".join(kept + [f"… (+{omitted})"] if omitted else kept)
+
+PAY_METHODS = {"cash", "mobile", "virement"}
+
+def record_payroll(s: Session, worker: User, amount: float, method: str, note: Optional[str] = None) -> Payroll:
+    """Paie + écriture de dépense correspondante + cumul du jour, dans la transaction de ``s``."""
+    now = dt.datetime.utcnow()
+    pa = Payroll(worker_id=worker.id, date=now, amount=amount, method=method, note=note)
+    s.add(pa)
+    s.add(LedgerEntry(entry_type=LedgerType.EXPENSE.value, amount=amount, description=f"Paie {worker.tg_id}"))
+    bump_worker_day(s, worker.id, now.date(), paid=amount, payments=1)
+    return pa
+
+def record_shift(s: Session, worker: User, status: str, role: Optional[str] = None) -> Shift:
+    now = dt.datetime.utcnow()
+    sh = Shift(worker_id=worker.id, date=now, status=status, role=role)
+    s.add(sh)
+    if status == ShiftStatus.PRESENT.value:
+        bump_worker_day(s, worker.id, now.date(), present=1)
+    else:
+        bump_worker_day(s, worker.id, now.date(), absent=1)
+    return sh
+
+def ensure_open_cart(user_id: int, tg_user=None) -> Cart:
+    """Panier ouvert de l'utilisateur. ``tg_user`` : profil Telegram servant à
+    créer le compte de qui n'a jamais fait /start (résultat inline partagé)."""
     with db() as s:
         c = (
             s.query(Cart)
@@ -325,20 +1328,34 @@ def ensure_open_cart(user_id: int) -> Cart:
         )
         if c:
             return c
-        u = s.query(User).filter_by(tg_id=user_id).one()
+        u = s.query(User).filter_by(tg_id=user_id).one_or_none()
+        if u is None:
+            u = new_user(tg_user) if tg_user is not None else User(tg_id=user_id, role=UserRole.CUSTOMER.value)
+            s.add(u)
+            s.flush()
         c = Cart(user_id=u.id, is_open=True)
         s.add(c)
         s.commit()
         s.refresh(c)
         return c
 
+def cart_lines(s: Session, cart_id: int):
+    # une seule requête jointe : pas de chargement paresseux de it.product
+    return s.execute(
+        select(CartItem.id, CartItem.qty, Product.name, Product.price)
+        .join(Product, CartItem.product_id == Product.id)
+        .where(CartItem.cart_id == cart_id)
+        .order_by(CartItem.id)
+    ).all()
+
 def cart_total(cart_id: int) -> float:
     with db() as s:
-        items = s.query(CartItem).filter_by(cart_id=cart_id).all()
-        total = 0.0
-        for it in items:
-            total += float(it.qty) * float(it.product.price)
-        return round(total, 2)
+        total = s.scalar(
+            select(func.coalesce(func.sum(CartItem.qty * Product.price), 0))
+            .join(Product, CartItem.product_id == Product.id)
+            .where(CartItem.cart_id == cart_id)
+        )
+    return round(float(total), 2)
 
 def order_total(order_id: int) -> float:
     with db() as s:
@@ -365,6 +1382,7 @@ async def cmd_help(message: Message):
         "Commandes utiles:\n"
         "- /start – menu principal\n"
         "- /catalogue – voir le catalogue produits\n"
+        "- /search <texte> – rechercher un produit\n"
         "- /admin – panneau d'administration (admin uniquement)\n"
     )
 
@@ -386,6 +1404,33 @@ async def btn_order(message: Message):
 async def cmd_catalogue(message: Message):
     await btn_order(message)
 
+@router.message(Command("search"))
+async def cmd_search(message: Message):
+    query = message.text.partition(" ")[2].strip()
+    if not query:
+        return await message.answer("Usage: /search <nom ou SKU>")
+    hits = search_index().search(query)
+    if not hits:
+        return await message.answer("Aucun produit ne correspond.")
+    kb = [[IKB(text=f"➕ {name} ({price} CFA)", callback_data=pack_cb("a", pid))] for pid, name, price in hits]
+    kb.append([IKB(text="🧺 Voir le panier", callback_data="co")])
+    await message.answer(f"🔎 Résultats pour « {html.escape(query)} »:", reply_markup=IKM(inline_keyboard=kb))
+
+@router.inline_query()
+async def inline_search(query: InlineQuery):
+    hits = search_index().search(query.query, limit=20) if query.query.strip() else []
+    results = [
+        InlineQueryResultArticle(
+            id=str(pid),
+            title=name,
+            description=f"{price} CFA",
+            input_message_content=InputTextMessageContent(message_text=f"🛍️ {html.escape(name)} – {price} CFA"),
+            reply_markup=IKM(inline_keyboard=[[IKB(text="➕ Ajouter au panier", callback_data=pack_cb("a", pid))]]),
+        )
+        for pid, name, price in hits
+    ]
+    await query.answer(results, cache_time=5, is_personal=False)
+
 @router.message(F.text == "📦 Suivre ma commande")
 async def btn_track(message: Message):
     await message.answer("Veuillez envoyer l'ID de votre commande (ex: 1024)")
@@ -395,29 +1440,91 @@ async def track_by_id(message: Message):
     order_id = int(message.text)
     with db() as s:
         o = s.query(Order).filter_by(id=order_id).one_or_none()
-    if not o:
-        return await message.answer("Commande introuvable.")
-    items_txt = []
-    with db() as s:
-        items = s.query(OrderItem).filter_by(order_id=o.id).all()
-    for it in items:
-        items_txt.append(f"• {it.product.name} x{it.qty} – {it.unit_price} CFA")
+        if not o:
+            return await message.answer("Commande introuvable.")
+        items = s.execute(
+            select(OrderItem.qty, OrderItem.unit_price, Product.name)
+            .outerjoin(Product, OrderItem.product_id == Product.id)
+            .where(OrderItem.order_id == o.id)
+            .order_by(OrderItem.id)
+        ).all()
+    items_txt = [f"• {it.name} x{it.qty} – {it.unit_price} CFA" for it in items]
+    total = round(sum(float(it.qty) * float(it.unit_price) for it in items), 2)
     txt = (
         f"<b>Commande #{o.id}</b>\n"
         f"Statut: <b>{o.status}</b>\n"
-        f"Total: <b>{order_total(o.id)} CFA</b>\n\n"
+        f"Total: <b>{total} CFA</b>\n\n"
         + "\n".join(items_txt)
     )
     await message.answer(txt)
 
+# --- Fil d'annonces : pages pré-rendues en cache, invalidées par /post ---
+FEED_POSTS = env_int("FEED_POSTS", 30)
+FEED_PAGE_POSTS = 3
+_feed_cache: Dict[str, object] = {}
+
+def feed_cache() -> Dict[str, object]:
+    shop = current_shop()
+    return shop.feed_cache if shop is not None else _feed_cache
+
+def render_feed(posts) -> List[str]:
+    """Regroupe les annonces (plus récentes d'abord) en pages d'au plus
+    FEED_PAGE_POSTS annonces tenant dans un message."""
+    budget = MESSAGE_LIMIT - 64  # marge pour l'en-tête de page
+    pages: List[str] = []
+    chunk: List[str] = []
+    for p in posts:
+        block = f"📰 <b>Annonce</b> ({p.created_at:%d/%m/%Y})\n\n{p.text}"
+        if len(block) > budget:
+            block = fit_lines(block.split("\n"), budget)
+        if chunk and (len(chunk) >= FEED_PAGE_POSTS or sum(map(len, chunk)) + len(block) + 2 * len(chunk) > budget):
+            pages.append("\n\n".join(chunk))
+            chunk = []
+        chunk.append(block)
+    if chunk:
+        pages.append("\n\n".join(chunk))
+    return pages
+
+def feed_pages() -> List[str]:
+    cache = feed_cache()
+    pages = cache.get("pages")
+    if pages is None:
+        with db() as s:
+            posts = s.execute(
+                select(Post.text, Post.created_at).order_by(Post.created_at.desc(), Post.id.desc()).limit(FEED_POSTS)
+            ).all()
+        pages = cache["pages"] = render_feed(posts)
+    return pages
+
+def invalidate_feed():
+    feed_cache().clear()
+
+def feed_keyboard(page: int, total: int) -> Optional[IKM]:
+    if total <= 1:
+        return None
+    nav = []
+    if page > 0:
+        nav.append(IKB(text="⬅️", callback_data=pack_cb("fd", page - 1)))
+    nav.append(IKB(text=f"{page + 1}/{total}", callback_data="_"))
+    if page + 1 < total:
+        nav.append(IKB(text="➡️", callback_data=pack_cb("fd", page + 1)))
+    return IKM(inline_keyboard=[nav])
+
 @router.message(F.text == "📰 Dernières annonces")
 async def btn_posts(message: Message):
-    with db() as s:
-        posts = s.query(Post).order_by(Post.created_at.desc()).limit(5).all()
-    if not posts:
+    pages = feed_pages()
+    if not pages:
         return await message.answer("Aucune annonce pour le moment.")
-    for p in posts:
-        await message.answer(f"📰 <b>Annonce</b> ({p.created_at:%d/%m/%Y})\n\n{p.text}")
+    await message.answer(pages[0], reply_markup=feed_keyboard(0, len(pages)))
+
+@callback_action("fd")
+async def cb_feed(call: CallbackQuery, state: FSMContext, page: int):
+    pages = feed_pages()
+    if not pages:
+        return await call.answer("Aucune annonce", show_alert=True)
+    page = min(page, len(pages) - 1)
+    await call.message.edit_text(pages[page], reply_markup=feed_keyboard(page, len(pages)))
+    await call.answer()
 
 @router.message(F.text == "👔 Postuler à un emploi")
 async def btn_job(message: Message, state: FSMContext):
@@ -447,30 +1554,53 @@ async def job_resume(message: Message, state: FSMContext):
     data = await state.get_data()
     with db() as s:
         app = JobApplication(
+            applicant_tg_id=message.from_user.id,
             applicant_name=data["name"],
             contact=data["contact"],
             position=data["position"],
             resume=message.text.strip(),
         )
         s.add(app)
+        enqueue_notification(
+            s, admin_chat_id(),
+            f"Nouvelle postulation: {html.escape(data['name'])} – {html.escape(data['position'])} – {html.escape(data['contact'])}",
+            kind="job",
+        )
         s.commit()
     await state.clear()
     await message.answer("Merci ! Votre candidature a été reçue. ✅")
+
+@router.callback_query()
+async def cb_dispatch(call: CallbackQuery, state: FSMContext):
+    """Point d'entrée unique des callbacks : une recherche dans CALLBACK_ACTIONS."""
     try:
-        await bot.send_message(ADMIN_CHAT_ID, f"Nouvelle postulation: {data['name']} – {data['position']} – {data['contact']}")
-    except Exception:
-        pass
+        action, args = unpack_cb(call.data or "")
+    except ValueError:
+        return await call.answer(CB_EXPIRED, show_alert=True)
+    entry = CALLBACK_ACTIONS.get(action)
+    if entry is None:
+        return await call.answer(CB_EXPIRED, show_alert=True)
+    handler, admin_only = entry
+    # Ancien bouton dont la charge ne correspond plus à la signature du handler.
+    low, high = callback_arity(handler)
+    if not low <= len(args) <= high:
+        return await call.answer(CB_EXPIRED, show_alert=True)
+    if admin_only and not is_admin(call.from_user.id):
+        return await call.answer("Accès refusé", show_alert=True)
+    await handler(call, state, *args)
+
+@callback_action("_")
+async def cb_noop(call: CallbackQuery, state: FSMContext):
+    await call.answer()
 
-@router.callback_query(F.data.startswith("page:"))
-async def cb_page(call: CallbackQuery):
-    page = int(call.data.split(":")[1])
+@callback_action("pg")
+async def cb_page(call: CallbackQuery, state: FSMContext, page: int):
     await call.message.edit_text("🛍️ Catalogue – choisissez des produits:", reply_markup=paginated_products_keyboard(page))
     await call.answer()
 
-@router.callback_query(F.data.startswith("add:"))
-async def cb_add(call: CallbackQuery):
-    pid = int(call.data.split(":")[1])
-    c = ensure_open_cart(call.from_user.id)
+@callback_action("a")
+async def cb_add(call: CallbackQuery, state: FSMContext, pid: int):
+    c = ensure_open_cart(call.from_user.id, call.from_user)
     with db() as s:
         p = s.query(Product).filter_by(id=pid, is_active=True).one_or_none()
         if not p:
@@ -485,25 +1615,25 @@ async def cb_add(call: CallbackQuery):
         s.commit()
     await call.answer("Ajouté au panier 🧺")
 
-@router.callback_query(F.data == "cart:open")
-async def cb_cart_open(call: CallbackQuery):
-    c = ensure_open_cart(call.from_user.id)
+@callback_action("co")
+async def cb_cart_open(call: CallbackQuery, state: FSMContext):
+    c = ensure_open_cart(call.from_user.id, call.from_user)
     with db() as s:
-        items = s.query(CartItem).filter_by(cart_id=c.id).all()
+        items = cart_lines(s, c.id)
     if not items:
         return await call.answer("Panier vide", show_alert=True)
-    lines = [f"🧺 <b>Panier</b> – Total: <b>{cart_total(c.id)} CFA</b>"]
+    total = round(sum(float(it.price) * it.qty for it in items), 2)
+    lines = [f"🧺 <b>Panier</b> – Total: <b>{total} CFA</b>"]
     for it in items:
-        lines.append(f"• {it.product.name} x{it.qty} – {float(it.product.price)*it.qty} CFA")
+        lines.append(f"• {it.name} x{it.qty} – {float(it.price)*it.qty} CFA")
     await call.message.edit_text("\n".join(lines), reply_markup=cart_keyboard(c.id))
 
-@router.callback_query(F.data == "cart:back")
-async def cb_cart_back(call: CallbackQuery):
+@callback_action("cb")
+async def cb_cart_back(call: CallbackQuery, state: FSMContext):
     await call.message.edit_text("🛍️ Catalogue – choisissez des produits:", reply_markup=paginated_products_keyboard(0))
 
-@router.callback_query(F.data.startswith("cartinc:"))
-async def cb_cart_inc(call: CallbackQuery):
-    it_id = int(call.data.split(":")[1])
+@callback_action("ci")
+async def cb_cart_inc(call: CallbackQuery, state: FSMContext, it_id: int):
     with db() as s:
         it = s.query(CartItem).filter_by(id=it_id).one_or_none()
         if not it:
@@ -514,9 +1644,8 @@ async def cb_cart_inc(call: CallbackQuery):
     await call.message.edit_reply_markup(reply_markup=cart_keyboard(c_id))
     await call.answer("+1")
 
-@router.callback_query(F.data.startswith("cartdec:"))
-async def cb_cart_dec(call: CallbackQuery):
-    it_id = int(call.data.split(":")[1])
+@callback_action("cd")
+async def cb_cart_dec(call: CallbackQuery, state: FSMContext, it_id: int):
     with db() as s:
         it = s.query(CartItem).filter_by(id=it_id).one_or_none()
         if not it:
@@ -532,9 +1661,8 @@ async def cb_cart_dec(call: CallbackQuery):
     await call.message.edit_reply_markup(reply_markup=cart_keyboard(c_id))
     await call.answer("-1")
 
-@router.callback_query(F.data.startswith("cartdel:"))
-async def cb_cart_del(call: CallbackQuery):
-    it_id = int(call.data.split(":")[1])
+@callback_action("cx")
+async def cb_cart_del(call: CallbackQuery, state: FSMContext, it_id: int):
     with db() as s:
         it = s.query(CartItem).filter_by(id=it_id).one_or_none()
         if not it:
@@ -545,30 +1673,36 @@ async def cb_cart_del(call: CallbackQuery):
     await call.message.edit_reply_markup(reply_markup=cart_keyboard(c_id))
     await call.answer("Supprimé")
 
-@router.callback_query(F.data == "cart:checkout")
-async def cb_cart_checkout(call: CallbackQuery):
-    c = ensure_open_cart(call.from_user.id)
+@callback_action("ck")
+async def cb_cart_checkout(call: CallbackQuery, state: FSMContext):
+    c = ensure_open_cart(call.from_user.id, call.from_user)
     with db() as s:
-        items = s.query(CartItem).filter_by(cart_id=c.id).all()
+        items = s.execute(
+            select(CartItem, Product)
+            .join(Product, CartItem.product_id == Product.id)
+            .where(CartItem.cart_id == c.id)
+        ).all()
         if not items:
             return await call.answer("Panier vide", show_alert=True)
         u = s.query(User).filter_by(tg_id=call.from_user.id).one()
-        o = Order(user_id=u.id, customer_name=u.first_name or u.username or str(u.tg_id))
+        total = round(sum(float(it.qty) * float(p.price) for it, p in items), 2)
+        o = Order(user_id=u.id, customer_name=u.first_name or u.username or str(u.tg_id), total=total)
         s.add(o)
-        s.commit()
-        total = 0.0
-        for it in items:
-            item = OrderItem(order_id=o.id, product_id=it.product_id, qty=it.qty, unit_price=it.product.price)
-            s.add(item)
-            p = s.query(Product).filter_by(id=it.product_id).one()
-            p.stock_qty = max(0, (p.stock_qty or 0) - it.qty)
-            sm = StockMovement(product_id=p.id, qty_change=-it.qty, reason="vente", ref_type="order", ref_id=o.id)
-            s.add(sm)
-            total += float(it.qty) * float(p.price)
-        o.total = round(total, 2)
-        for it in items:
-            s.delete(it)
-        c.is_open = False
+        s.flush()
+        # écritures groupées (executemany) : nombre de requêtes constant quelle que soit la taille du panier
+        s.execute(insert(OrderItem), [
+            {"order_id": o.id, "product_id": p.id, "qty": it.qty, "unit_price": p.price} for it, p in items
+        ])
+        s.execute(insert(StockMovement), [
+            {"product_id": p.id, "qty_change": -it.qty, "reason": "vente", "ref_type": "order", "ref_id": o.id}
+            for it, p in items
+        ])
+        s.execute(update(Product), [
+            {"id": p.id, "stock_qty": max(0, (p.stock_qty or 0) - it.qty)} for it, p in items
+        ])
+        s.execute(delete(CartItem).where(CartItem.cart_id == c.id))
+        s.execute(update(Cart).where(Cart.id == c.id).values(is_open=False))
+        enqueue_notification(s, admin_chat_id(), f"🆕 Nouvelle commande #{o.id} – Total {o.total} CFA", kind="order", amount=o.total)
         s.commit()
         order_id = o.id
         order_total_value = o.total
@@ -578,10 +1712,6 @@ async def cb_cart_checkout(call: CallbackQuery):
         "Ex: <code>/payer 1024 15000</code>"
     )
     await call.answer()
-    try:
-        await bot.send_message(ADMIN_CHAT_ID, f"🆕 Nouvelle commande #{order_id} – Total {order_total_value} CFA")
-    except Exception:
-        pass
 
 @router.message(Command("payer"))
 async def cmd_payer(message: Message):
@@ -600,92 +1730,107 @@ async def cmd_payer(message: Message):
         le = LedgerEntry(entry_type=LedgerType.INCOME.value, amount=amount, description=f"Paiement commande #{order_id}", order_id=order_id)
         s.add(le)
         o.status = OrderStatus.PAID.value
+        enqueue_notification(s, admin_chat_id(), f"💵 Paiement commande #{order_id} – {amount} CFA", kind="payment", amount=amount)
         s.commit()
         total = o.total
     await message.answer(f"Merci ! Paiement enregistré pour la commande #{order_id}.\nTotal commande: {total} CFA\nMontant reçu: {amount} CFA")
 
-@router.callback_query(F.data.startswith("admin:"))
-async def cb_admin(call: CallbackQuery, state: FSMContext):
-    if not is_admin(call.from_user.id):
-        return await call.answer("Accès refusé", show_alert=True)
-    action = call.data.split(":")[1]
-    if action == "products":
-        await call.message.edit_text(
-            "📚 Produits – commandes rapides:\n"
-            "• /addproduct – ajouter un produit\n"
-            "• /listproducts – lister\n"
-            "• /toggleproduct <sku> – activer/désactiver\n"
-            "• /price <sku> <prix> – modifier prix",
-            reply_markup=admin_keyboard()
-        )
-    elif action == "stock":
-        await call.message.edit_text(
-            "📦 Stock:\n"
-            "• /stockin – entrée stock\n"
-            "• /stockout – sortie stock\n"
-            "• /inventory – inventaire rapide",
-            reply_markup=admin_keyboard()
-        )
-    elif action == "ledger":
-        await call.message.edit_text(
-            "🧾 Comptabilité:\n"
-            "• /recette – ajouter une recette\n"
-            "• /depense – ajouter une dépense\n"
-            "• /cash – solde de trésorerie",
-            reply_markup=admin_keyboard()
-        )
-    elif action == "payroll":
-        await call.message.edit_text(
-            "💰 Paie journalière:\n"
-            "• /pay – enregistrer une paie\n"
-            "• /paylist – paies récentes",
-            reply_markup=admin_keyboard()
-        )
-    elif action == "workers":
-        await call.message.edit_text(
-            "👷 Travailleurs:\n"
-            "• /addworker <tg_id> – définir rôle worker\n"
-            "• /presence <tg_id> <PRESENT|ABSENT> [rôle] – pointage\n"
-            "• /workers – liste du jour",
-            reply_markup=admin_keyboard()
-        )
-    elif action == "posts":
-        await call.message.edit_text(
-            "📰 Annonces:\n"
-            "• /post – nouvelle annonce\n"
-            "• /broadcast – envoyer à tous",
-            reply_markup=admin_keyboard()
-        )
-    elif action == "stats":
-        with db() as s:
-            today = dt.datetime.utcnow().date()
-            start_day = dt.datetime.combine(today, dt.time.min)
-            end_day = dt.datetime.combine(today, dt.time.max)
-            day_count = s.query(Order).filter(Order.created_at.between(start_day, end_day)).count()
-            weekday = today.weekday()
-            week_start_date = today - dt.timedelta(days=weekday)
-            week_end_date = week_start_date + dt.timedelta(days=6)
-            w_start = dt.datetime.combine(week_start_date, dt.time.min)
-            w_end = dt.datetime.combine(week_end_date, dt.time.max)
-            week_count = s.query(Order).filter(Order.created_at.between(w_start, w_end)).count()
-            day_orders = s.query(Order).filter(Order.created_at.between(start_day, end_day)).all()
-            ca_day = sum(float(o.total or 0) for o in day_orders)
-        await call.message.edit_text(
-            f"📊 Statistiques:\n"
-            f"Commandes aujourd'hui: <b>{day_count}</b>\n"
-            f"Commandes cette semaine: <b>{week_count}</b>\n"
-            f"Chiffre d'affaires (aujourd'hui): <b>{round(ca_day,2)} CFA</b>",
-            reply_markup=admin_keyboard()
-        )
-    elif action == "export":
-        path1 = export_products_csv()
-        path2 = export_orders_csv()
-        try:
-            await call.message.answer_document(InputFile(path1))
-            await call.message.answer_document(InputFile(path2))
-        except Exception:
-            pass
-        await call.answer("Exports générés")
+ADMIN_SECTIONS = {
+    "products": (
+        "📚 Produits – commandes rapides:\n"
+        "• /addproduct – ajouter un produit\n"
+        "• /listproducts – lister\n"
+        "• /toggleproduct <sku> – activer/désactiver\n"
+        "• /price <sku> <prix> – modifier prix"
+    ),
+    "stock": (
+        "📦 Stock:\n"
+        "• /stockin – entrée stock\n"
+        "• /stockout – sortie stock\n"
+        "• /inventory – inventaire rapide\n"
+        "• /forecast [jours] – prévision de réassort"
+    ),
+    "ledger": (
+        "🧾 Comptabilité:\n"
+        "• /recette – ajouter une recette\n"
+        "• /depense – ajouter une dépense\n"
+        "• /cash – solde de trésorerie\n"
+        "• /archive – archiver les données anciennes\n"
+        "• /backup [fichier] – sauvegarde à chaud de la base\n"
+        "• /export [tout] – export Parquet (compta / BI)"
+    ),
+    "payroll": (
+        "💰 Paie journalière:\n"
+        "• /pay – enregistrer une paie\n"
+        "• /paybulk – paie groupée (liste ou fichier)\n"
+        "• /paylist – paies récentes\n"
+        "• /statement &lt;tg_id&gt; [du] [au] – relevé paie & présence, bulletin\n"
+        "• /crew [du] [au] – synthèse de l'équipe sur la période"
+    ),
+    "workers": (
+        "👷 Travailleurs:\n"
+        "• /addworker <tg_id> – définir rôle worker\n"
+        "• /presence <tg_id> <PRESENT|ABSENT> [rôle] – pointage\n"
+        "• /presencebulk – pointage groupé (liste ou fichier)\n"
+        "• /workers – liste du jour"
+    ),
+    "posts": (
+        "📰 Annonces:\n"
+        "• /post – nouvelle annonce\n"
+        "• /broadcast [segment] – diffuser la dernière annonce\n"
+        "  segments : tous | clients | travailleurs | acheteurs:&lt;jours&gt; | produit:&lt;SKU&gt;"
+    ),
+    "jobs": (
+        "👔 Recrutement:\n"
+        "• /jobs [filtres] – candidatures, les plus récentes d'abord\n"
+        "  filtres : statut:&lt;statut&gt; poste:&lt;mot&gt; du:AAAA-MM-JJ au:AAAA-MM-JJ mots-clés\n"
+        "• /jobstatus &lt;statut&gt; &lt;ids | a-b | filtre&gt; – changement de statut groupé, candidats prévenus\n"
+        "  statuts : recu | preselection | entretien | retenu | refuse"
+    ),
+}
+
+async def cb_admin_section(call: CallbackQuery, state: FSMContext, section: str = ""):
+    await call.message.edit_text(ADMIN_SECTIONS[section], reply_markup=admin_keyboard())
+
+for _section in ADMIN_SECTIONS:
+    callback_action("adm." + _section, admin=True)(partial(cb_admin_section, section=_section))
+
+@callback_action("adm.stats", admin=True)
+async def cb_admin_stats(call: CallbackQuery, state: FSMContext):
+    with db_read() as s:
+        today = dt.datetime.utcnow().date()
+        start_day = dt.datetime.combine(today, dt.time.min)
+        end_day = dt.datetime.combine(today, dt.time.max)
+        day_count = s.query(Order).filter(Order.created_at.between(start_day, end_day)).count()
+        weekday = today.weekday()
+        week_start_date = today - dt.timedelta(days=weekday)
+        week_end_date = week_start_date + dt.timedelta(days=6)
+        w_start = dt.datetime.combine(week_start_date, dt.time.min)
+        w_end = dt.datetime.combine(week_end_date, dt.time.max)
+        week_count = s.query(Order).filter(Order.created_at.between(w_start, w_end)).count()
+        day_orders = s.query(Order).filter(Order.created_at.between(start_day, end_day)).all()
+        ca_day = sum(float(o.total or 0) for o in day_orders)
+    await call.message.edit_text(
+        f"📊 Statistiques:\n"
+        f"Commandes aujourd'hui: <b>{day_count}</b>\n"
+        f"Commandes cette semaine: <b>{week_count}</b>\n"
+        f"Chiffre d'affaires (aujourd'hui): <b>{round(ca_day,2)} CFA</b>\n\n"
+        "• /top [jours] – meilleures ventes\n"
+        "• /heatmap [semaines] – commandes par jour et heure\n"
+        "• /compare – semaine en cours vs précédente",
+        reply_markup=admin_keyboard()
+    )
+
+@callback_action("adm.export", admin=True)
+async def cb_admin_export(call: CallbackQuery, state: FSMContext):
+    path1 = export_products_csv()
+    path2 = export_orders_csv()
+    try:
+        await call.message.answer_document(FSInputFile(path1))
+        await call.message.answer_document(FSInputFile(path2))
+    except Exception:
+        pass
+    await call.answer("Exports générés")
 
 @router.message(Command("addproduct"))
 async def cmd_addproduct(message: Message, state: FSMContext):
@@ -737,14 +1882,7 @@ async def pf_stock(message: Message, state: FSMContext):
 async def cmd_listproducts(message: Message):
     if not is_admin(message.from_user.id):
         return await message.answer("Accès refusé")
-    with db() as s:
-        prods = s.query(Product).order_by(Product.is_active.desc(), Product.name.asc()).all()
-    if not prods:
-        return await message.answer("Aucun produit")
-    lines = ["📚 <b>Produits</b>:"]
-    for p in prods:
-        lines.append(f"• {p.name} ({p.sku}) – {p.price} CFA – Stock: {p.stock_qty} – {'✅' if p.is_active else '🚫'}")
-    await message.answer("\n".join(lines))
+    await send_listing(message, "prod")
 
 @router.message(Command("toggleproduct"))
 async def cmd_toggleproduct(message: Message):
@@ -841,14 +1979,7 @@ async def saf_reason(message: Message, state: FSMContext):
 async def cmd_inventory(message: Message):
     if not is_admin(message.from_user.id):
         return await message.answer("Accès refusé")
-    with db() as s:
-        prods = s.query(Product).order_by(Product.name.asc()).all()
-    if not prods:
-        return await message.answer("Inventaire vide")
-    lines = ["📦 <b>Inventaire</b>:"]
-    for p in prods:
-        lines.append(f"• {p.name} ({p.sku}) – Stock: {p.stock_qty}")
-    await message.answer("\n".join(lines))
+    await send_listing(message, "inv")
 
 @router.message(Command("recette"))
 async def cmd_recette(message: Message, state: FSMContext):
@@ -890,10 +2021,12 @@ async def ledger_desc(message: Message, state: FSMContext):
 async def cmd_cash(message: Message):
     if not is_admin(message.from_user.id):
         return await message.answer("Accès refusé")
-    with db() as s:
-        inc = s.query(LedgerEntry).filter_by(entry_type=LedgerType.INCOME.value).all()
-        exp = s.query(LedgerEntry).filter_by(entry_type=LedgerType.EXPENSE.value).all()
-    bal = sum(float(x.amount) for x in inc) - sum(float(x.amount) for x in exp)
+    with db_read() as s:
+        bal = s.scalar(select(func.coalesce(func.sum(case(
+            (LedgerEntry.entry_type == LedgerType.EXPENSE.value, -LedgerEntry.amount),
+            else_=LedgerEntry.amount,
+        )), 0)).where(LedgerEntry.entry_type.in_([LedgerType.INCOME.value, LedgerType.EXPENSE.value])))
+    bal = float(bal)
     await message.answer(f"💼 Trésorerie actuelle: <b>{round(bal,2)} CFA</b>")
 
 @router.message(Command("pay"))
@@ -930,7 +2063,7 @@ async def pr_amount(message: Message, state: FSMContext):
 @router.message(PayrollForm.method)
 async def pr_method(message: Message, state: FSMContext):
     method = message.text.strip().lower()
-    if method not in {"cash", "mobile", "virement"}:
+    if method not in PAY_METHODS:
         return await message.answer("Choix: cash / mobile / virement")
     await state.update_data(method=method)
     await state.set_state(PayrollForm.note)
@@ -945,11 +2078,8 @@ async def pr_note(message: Message, state: FSMContext):
         if not w:
             w = User(tg_id=data["worker_tg"], first_name="", role=UserRole.WORKER.value)
             s.add(w)
-            s.commit()
-        pa = Payroll(worker_id=w.id, amount=data["amount"], method=data["method"], note=note)
-        s.add(pa)
-        le = LedgerEntry(entry_type=LedgerType.EXPENSE.value, amount=data["amount"], description=f"Paie {w.tg_id}")
-        s.add(le)
+            s.flush()
+        record_payroll(s, w, data["amount"], data["method"], note)
         s.commit()
     await state.clear()
     await message.answer("Paie enregistrée ✅")
@@ -958,20 +2088,7 @@ async def pr_note(message: Message, state: FSMContext):
 async def cmd_paylist(message: Message):
     if not is_admin(message.from_user.id):
         return await message.answer("Accès refusé")
-    today = dt.datetime.utcnow().date()
-    start = dt.datetime.combine(today, dt.time.min)
-    end = dt.datetime.combine(today, dt.time.max)
-    with db() as s:
-        pays = s.query(Payroll).filter(Payroll.date.between(start, end)).all()
-    if not pays:
-        return await message.answer("Aucune paie aujourd'hui")
-    lines = ["💰 <b>Paies du jour</b>:"]
-    total = 0.0
-    for p in pays:
-        lines.append(f"• {p.worker.tg_id} – {p.amount} via {p.method}")
-        total += float(p.amount)
-    lines.append(f"Total: <b>{round(total,2)} CFA</b>")
-    await message.answer("\n".join(lines))
+    await send_listing(message, "pay")
 
 @router.message(Command("addworker"))
 async def cmd_addworker(message: Message):
@@ -1013,63 +2130,375 @@ async def cmd_presence(message: Message):
         u = s.query(User).filter_by(tg_id=tg_id).one_or_none()
         if not u:
             return await message.answer("Utilisateur inconnu – /addworker d'abord")
-        sh = Shift(worker_id=u.id, status=status, role=role)
-        s.add(sh)
+        record_shift(s, u, status, role)
         s.commit()
     await message.answer("Présence enregistrée ✅")
 
-@router.message(Command("workers"))
-async def cmd_workers(message: Message):
-    if not is_admin(message.from_user.id):
-        return await message.answer("Accès refusé")
-    today = dt.datetime.utcnow().date()
-    start = dt.datetime.combine(today, dt.time.min)
-    end = dt.datetime.combine(today, dt.time.max)
-    with db() as s:
-        shifts = s.query(Shift).filter(Shift.date.between(start, end)).all()
-    if not shifts:
-        return await message.answer("Aucun enregistrement aujourd'hui")
-    lines = ["👷 <b>Travailleurs du jour</b>:"]
-    for sh in shifts:
-        lines.append(f"• {sh.worker.tg_id} – {sh.status} – {sh.role or '-'}")
-    await message.answer("\n".join(lines))
+# --- Saisie groupée (paie & pointage d'équipe) -----------------------------
+BULK_MAX_BYTES = 512 * 1024
 
-@router.message(Command("post"))
-async def cmd_post(message: Message):
-    if not is_admin(message.from_user.id):
-        return await message.answer("Accès refusé")
-    text = message.text.partition(" ")[2].strip()
-    if not text:
-        return await message.answer("Usage: /post <message>")
-    with db() as s:
+def _parse_tg_id(raw: str) -> int:
+    if not raw.isdigit():
+        raise ValueError("tg_id invalide")
+    return int(raw)
+
+def _parse_pay_line(parts: List[str]) -> tuple:
+    if len(parts) < 3:
+        raise ValueError("format: tg_id montant méthode [note]")
+    tg_id = _parse_tg_id(parts[0])
+    try:
+        amount = round(float(parts[1].replace(",", ".")), 2)
+    except ValueError:
+        raise ValueError("montant invalide")
+    if amount <= 0:
+        raise ValueError("montant invalide")
+    method = parts[2].lower()
+    if method not in PAY_METHODS:
+        raise ValueError("méthode: cash / mobile / virement")
+    return tg_id, amount, method, " ".join(parts[3:]) or None
+
+def _parse_presence_line(parts: List[str]) -> tuple:
+    if len(parts) < 2:
+        raise ValueError("format: tg_id PRESENT|ABSENT [rôle]")
+    tg_id = _parse_tg_id(parts[0])
+    status = parts[1].upper()
+    if status not in {ShiftStatus.PRESENT.value, ShiftStatus.ABSENT.value}:
+        raise ValueError("statut: PRESENT ou ABSENT")
+    return tg_id, status, " ".join(parts[2:]) or None
+
+def parse_bulk(text: str, parse_line: Callable[[List[str]], tuple]) -> List[Tuple[int, Optional[tuple], Optional[str]]]:
+    """Découpe un lot ligne par ligne : (n° de ligne, valeurs, erreur)."""
+    out = []
+    for n, raw in enumerate(text.splitlines(), start=1):
+        raw = raw.strip()
+        if not raw or raw.startswith("#"):
+            continue
+        try:
+            out.append((n, parse_line(re.split(r"[\s;]+", raw)), None))
+        except ValueError as e:
+            out.append((n, None, str(e)))
+    return out
+
+async def _bulk_payload(message: Message, bot: Bot) -> str:
+    """Lignes du lot : texte après la commande, ou fichier joint (légende = commande)."""
+    if message.document:
+        if (message.document.file_size or 0) > BULK_MAX_BYTES:
+            raise ValueError("fichier trop volumineux")
+        buf = await bot.download(message.document)
+        return buf.read().decode("utf-8-sig", errors="replace")
+    head, _, rest = (message.text or "").partition("\n")
+    # « /paybulk 2001 5000 cash » : la première ligne peut suivre la commande.
+    return "\n".join(head.split(maxsplit=1)[1:] + [rest])
+
+def apply_bulk_payroll(rows: List[Tuple[int, Optional[tuple], Optional[str]]]) -> List[str]:
+    valid = [v for _, v, err in rows if err is None]
+    report = []
+    with db() as s:
+        tg_ids = {v[0] for v in valid}
+        workers = {u.tg_id: u for u in s.query(User).filter(User.tg_id.in_(tg_ids))} if tg_ids else {}
+        for tg_id in tg_ids - workers.keys():
+            workers[tg_id] = User(tg_id=tg_id, first_name="", role=UserRole.WORKER.value)
+            s.add(workers[tg_id])
+        s.flush()
+        total = 0.0
+        for n, v, err in rows:
+            if err:
+                report.append(f"L{n} ❌ {err}")
+                continue
+            tg_id, amount, method, note = v
+            record_payroll(s, workers[tg_id], amount, method, note)
+            total += amount
+            report.append(f"L{n} ✅ {tg_id} – {amount} via {method}")
+        s.commit()
+    report.append(f"Total payé: <b>{round(total, 2)} CFA</b> ({len(valid)} paie(s), {len(rows) - len(valid)} rejet(s))")
+    return report
+
+def apply_bulk_presence(rows: List[Tuple[int, Optional[tuple], Optional[str]]]) -> List[str]:
+    report = []
+    recorded = 0
+    with db() as s:
+        tg_ids = {v[0] for _, v, err in rows if err is None}
+        workers = {u.tg_id: u for u in s.query(User).filter(User.tg_id.in_(tg_ids))} if tg_ids else {}
+        for n, v, err in rows:
+            if err is None and v[0] not in workers:
+                err = f"{v[0]} inconnu – /addworker d'abord"
+            if err:
+                report.append(f"L{n} ❌ {err}")
+                continue
+            tg_id, status, role = v
+            record_shift(s, workers[tg_id], status, role)
+            recorded += 1
+            report.append(f"L{n} ✅ {tg_id} – {status}{' – ' + html.escape(role) if role else ''}")
+        s.commit()
+    report.append(f"Pointages enregistrés: <b>{recorded}</b> ({len(rows) - recorded} rejet(s))")
+    return report
+
+async def _run_bulk(message: Message, bot: Bot, usage: str, parse_line, apply) -> None:
+    if not is_admin(message.from_user.id):
+        return await message.answer("Accès refusé")
+    try:
+        rows = parse_bulk(await _bulk_payload(message, bot), parse_line)
+    except ValueError as e:
+        return await message.answer(f"Lot refusé: {e}")
+    if not rows:
+        return await message.answer(usage)
+    await answer_chunks(message, apply(rows))
+
+@router.message(Command("paybulk"))
+async def cmd_paybulk(message: Message, bot: Bot):
+    await _run_bulk(
+        message, bot,
+        "Usage: /paybulk puis une ligne par paie (ou un fichier .txt/.csv en pièce jointe):\n"
+        "<code>tg_id montant méthode [note]</code>",
+        _parse_pay_line, apply_bulk_payroll,
+    )
+
+@router.message(Command("presencebulk"))
+async def cmd_presencebulk(message: Message, bot: Bot):
+    await _run_bulk(
+        message, bot,
+        "Usage: /presencebulk puis une ligne par travailleur (ou un fichier en pièce jointe):\n"
+        "<code>tg_id PRESENT|ABSENT [rôle]</code>",
+        _parse_presence_line, apply_bulk_presence,
+    )
+
+@router.message(Command("workers"))
+async def cmd_workers(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("Accès refusé")
+    await send_listing(message, "wrk")
+
+@router.message(Command("post"))
+async def cmd_post(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("Accès refusé")
+    text = message.text.partition(" ")[2].strip()
+    if not text:
+        return await message.answer("Usage: /post <message>")
+    with db() as s:
         p = Post(text=text)
         s.add(p)
         s.commit()
-    await message.answer("Annonce enregistrée ✅ – /broadcast pour envoyer")
+    invalidate_feed()
+    await message.answer("Annonce enregistrée ✅ – /broadcast [segment] pour envoyer")
+
+# --- Audiences de diffusion ---
+# Chaque segment est une requête sur index (users.role, orders.created_at,
+# products.sku -> order_items.product_id) qui ne renvoie que des tg_id ; la
+# diffusion les recopie directement dans l'outbox (INSERT … SELECT), sans
+# charger la table users, et l'outbox les envoie au rythme de OUTBOX_RATE.
+SEGMENTS_HELP = "tous | clients | travailleurs | acheteurs:<jours> | produit:<SKU>"
+
+def segment_query(spec: str) -> Select:
+    """Requête des tg_id du segment ``spec`` ; ValueError si inconnu."""
+    name, _, arg = spec.strip().partition(":")
+    name = name.lower()
+    if name in ("", "tous"):
+        return select(User.tg_id)
+    if name == "clients":
+        return select(User.tg_id).where(User.role == UserRole.CUSTOMER.value)
+    if name == "travailleurs":
+        return select(User.tg_id).where(User.role == UserRole.WORKER.value)
+    if name == "acheteurs":
+        days = int(arg) if arg else 30
+        if days <= 0:
+            raise ValueError("jours")
+        since = dt.datetime.utcnow() - dt.timedelta(days=days)
+        return select(User.tg_id).join(Order, Order.user_id == User.id).where(Order.created_at >= since).distinct()
+    if name == "produit" and arg:
+        return (
+            select(User.tg_id)
+            .join(Order, Order.user_id == User.id)
+            .join(OrderItem, OrderItem.order_id == Order.id)
+            .join(Product, Product.id == OrderItem.product_id)
+            .where(Product.sku == arg.upper())
+            .distinct()
+        )
+    raise ValueError(spec)
+
+def enqueue_segment(s: Session, spec: str, text: str, kind: str = "post") -> int:
+    """Met ``text`` en outbox pour chaque membre du segment ; renvoie le nombre de destinataires."""
+    query = segment_query(spec)
+    with db_read() as r:
+        if r.get_bind() is not s.get_bind():
+            # Copie de lecture disponible : le segment y est calculé, le
+            # primaire ne reçoit que l'insertion groupée.
+            chat_ids = r.scalars(query).all()
+            if chat_ids:
+                s.execute(insert(OutboxMessage), [{"chat_id": c, "kind": kind, "text": text} for c in chat_ids])
+            return len(chat_ids)
+    now = dt.datetime.utcnow()
+    members = query.add_columns(
+        literal(kind), literal(text), literal(now, DateTime), literal(now, DateTime), literal(0),
+    )
+    o = OutboxMessage.__table__.c
+    result = s.execute(
+        insert(OutboxMessage.__table__).from_select(
+            [o.chat_id, o.kind, o.text, o.created_at, o.next_attempt_at, o.attempts], members,
+        )
+    )
+    return result.rowcount
 
 @router.message(Command("broadcast"))
 async def cmd_broadcast(message: Message):
     if not is_admin(message.from_user.id):
         return await message.answer("Accès refusé")
+    spec = message.text.partition(" ")[2].strip() or "tous"
     with db() as s:
-        users = s.query(User).all()
-        last_post = s.query(Post).order_by(Post.created_at.desc()).first()
-    if not last_post:
-        return await message.answer("Aucune annonce à diffuser.")
-    sent = 0
-    for u in users:
+        last_post = s.query(Post).order_by(Post.created_at.desc(), Post.id.desc()).first()
+        if not last_post:
+            return await message.answer("Aucune annonce à diffuser.")
         try:
-            await bot.send_message(u.tg_id, f"📰 <b>Annonce</b>\n\n{last_post.text}")
-            sent += 1
-        except Exception:
-            continue
-    await message.answer(f"Diffusion terminée. Envoyé à {sent} utilisateurs.")
+            n = enqueue_segment(s, spec, f"📰 <b>Annonce</b>\n\n{last_post.text}")
+        except ValueError:
+            return await message.answer(f"Usage: /broadcast [{html.escape(SEGMENTS_HELP)}]")
+        s.commit()
+    await message.answer(f"📣 Diffusion programmée ({html.escape(spec)}) : {n} destinataire(s), envoi progressif via l'outbox.")
 
-@router.message(Command("stats")))
-async def cmd_stats(message: Message):
+# --- Recrutement : candidatures filtrées, paginées, traitées par lots ---
+# Statut et dates passent par l'index (status, created_at) ; poste et mots-clés
+# par l'index en mémoire JobSearch. Les filtres de /jobs restent dans l'état
+# FSM de l'admin : pagination et « /jobstatus … filtre » les réutilisent.
+JOBS_HELP = "[statut:<statut>] [poste:<mot>] [du:AAAA-MM-JJ] [au:AAAA-MM-JJ] [mots-clés]"
+JOB_STATUS_ICONS = {
+    JobStatus.RECEIVED.value: "📥",
+    JobStatus.SHORTLISTED.value: "⭐",
+    JobStatus.INTERVIEW.value: "🗓️",
+    JobStatus.HIRED.value: "✅",
+    JobStatus.REJECTED.value: "❌",
+}
+JOB_STATUS_MESSAGES = {
+    JobStatus.SHORTLISTED.value: "⭐ Votre candidature au poste « {position} » a été présélectionnée. Nous vous recontacterons bientôt.",
+    JobStatus.INTERVIEW.value: "🗓️ Vous êtes invité(e) à un entretien pour le poste « {position} ». Nous vous contacterons pour fixer la date.",
+    JobStatus.HIRED.value: "🎉 Félicitations ! Votre candidature au poste « {position} » est retenue.",
+    JobStatus.REJECTED.value: "Merci pour votre candidature au poste « {position} ». Nous ne pouvons pas y donner suite pour le moment.",
+}
+
+def parse_job_filters(args: str) -> Dict[str, str]:
+    """« statut:recu poste:vendeur du:2024-05-01 caisse » -> filtres ; ValueError si invalide."""
+    filters: Dict[str, str] = {}
+    words = []
+    for token in args.split():
+        key, sep, value = token.partition(":")
+        key = key.lower()
+        if sep and key == "statut":
+            filters["status"] = JobStatus(value.lower()).value
+        elif sep and key == "poste":
+            filters["position"] = " ".join(filter(None, (filters.get("position"), value)))
+        elif sep and key in ("du", "au"):
+            filters["since" if key == "du" else "until"] = dt.date.fromisoformat(value).isoformat()
+        else:
+            words.append(token)
+    if words:
+        filters["query"] = " ".join(words)
+    return filters
+
+def jobs_query(status: Optional[str] = None, position: Optional[str] = None, since: Optional[str] = None,
+               until: Optional[str] = None, query: Optional[str] = None) -> Select:
+    q = select(
+        JobApplication.id, JobApplication.created_at, JobApplication.applicant_name,
+        JobApplication.position, JobApplication.status, JobApplication.contact,
+    )
+    if status:
+        q = q.where(JobApplication.status == status)
+    if since:
+        q = q.where(JobApplication.created_at >= dt.datetime.fromisoformat(since))
+    if until:
+        q = q.where(JobApplication.created_at < dt.datetime.fromisoformat(until) + dt.timedelta(days=1))
+    if query or position:
+        q = q.where(JobApplication.id.in_(sorted(job_search_index().match(query, position))))
+    return q
+
+Listing(
+    "job", "👔 <b>Candidatures</b>:", "Aucune candidature",
+    query=jobs_query,
+    order=[(JobApplication.created_at, True), (JobApplication.id, True)],
+    render=lambda r: (
+        f"{JOB_STATUS_ICONS.get(r.status, '•')} #{r.id} {r.created_at:%d/%m} – {html.escape(r.applicant_name or '')}"
+        f" – {html.escape(r.position or '')} – {html.escape(r.contact or '')}"
+    ),
+)
+
+def job_ids_clause(tokens: List[str]):
+    """« 12 15,18 20-40 » -> condition sur JobApplication.id ; ValueError si vide ou invalide."""
+    singles, clauses = [], []
+    for token in re.split(r"[,\s]+", " ".join(tokens).strip()):
+        lo, sep, hi = token.partition("-")
+        if sep:
+            clauses.append(JobApplication.id.between(int(lo), int(hi)))
+        else:
+            singles.append(int(token))
+    if singles:
+        clauses.append(JobApplication.id.in_(singles))
+    return or_(*clauses)
+
+def set_job_status(s: Session, selection: Select, status: str) -> Tuple[int, int]:
+    """Passe au statut ``status`` les candidatures de ``selection`` (un seul UPDATE)
+    et met en outbox le message du statut pour chaque candidat joignable.
+    Renvoie (candidatures modifiées, candidats prévenus) ; à valider par l'appelant."""
+    targets = selection.with_only_columns(JobApplication.id).where(JobApplication.status != status)
+    rows = s.execute(
+        select(JobApplication.applicant_tg_id, JobApplication.position).where(JobApplication.id.in_(targets))
+    ).all()
+    if not rows:
+        return 0, 0
+    s.execute(
+        update(JobApplication)
+        .where(JobApplication.id.in_(targets))
+        .values(status=status)
+        .execution_options(synchronize_session=False)
+    )
+    template = JOB_STATUS_MESSAGES.get(status)
+    notes = [
+        {"chat_id": r.applicant_tg_id, "kind": "job_status", "text": template.format(position=html.escape(r.position or ""))}
+        for r in rows if template and r.applicant_tg_id
+    ]
+    if notes:
+        s.execute(insert(OutboxMessage), notes)
+    return len(rows), len(notes)
+
+@router.message(Command("jobs"))
+async def cmd_jobs(message: Message, state: FSMContext):
     if not is_admin(message.from_user.id):
         return await message.answer("Accès refusé")
+    try:
+        filters = parse_job_filters(message.text.partition(" ")[2])
+    except ValueError:
+        return await message.answer(
+            f"Usage: /jobs {html.escape(JOBS_HELP)}\nStatuts : {' | '.join(st.value for st in JobStatus)}"
+        )
+    await state.update_data(**{"ls.job": filters})
+    await send_listing(message, "job", filters)
+
+@router.message(Command("jobstatus"))
+async def cmd_jobstatus(message: Message, state: FSMContext):
+    if not is_admin(message.from_user.id):
+        return await message.answer("Accès refusé")
+    parts = message.text.split()[1:]
+    try:
+        status = JobStatus(parts[0].lower()).value
+        if parts[1:] == ["filtre"]:
+            selection = jobs_query(**((await state.get_data()).get("ls.job") or {}))
+        else:
+            selection = select(JobApplication.id).where(job_ids_clause(parts[1:]))
+    except (IndexError, ValueError):
+        return await message.answer(
+            "Usage: /jobstatus &lt;statut&gt; &lt;ids | a-b | filtre&gt;\n"
+            f"Statuts : {' | '.join(st.value for st in JobStatus)}"
+        )
     with db() as s:
+        changed, notified = set_job_status(s, selection, status)
+        s.commit()
+    await message.answer(
+        f"{JOB_STATUS_ICONS[status]} {changed} candidature(s) passée(s) en « {status} » – "
+        f"{notified} candidat(s) prévenu(s) via l'outbox."
+    )
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("Accès refusé")
+    with db_read() as s:
         today = dt.datetime.utcnow().date()
         start_day = dt.datetime.combine(today, dt.time.min)
         end_day = dt.datetime.combine(today, dt.time.max)
@@ -1092,9 +2521,1320 @@ async def cmd_stats(message: Message):
         f"Commandes semaine: <b>{week_count}</b> – CA: <b>{round(ca_week,2)} CFA</b> – Ticket moyen: {avg_ticket_week} CFA\n"
     )
 
-def export_products_csv() -> str:
-    path = "products_export.csv"
+# ---------------------------------------------------------------------------
+# Analytique des ventes (agrégats pré-calculés, mis à jour incrémentalement)
+# ---------------------------------------------------------------------------
+# sales_hourly (commandes & CA par heure) et product_sales_daily (quantités
+# & CA par produit et par jour) sont alimentées à partir des commandes dont
+# l'id dépasse le filigrane « sales_rollup_order_id » : chaque rafraîchissement
+# ne lit que les nouvelles commandes. PostgreSQL attribue les id avant le
+# commit : une commande d'id plus petit peut être validée après une plus
+# grande, le filigrane ne passe donc que les commandes créées il y a plus de
+# ROLLUP_LAG_S secondes (SQLite n'a qu'un écrivain, ses id suivent l'ordre des
+# commits). Une commande déjà agrégée qui change (total, date, lignes) marque
+# son jour dans sales_rollup_dirty ; le rafraîchissement suivant le recalcule.
+ROLLUP_BATCH = 2000
+ROLLUP_LAG_S = env_int("ROLLUP_LAG_S", 120)
+WEEKDAYS_FR = ["Lun", "Mar", "Mer", "Jeu", "Ven", "Sam", "Dim"]
+_ROLLUP_FIELDS = {Order: ("total", "created_at"), OrderItem: ("order_id", "product_id", "qty", "unit_price")}
+
+def _mark_sales_days(connection, days: set):
+    t = SalesRollupDirty.__table__
+    backend = connection.dialect.name
+    if backend in ("sqlite", "postgresql"):
+        if backend == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        connection.execute(upsert(t).on_conflict_do_nothing(), [{"day": d} for d in days])
+        return
+    days = days - set(connection.scalars(select(t.c.day).where(t.c.day.in_(days))))
+    if days:
+        connection.execute(insert(t), [{"day": d} for d in days])
+
+def _queue_sales_days(connection, target, deleted: bool):
+    # Écrit sur la connexion du flush : le marquage est validé avec la modification.
+    history = [inspect(target).attrs[f].history for f in _ROLLUP_FIELDS[type(target)]]
+    if not deleted and not any(h.has_changes() for h in history):
+        return
+    if isinstance(target, Order):
+        stamps = [target.created_at, *history[1].deleted]
+    else:
+        ids = {target.order_id, *history[0].deleted} - {None}
+        stamps = connection.scalars(select(Order.created_at).where(Order.id.in_(ids))).all() if ids else []
+    days = {d.date() for d in stamps if d is not None}
+    if days:
+        _mark_sales_days(connection, days)
+
+@event.listens_for(Order, "before_update")
+@event.listens_for(OrderItem, "before_update")
+def _sales_row_updated(mapper, connection, target):
+    _queue_sales_days(connection, target, deleted=False)
+
+@event.listens_for(Order, "before_delete")
+@event.listens_for(OrderItem, "before_delete")
+def _sales_row_deleted(mapper, connection, target):
+    _queue_sales_days(connection, target, deleted=True)
+
+def _fold_orders(s: Session, orders, items):
+    """Ajoute des commandes (id, created_at, total) et leurs lignes aux agrégats."""
+    hourly: Dict[dt.datetime, list] = defaultdict(lambda: [0, Decimal(0)])
+    order_day: Dict[int, dt.date] = {}
+    for o in orders:
+        created = o.created_at or dt.datetime.utcnow()
+        bucket = hourly[created.replace(minute=0, second=0, microsecond=0)]
+        bucket[0] += 1
+        bucket[1] += Decimal(o.total or 0)
+        order_day[o.id] = created.date()
+    daily: Dict[Tuple[dt.date, int], list] = defaultdict(lambda: [0, Decimal(0)])
+    for it in items:
+        bucket = daily[(order_day[it.order_id], it.product_id)]
+        bucket[0] += it.qty or 0
+        bucket[1] += Decimal(it.qty or 0) * Decimal(it.unit_price or 0)
+    existing_h = {r.hour: r for r in s.query(SalesHourly).filter(SalesHourly.hour.in_(list(hourly)))}
+    for hour, (n, revenue) in hourly.items():
+        row = existing_h.get(hour)
+        if row is None:
+            s.add(SalesHourly(hour=hour, orders=n, revenue=revenue))
+        else:
+            row.orders += n
+            row.revenue = Decimal(row.revenue or 0) + revenue
+    days = {d for d, _ in daily}
+    existing_d = {
+        (r.day, r.product_id): r
+        for r in s.query(ProductSalesDaily).filter(ProductSalesDaily.day.in_(days))
+    } if days else {}
+    for (day, pid), (qty, revenue) in daily.items():
+        row = existing_d.get((day, pid))
+        if row is None:
+            s.add(ProductSalesDaily(day=day, product_id=pid, qty=qty, revenue=revenue))
+        else:
+            row.qty += qty
+            row.revenue = Decimal(row.revenue or 0) + revenue
+
+def refresh_sales_rollups() -> int:
+    """Intègre les nouvelles commandes aux agrégats. Appelée depuis des threads
+    (to_thread) : un verrou par boutique sérialise les rafraîchissements du
+    processus, et le filigrane n'avance que s'il n'a pas bougé (autres processus)."""
+    with shop_lock("rollups"):
+        _recompute_dirty_days()
+        return _refresh_sales_rollups()
+
+def _recompute_dirty_days() -> int:
+    # Jours déjà partiellement archivés : les agrégats en sont la seule trace complète.
+    horizon = (dt.datetime.utcnow() - dt.timedelta(days=max(ARCHIVE_AFTER_DAYS, FORECAST_HISTORY_DAYS))).date()
+    done = 0
+    with db() as s:
+        days = s.scalars(select(SalesRollupDirty.day)).all()
+        if not days:
+            return 0
+        stored = meta_get(s, "sales_rollup_order_id")
+        watermark = int(stored or 0)
+        for day in days:
+            # Ligne déjà supprimée : un autre processus recalcule ce jour.
+            if s.execute(delete(SalesRollupDirty).where(SalesRollupDirty.day == day)).rowcount != 1:
+                continue
+            if day <= horizon:
+                continue
+            start = dt.datetime.combine(day, dt.time.min)
+            end = start + dt.timedelta(days=1)
+            s.execute(delete(SalesHourly).where(SalesHourly.hour >= start, SalesHourly.hour < end))
+            s.execute(delete(ProductSalesDaily).where(ProductSalesDaily.day == day))
+            in_day = and_(Order.id <= watermark, Order.created_at >= start, Order.created_at < end)
+            orders = s.execute(select(Order.id, Order.created_at, Order.total).where(in_day)).all()
+            items = s.execute(
+                select(OrderItem.order_id, OrderItem.product_id, OrderItem.qty, OrderItem.unit_price)
+                .where(OrderItem.order_id.in_(select(Order.id).where(in_day)))
+            )
+            _fold_orders(s, orders, items)
+            done += 1
+        # Un lot intégré entre-temps par un autre processus fausserait le recalcul.
+        if stored is not None and not meta_swap(s, "sales_rollup_order_id", stored, stored):
+            s.rollback()
+            return 0
+        s.commit()
+    return done
+
+def _rollup_lag(s: Session) -> int:
+    return 0 if s.get_bind().dialect.name == "sqlite" else ROLLUP_LAG_S
+
+def _refresh_sales_rollups() -> int:
+    processed = 0
+    with db() as s:
+        lag = _rollup_lag(s)
+        stored = meta_get(s, "sales_rollup_order_id")
+        watermark = int(stored or 0)
+        caught_up = False
+        while not caught_up:
+            orders = s.execute(
+                select(Order.id, Order.created_at, Order.total)
+                .where(Order.id > watermark)
+                .order_by(Order.id)
+                .limit(ROLLUP_BATCH)
+            ).all()
+            if lag:
+                # Préfixe seulement : au-delà de la première commande récente, un id
+                # plus petit pourrait encore être en cours de validation.
+                cutoff = dt.datetime.utcnow() - dt.timedelta(seconds=lag)
+                recent = next((i for i, o in enumerate(orders) if (o.created_at or dt.datetime.min) >= cutoff), None)
+                if recent is not None:
+                    orders, caught_up = orders[:recent], True
+            if not orders:
+                break
+            last = orders[-1].id
+            items = s.execute(
+                select(OrderItem.order_id, OrderItem.product_id, OrderItem.qty, OrderItem.unit_price)
+                .where(OrderItem.order_id > watermark, OrderItem.order_id <= last)
+            )
+            _fold_orders(s, orders, items)
+            if not meta_swap(s, "sales_rollup_order_id", stored, last):
+                s.rollback()  # lot déjà intégré ailleurs : ne pas le compter deux fois
+                break
+            s.commit()
+            watermark, stored = last, str(last)
+            processed += len(orders)
+    return processed
+
+def top_products(since: dt.date, limit: int = 10) -> list:
+    qty = func.sum(ProductSalesDaily.qty).label("qty")
+    revenue = func.sum(ProductSalesDaily.revenue).label("revenue")
+    with db() as s:
+        return s.execute(
+            select(Product.name, qty, revenue)
+            .join(Product, Product.id == ProductSalesDaily.product_id)
+            .where(ProductSalesDaily.day >= since)
+            .group_by(ProductSalesDaily.product_id, Product.name)
+            .order_by(revenue.desc())
+            .limit(limit)
+        ).all()
+
+def hourly_totals(start: dt.datetime, end: dt.datetime) -> Tuple[int, float]:
+    with db() as s:
+        n, revenue = s.execute(
+            select(func.coalesce(func.sum(SalesHourly.orders), 0), func.coalesce(func.sum(SalesHourly.revenue), 0))
+            .where(SalesHourly.hour >= start, SalesHourly.hour < end)
+        ).one()
+    return int(n), float(revenue)
+
+def heatmap_grid(weeks: int) -> List[List[int]]:
+    """Matrice 7 x 24 (jour de semaine x heure UTC) des commandes des N dernières semaines."""
+    start = dt.datetime.combine(dt.datetime.utcnow().date() - dt.timedelta(weeks=weeks), dt.time.min)
+    grid = [[0] * 24 for _ in range(7)]
+    with db() as s:
+        for hour, n in s.execute(select(SalesHourly.hour, SalesHourly.orders).where(SalesHourly.hour >= start)):
+            grid[hour.weekday()][hour.hour] += n
+    return grid
+
+def render_heatmap(grid: List[List[int]]) -> str:
+    shades = " ░▒▓█"
+    peak = max(max(row) for row in grid) or 1
+    lines = ["    " + "".join(f"{h:<6d}" for h in range(0, 24, 6))]
+    for day, row in zip(WEEKDAYS_FR, grid):
+        lines.append(day + " " + "".join(shades[min(4, -(-n * 4 // peak))] for n in row))
+    return "\n".join(lines)
+
+def _pct(now: float, before: float) -> str:
+    if not before:
+        return "–"
+    return f"{(now - before) / before * 100:+.0f}%"
+
+@router.message(Command("top"))
+async def cmd_top(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("Accès refusé")
+    parts = message.text.strip().split()
+    try:
+        days = int(parts[1]) if len(parts) > 1 else 7
+    except ValueError:
+        return await message.answer("Usage: /top [jours]")
+    await asyncio.to_thread(refresh_sales_rollups)
+    since = dt.datetime.utcnow().date() - dt.timedelta(days=max(days, 1) - 1)
+    rows = top_products(since)
+    if not rows:
+        return await message.answer("Aucune vente sur la période.")
+    lines = [f"🏆 <b>Meilleures ventes – {days} jour(s)</b>"]
+    for i, r in enumerate(rows, start=1):
+        lines.append(f"{i}. {html.escape(r.name or '?')} – {r.qty} vendu(s) – {round(float(r.revenue or 0), 2)} CFA")
+    await message.answer("\n".join(lines))
+
+@router.message(Command("heatmap"))
+async def cmd_heatmap(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("Accès refusé")
+    parts = message.text.strip().split()
+    try:
+        weeks = max(1, int(parts[1])) if len(parts) > 1 else 4
+    except ValueError:
+        return await message.answer("Usage: /heatmap [semaines]")
+    await asyncio.to_thread(refresh_sales_rollups)
+    grid = heatmap_grid(weeks)
+    total = sum(map(sum, grid))
+    if not total:
+        return await message.answer("Aucune commande sur la période.")
+    await message.answer(
+        f"🔥 <b>Commandes par jour et heure (UTC) – {weeks} semaine(s)</b>, {total} commande(s)\n"
+        f"<pre>{render_heatmap(grid)}</pre>"
+    )
+
+@router.message(Command("compare"))
+async def cmd_compare(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("Accès refusé")
+    await asyncio.to_thread(refresh_sales_rollups)
+    now = dt.datetime.utcnow()
+    week_start = dt.datetime.combine(now.date() - dt.timedelta(days=now.weekday()), dt.time.min)
+    n_now, ca_now = hourly_totals(week_start, now)
+    n_prev, ca_prev = hourly_totals(week_start - dt.timedelta(weeks=1), now - dt.timedelta(weeks=1))
+    ticket_now = ca_now / n_now if n_now else 0.0
+    ticket_prev = ca_prev / n_prev if n_prev else 0.0
+    await message.answer(
+        "📈 <b>Semaine en cours vs même période S-1</b>\n"
+        f"Commandes: <b>{n_now}</b> vs {n_prev} ({_pct(n_now, n_prev)})\n"
+        f"CA: <b>{round(ca_now, 2)} CFA</b> vs {round(ca_prev, 2)} CFA ({_pct(ca_now, ca_prev)})\n"
+        f"Ticket moyen: <b>{round(ticket_now, 2)} CFA</b> vs {round(ticket_prev, 2)} CFA ({_pct(ticket_now, ticket_prev)})"
+    )
+
+# ---------------------------------------------------------------------------
+# Relevés des travailleurs (cumuls journaliers paie & présence)
+# ---------------------------------------------------------------------------
+# worker_daily garde, par travailleur et par jour, le total payé, le nombre
+# de paies et de pointages PRESENT / ABSENT. record_payroll / record_shift
+# accumulent dans session.info ; à la validation, un seul UPSERT applique
+# tous les cumuls de la transaction. Relevés et synthèse d'équipe ne lisent
+# que ces cumuls : une ligne par jour et par travailleur, quel que soit le
+# nombre de paies ou de pointages.
+STATEMENT_MAX_DAYS = env_int("STATEMENT_MAX_DAYS", 366)
+_WORKER_DAY_FIELDS = ("paid", "payments", "present", "absent")
+
+def bump_worker_day(s: Session, worker_id: int, day: dt.date, **inc):
+    pending = s.info.setdefault("worker_daily", {})
+    row = pending.setdefault((worker_id, day), dict.fromkeys(_WORKER_DAY_FIELDS, 0))
+    for field, value in inc.items():
+        row[field] += value
+
+def upsert_worker_days(s: Session, rows: List[dict]):
+    """Ajoute les incréments ``rows`` aux cumuls existants (INSERT … ON CONFLICT)."""
+    t = WorkerDaily.__table__
+    backend = s.get_bind().dialect.name
+    if backend in ("sqlite", "postgresql"):
+        if backend == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        stmt = upsert(t)
+        s.execute(stmt.on_conflict_do_update(
+            index_elements=[t.c.worker_id, t.c.day],
+            set_={f: t.c[f] + stmt.excluded[f] for f in _WORKER_DAY_FIELDS},
+        ), rows)
+        return
+    for r in rows:
+        current = s.get(WorkerDaily, (r["worker_id"], r["day"]))
+        if current is None:
+            s.add(WorkerDaily(**r))
+        else:
+            for f in _WORKER_DAY_FIELDS:
+                setattr(current, f, (getattr(current, f) or 0) + r[f])
+    s.flush()
+
+@event.listens_for(Session, "before_commit")
+def _apply_worker_days(session):
+    pending = session.info.pop("worker_daily", None)
+    if pending:
+        upsert_worker_days(session, [
+            {"worker_id": w, "day": d, **{**inc, "paid": round(inc["paid"], 2)}} for (w, d), inc in pending.items()
+        ])
+
+@event.listens_for(Session, "after_rollback")
+def _drop_worker_days(session):
+    session.info.pop("worker_daily", None)
+
+def rebuild_worker_daily(s: Session) -> int:
+    """Recalcule worker_daily depuis payroll et shifts ; renvoie le nombre de lignes."""
+    rows: Dict[tuple, dict] = {}
+
+    def acc(worker_id, day, **values):
+        row = rows.setdefault((worker_id, day), dict.fromkeys(_WORKER_DAY_FIELDS, 0))
+        row.update(values)
+
+    pay_day = func.date(Payroll.date, type_=Date)
+    for wid, day, paid, n in s.execute(
+        select(Payroll.worker_id, pay_day, func.sum(Payroll.amount), func.count())
+        .where(Payroll.worker_id.isnot(None), Payroll.date.isnot(None))
+        .group_by(Payroll.worker_id, pay_day)
+    ):
+        acc(wid, day, paid=paid or 0, payments=n)
+    shift_day = func.date(Shift.date, type_=Date)
+    for wid, day, present, absent in s.execute(
+        select(
+            Shift.worker_id, shift_day,
+            func.sum(case((Shift.status == ShiftStatus.PRESENT.value, 1), else_=0)),
+            func.sum(case((Shift.status == ShiftStatus.PRESENT.value, 0), else_=1)),
+        )
+        .where(Shift.worker_id.isnot(None), Shift.date.isnot(None))
+        .group_by(Shift.worker_id, shift_day)
+    ):
+        acc(wid, day, present=present, absent=absent)
+    s.execute(delete(WorkerDaily))
+    if rows:
+        s.execute(insert(WorkerDaily.__table__), [{"worker_id": w, "day": d, **v} for (w, d), v in rows.items()])
+    return len(rows)
+
+def parse_period(args: List[str], default_days: int) -> Tuple[dt.date, dt.date]:
+    """[du] [au] en AAAA-MM-JJ ; par défaut les ``default_days`` derniers jours. ValueError si invalide."""
+    if len(args) > 2:
+        raise ValueError("trop d'arguments")
+    end = dt.date.fromisoformat(args[1]) if len(args) > 1 else dt.datetime.utcnow().date()
+    start = dt.date.fromisoformat(args[0]) if args else end - dt.timedelta(days=default_days - 1)
+    if start > end or (end - start).days >= STATEMENT_MAX_DAYS:
+        raise ValueError("période")
+    return start, end
+
+def worker_statement(s: Session, tg_id: int, start: dt.date, end: dt.date):
+    """(travailleur, cumuls journaliers de la période) ; travailleur None si inconnu."""
+    worker = s.execute(
+        select(User.id, User.tg_id, User.first_name, User.last_name).where(User.tg_id == tg_id)
+    ).first()
+    if worker is None:
+        return None, []
+    days = s.execute(
+        select(WorkerDaily.day, WorkerDaily.paid, WorkerDaily.payments, WorkerDaily.present, WorkerDaily.absent)
+        .where(WorkerDaily.worker_id == worker.id, WorkerDaily.day.between(start, end))
+        .order_by(WorkerDaily.day)
+    ).all()
+    return worker, days
+
+def _worker_label(worker) -> str:
+    name = " ".join(filter(None, (worker.first_name, worker.last_name)))
+    return f"{html.escape(name)} ({worker.tg_id})" if name else str(worker.tg_id)
+
+def statement_totals(days) -> Dict[str, float]:
+    paid = round(sum(float(d.paid or 0) for d in days), 2)
+    present = sum(1 for d in days if d.present)
+    absent = sum(1 for d in days if d.absent and not d.present)
+    return {
+        "paid": paid,
+        "payments": sum(d.payments or 0 for d in days),
+        "present": present,
+        "absent": absent,
+        "per_day": round(paid / present, 2) if present else 0.0,
+    }
+
+def _presence_label(d) -> str:
+    if d.present:
+        return "✅ présent" if not d.absent else f"✅ présent ({d.absent} absence(s) pointée(s))"
+    return "❌ absent" if d.absent else "—"
+
+def render_statement(worker, days, start: dt.date, end: dt.date) -> List[str]:
+    lines = [f"🧾 <b>Relevé</b> – {_worker_label(worker)}", f"Du {start:%d/%m/%Y} au {end:%d/%m/%Y}"]
+    for d in days:
+        pay = f"{round(float(d.paid or 0), 2)} CFA ({d.payments} paie(s))" if d.payments else "pas de paie"
+        lines.append(f"• {d.day:%d/%m} – {_presence_label(d)} – {pay}")
+    t = statement_totals(days)
+    lines.append(
+        f"Total payé: <b>{t['paid']} CFA</b> ({t['payments']} paie(s)) – Jours présents: <b>{t['present']}</b>"
+        f" – Absences: {t['absent']} – Moyenne par jour présent: {t['per_day']} CFA"
+    )
+    return lines
+
+def render_payslip(worker, days, start: dt.date, end: dt.date) -> str:
+    """Bulletin HTML autonome (imprimable depuis le téléphone)."""
+    t = statement_totals(days)
+    rows = "\n".join(
+        f"<tr><td>{d.day:%d/%m/%Y}</td><td>{html.escape(_presence_label(d))}</td>"
+        f"<td class=n>{d.payments or 0}</td><td class=n>{round(float(d.paid or 0), 2)}</td></tr>"
+        for d in days
+    )
+    return (
+        "<!DOCTYPE html><html lang=fr><head><meta charset=utf-8>"
+        f"<title>Bulletin {worker.tg_id} {start:%d/%m/%Y}–{end:%d/%m/%Y}</title>"
+        "<style>body{font-family:sans-serif;margin:2em}table{border-collapse:collapse;width:100%}"
+        "td,th{border:1px solid #999;padding:4px 8px}.n{text-align:right}</style></head><body>"
+        f"<h1>Bulletin de paie</h1><p><b>{_worker_label(worker)}</b><br>"
+        f"Période du {start:%d/%m/%Y} au {end:%d/%m/%Y}</p>"
+        "<table><tr><th>Jour</th><th>Présence</th><th>Paies</th><th>Montant (CFA)</th></tr>"
+        f"{rows}</table>"
+        f"<p>Total payé : <b>{t['paid']} CFA</b> ({t['payments']} paie(s))<br>"
+        f"Jours présents : {t['present']} – Absences : {t['absent']}<br>"
+        f"Moyenne par jour présent : {t['per_day']} CFA</p>"
+        f"<p><small>Édité le {dt.datetime.utcnow():%d/%m/%Y %H:%M} UTC</small></p></body></html>"
+    )
+
+def build_payslip(tg_id: int, start: dt.date, end: dt.date) -> Optional[Tuple[str, bytes]]:
+    """(nom de fichier, contenu) du bulletin ; None si travailleur inconnu. Bloquant : via asyncio.to_thread."""
+    with db_read() as s:
+        worker, days = worker_statement(s, tg_id, start, end)
+    if worker is None:
+        return None
+    name = f"bulletin-{tg_id}-{start:%Y%m%d}-{end:%Y%m%d}.html"
+    return name, render_payslip(worker, days, start, end).encode("utf-8")
+
+@router.message(Command("statement"))
+async def cmd_statement(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("Accès refusé")
+    parts = message.text.strip().split()[1:]
+    try:
+        tg_id = int(parts[0])
+        start, end = parse_period(parts[1:], default_days=30)
+    except (IndexError, ValueError):
+        return await message.answer(
+            f"Usage: /statement &lt;tg_id&gt; [du] [au] – dates AAAA-MM-JJ, {STATEMENT_MAX_DAYS} jours max"
+        )
+    with db_read() as s:
+        worker, days = worker_statement(s, tg_id, start, end)
+    if worker is None:
+        return await message.answer("Utilisateur inconnu")
+    await answer_chunks(message, render_statement(worker, days, start, end), reply_markup=IKM(inline_keyboard=[[IKB(
+        text="📄 Bulletin de paie", callback_data=pack_cb("ps", tg_id, start.toordinal(), end.toordinal()),
+    )]]))
+
+@callback_action("ps", admin=True)
+async def cb_payslip(call: CallbackQuery, state: FSMContext, tg_id: int, start: int, end: int):
+    doc = await asyncio.to_thread(build_payslip, tg_id, dt.date.fromordinal(start), dt.date.fromordinal(end))
+    if doc is None:
+        return await call.answer("Utilisateur inconnu", show_alert=True)
+    await call.message.answer_document(BufferedInputFile(doc[1], filename=doc[0]))
+    await call.answer()
+
+@router.message(Command("crew"))
+async def cmd_crew(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("Accès refusé")
+    try:
+        start, end = parse_period(message.text.strip().split()[1:], default_days=7)
+    except ValueError:
+        return await message.answer(f"Usage: /crew [du] [au] – dates AAAA-MM-JJ, {STATEMENT_MAX_DAYS} jours max")
+    wd = WorkerDaily
+    paid = func.sum(wd.paid)
+    with db_read() as s:
+        rows = s.execute(
+            select(
+                User.tg_id, User.first_name, User.last_name, paid.label("paid"),
+                func.sum(wd.payments).label("payments"),
+                func.sum(case((wd.present > 0, 1), else_=0)).label("present"),
+                func.sum(case((and_(wd.present == 0, wd.absent > 0), 1), else_=0)).label("absent"),
+            )
+            .join(User, User.id == wd.worker_id)
+            .where(wd.day.between(start, end))
+            .group_by(User.id, User.tg_id, User.first_name, User.last_name)
+            .order_by(paid.desc(), User.tg_id)
+        ).all()
+    if not rows:
+        return await message.answer(f"Aucune paie ni pointage du {start:%d/%m/%Y} au {end:%d/%m/%Y}.")
+    lines = [f"👷 <b>Équipe du {start:%d/%m/%Y} au {end:%d/%m/%Y}</b>"]
+    for r in rows:
+        lines.append(
+            f"• {_worker_label(r)} – <b>{round(float(r.paid or 0), 2)} CFA</b> ({r.payments} paie(s))"
+            f" – présent {r.present} j – absent {r.absent} j"
+        )
+    total = round(sum(float(r.paid or 0) for r in rows), 2)
+    lines.append(f"Total payé: <b>{total} CFA</b> – {len(rows)} travailleur(s) – /statement &lt;tg_id&gt; pour le détail")
+    await answer_chunks(message, lines)
+
+# ---------------------------------------------------------------------------
+# Prévision de réassort (demande journalière issue des mouvements « vente »)
+# ---------------------------------------------------------------------------
+FORECAST_HISTORY_DAYS = env_int("FORECAST_HISTORY_DAYS", 180)
+FORECAST_MA_WINDOW = 28
+FORECAST_ALPHA = 0.3
+FORECAST_SHOW = 15
+_forecast_cache: Dict[str, object] = {}
+
+def forecast_cache() -> Dict[str, object]:
+    shop = current_shop()
+    return shop.forecast_cache if shop is not None else _forecast_cache
+
+def build_demand_matrix(product_idx, day_idx, qty, n_products: int, n_days: int):
+    """Matrice dense produits x jours à partir des triplets agrégés par SQL."""
+    import numpy as np
+    flat = np.asarray(product_idx, dtype=np.intp) * n_days + np.asarray(day_idx, dtype=np.intp)
+    weights = np.asarray(qty, dtype=np.float64)
+    return np.bincount(flat, weights=weights, minlength=n_products * n_days).reshape(n_products, n_days)
+
+def forecast_demand(demand, alpha: float = FORECAST_ALPHA, window: int = FORECAST_MA_WINDOW):
+    """Moyenne mobile et lissage exponentiel simple de toutes les séries d'un coup.
+
+    Le niveau lissé l_t = a*x_t + (1-a)*l_(t-1) (avec l_0 = x_0) se déroule en
+    une somme pondérée : un seul produit matrice-vecteur pour tout le catalogue.
+    """
+    import numpy as np
+    n_days = demand.shape[1]
+    moving_avg = demand[:, -window:].mean(axis=1)
+    weights = alpha * (1 - alpha) ** np.arange(n_days - 1, -1, -1, dtype=np.float64)
+    weights[0] = (1 - alpha) ** (n_days - 1)
+    return moving_avg, demand @ weights
+
+def days_of_cover(stock, daily_demand):
+    import numpy as np
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(daily_demand > 0, np.asarray(stock, dtype=np.float64) / daily_demand, np.inf)
+
+def restock_forecast(target_days: int) -> list:
+    """[(nom, sku, stock, demande/j, moyenne mobile/j, couverture j, qté à commander)]
+    triés par urgence. La demande retenue est le niveau lissé, jamais sous la
+    moyenne mobile : un creux de quelques jours ne fait pas sauter le réassort.
+
+    Mis en cache tant qu'aucun mouvement de stock n'est enregistré dans la journée.
+    """
+    import numpy as np
+    cache = forecast_cache()
     with db() as s:
+        last_movement = s.scalar(select(func.max(StockMovement.id)))
+        today = dt.datetime.utcnow().date()
+        # La fenêtre d'historique glisse chaque jour, même sans nouveau mouvement.
+        key = (last_movement, target_days, FORECAST_HISTORY_DAYS, today)
+        if cache.get("key") == key:
+            return cache["result"]
+        products = s.execute(
+            select(Product.id, Product.name, Product.sku, Product.stock_qty).where(Product.is_active == True)
+        ).all()
+        start = today - dt.timedelta(days=FORECAST_HISTORY_DAYS - 1)
+        day = func.date(StockMovement.created_at)
+        history = s.execute(
+            select(StockMovement.product_id, day, func.sum(-StockMovement.qty_change))
+            .where(StockMovement.reason == "vente", StockMovement.created_at >= dt.datetime.combine(start, dt.time.min))
+            .group_by(StockMovement.product_id, day)
+        ).all()
+    index = {p.id: i for i, p in enumerate(products)}
+    rows = [(index[pid], (dt.date.fromisoformat(str(d)) - start).days, q) for pid, d, q in history if pid in index]
+    result: list = []
+    if products:
+        p_idx, d_idx, qty = zip(*rows) if rows else ((), (), ())
+        demand = build_demand_matrix(p_idx, d_idx, qty, len(products), FORECAST_HISTORY_DAYS)
+        moving_avg, level = forecast_demand(demand)
+        daily = np.maximum(level, moving_avg)
+        stock = np.array([max(p.stock_qty or 0, 0) for p in products], dtype=np.float64)
+        cover = days_of_cover(stock, daily)
+        reorder = np.ceil(np.maximum(daily * target_days - stock, 0))
+        for i in np.argsort(cover, kind="stable"):
+            if not np.isfinite(cover[i]):
+                break
+            p = products[i]
+            result.append((p.name, p.sku, int(stock[i]), float(daily[i]), float(moving_avg[i]),
+                           float(cover[i]), int(reorder[i])))
+    cache.update(key=key, result=result)
+    return result
+
+@router.message(Command("forecast"))
+async def cmd_forecast(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("Accès refusé")
+    parts = message.text.strip().split()
+    try:
+        target = max(1, int(parts[1])) if len(parts) > 1 else 14
+    except ValueError:
+        return await message.answer("Usage: /forecast [jours de couverture visés]")
+    rows = restock_forecast(target)
+    if not rows:
+        return await message.answer("Pas assez d'historique de ventes pour prévoir.")
+    lines = [f"🔮 <b>Réassort – objectif {target} jour(s) de stock</b>"]
+    for name, sku, stock, daily, avg, cover, reorder in rows[:FORECAST_SHOW]:
+        lines.append(
+            f"• {html.escape(name or '')} ({html.escape(sku or '')}) – stock {stock} – "
+            f"~{daily:.1f}/j (moy. {FORECAST_MA_WINDOW} j : {avg:.1f}) – "
+            f"couverture {cover:.1f} j" + (f" – commander <b>{reorder}</b>" if reorder else "")
+        )
+    await message.answer("\n".join(lines))
+
+# ---------------------------------------------------------------------------
+# Outbox : envoi différé, regroupé et réessayé des notifications
+# ---------------------------------------------------------------------------
+# Les messages d'un même type vers un même chat accumulés depuis le dernier
+# passage partent en un seul résumé. Un message n'est marqué envoyé qu'après
+# réponse de Telegram (livraison au moins une fois) ; en cas d'échec il est
+# retenté avec un délai exponentiel plafonné à OUTBOX_MAX_BACKOFF.
+OUTBOX_INTERVAL = env_int("OUTBOX_INTERVAL_S", 60)
+OUTBOX_BATCH = env_int("OUTBOX_BATCH", 500)
+OUTBOX_RATE = float(os.getenv("OUTBOX_RATE", "25"))  # messages/s, sous la limite Telegram (~30/s)
+OUTBOX_MAX_BACKOFF = 3600
+OUTBOX_KEEP_DAYS = env_int("OUTBOX_KEEP_DAYS", 7)
+OUTBOX_DIGEST_LINES = 15
+DIGEST_TITLES = {
+    "order": "🆕 <b>{n} nouvelles commandes</b> {window} – total <b>{total} CFA</b>",
+    "payment": "💵 <b>{n} paiements</b> {window} – total <b>{total} CFA</b>",
+    "job": "👔 <b>{n} nouvelles postulations</b> {window}",
+}
+
+def _digest_window(since: dt.datetime, now: dt.datetime) -> str:
+    minutes = max(1, round((now - since).total_seconds() / 60))
+    return "dans la dernière minute" if minutes <= 1 else f"ces {minutes} dernières minutes"
+
+def render_outbox_group(kind: str, rows: list, now: dt.datetime) -> str:
+    if len(rows) == 1 or kind not in DIGEST_TITLES:
+        return rows[0].text
+    total = round(sum(float(r.amount or 0) for r in rows), 2)
+    since = min(r.created_at for r in rows)
+    lines = [DIGEST_TITLES[kind].format(n=len(rows), window=_digest_window(since, now), total=total)]
+    lines += [f"• {r.text}" for r in rows[:OUTBOX_DIGEST_LINES]]
+    if len(rows) > OUTBOX_DIGEST_LINES:
+        lines.append(f"… et {len(rows) - OUTBOX_DIGEST_LINES} autre(s)")
+    return fit_lines(lines)
+
+def _outbox_due(now: dt.datetime) -> list:
+    with db() as s:
+        return s.execute(
+            select(OutboxMessage.id, OutboxMessage.chat_id, OutboxMessage.kind, OutboxMessage.text,
+                   OutboxMessage.amount, OutboxMessage.created_at, OutboxMessage.attempts)
+            .where(OutboxMessage.sent_at.is_(None), OutboxMessage.dead_at.is_(None), OutboxMessage.next_attempt_at <= now)
+            .order_by(OutboxMessage.id)
+            .limit(OUTBOX_BATCH)
+        ).all()
+
+def _outbox_mark(ids: List[int], **values):
+    with db() as s:
+        s.execute(update(OutboxMessage).where(OutboxMessage.id.in_(ids)).values(**values))
+        s.commit()
+
+async def drain_outbox(bot: Bot) -> int:
+    """Envoie les notifications dues ; renvoie le nombre de messages Telegram émis."""
+    now = dt.datetime.utcnow()
+    groups: Dict[tuple, list] = {}
+    for row in _outbox_due(now):
+        key = (row.chat_id, row.kind) if row.kind in DIGEST_TITLES else (row.chat_id, row.kind, row.id)
+        groups.setdefault(key, []).append(row)
+    sent = 0
+    for rows in groups.values():
+        ids = [r.id for r in rows]
+        try:
+            await bot.send_message(rows[0].chat_id, render_outbox_group(rows[0].kind, rows, now))
+        except TelegramRetryAfter as e:
+            _outbox_mark(ids, next_attempt_at=now + dt.timedelta(seconds=e.retry_after), last_error=str(e))
+            break
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Chat bloqué ou message refusé : inutile d'insister.
+            _outbox_mark(ids, dead_at=now, last_error=str(e)[:500])
+            continue
+        except Exception as e:
+            attempts = max(r.attempts or 0 for r in rows) + 1
+            delay = min(OUTBOX_MAX_BACKOFF, 5 * 2 ** attempts)
+            _outbox_mark(ids, attempts=attempts, next_attempt_at=now + dt.timedelta(seconds=delay), last_error=str(e)[:500])
+            log.warning("Outbox: envoi vers %s reporté de %ss (%s)", rows[0].chat_id, delay, e)
+            continue
+        _outbox_mark(ids, sent_at=dt.datetime.utcnow())
+        sent += 1
+        if OUTBOX_RATE > 0 and len(groups) > 1:
+            await asyncio.sleep(1 / OUTBOX_RATE)
+    return sent
+
+async def outbox_loop(bot: Bot):
+    while True:
+        sent = 0
+        try:
+            sent = await drain_outbox(bot)
+        except Exception:
+            log.exception("Outbox: passage en échec")
+        # Après un passage non vide (diffusion en cours), on repasse aussitôt.
+        await asyncio.sleep(1 if sent else OUTBOX_INTERVAL)
+
+def _purge_outbox_batch(cutoff: dt.datetime) -> int:
+    with db() as s:
+        ids = s.scalars(
+            select(OutboxMessage.id)
+            .where(or_(OutboxMessage.sent_at < cutoff, OutboxMessage.dead_at < cutoff))
+            .limit(ARCHIVE_BATCH)
+        ).all()
+        if ids:
+            s.execute(delete(OutboxMessage).where(OutboxMessage.id.in_(ids)))
+            s.commit()
+    return len(ids)
+
+# ---------------------------------------------------------------------------
+# Archivage & purge (commandes, mouvements, écritures anciennes ; paniers)
+# ---------------------------------------------------------------------------
+# Les lignes plus vieilles que ARCHIVE_AFTER_DAYS sont copiées par lots dans
+# une base annexe (ARCHIVE_DB_URL, par défaut <base>_archive.db à côté de la
+# base SQLite) puis supprimées des tables chaudes. Chaque lot tourne dans un
+# thread, avec une pause entre deux lots pour laisser la main aux handlers.
+# Chaque lot d'écritures archivées laisse une écriture de report (libellé
+# LEDGER_CARRY_LABEL, jamais archivée ni modifiée) : un cumul BI sur les
+# exports, qui contiennent déjà les écritures d'origine, l'exclut.
+ARCHIVE_AFTER_DAYS = env_int("ARCHIVE_AFTER_DAYS", 365)
+ARCHIVE_BATCH = env_int("ARCHIVE_BATCH", 500)
+ARCHIVE_PAUSE = env_int("ARCHIVE_PAUSE_MS", 200) / 1000
+ARCHIVE_INTERVAL_HOURS = env_int("ARCHIVE_INTERVAL_HOURS", 24)
+CART_TTL_DAYS = env_int("CART_TTL_DAYS", 7)
+LEDGER_CARRY_LABEL = "Report à nouveau (écritures archivées)"
+
+archive_metadata = MetaData()
+ARCHIVE_TABLES: Dict[str, Table] = {
+    t.name: Table(t.name, archive_metadata, *[Column(c.name, c.type, primary_key=c.primary_key) for c in t.columns])
+    for t in (Order.__table__, OrderItem.__table__, LedgerEntry.__table__, StockMovement.__table__)
+}
+def archive_lock() -> asyncio.Lock:
+    return shop_lock("archive", asyncio.Lock)
+
+def archive_db_url() -> Optional[str]:
+    tenant = _tenant.get()
+    url = tenant.archive_url if tenant is not None else os.getenv("ARCHIVE_DB_URL")
+    if url:
+        return url
+    main_url = make_url(current_db_url())
+    if main_url.get_backend_name() == "sqlite" and main_url.database not in (None, "", ":memory:"):
+        root, ext = os.path.splitext(main_url.database)
+        return str(main_url.set(database=f"{root}_archive{ext or '.db'}"))
+    return None
+
+def get_archive_engine() -> Optional[Engine]:
+    global _archive_engine
+    tenant = _tenant.get()
+    eng = tenant.archive_engine if tenant is not None else _archive_engine
+    if eng is None:
+        url = archive_db_url()
+        if url is None:
+            return None
+        eng = make_engine(url)
+        archive_metadata.create_all(eng)
+        if tenant is not None:
+            tenant.archive_engine = eng
+        else:
+            _archive_engine = eng
+    return eng
+
+def _copy_to_archive(table: Table, rows: List[dict]):
+    # Idempotent : un lot recopié après une interruption remplace sa copie.
+    arch = ARCHIVE_TABLES[table.name]
+    with get_archive_engine().begin() as conn:
+        conn.execute(arch.delete().where(arch.c.id.in_([r["id"] for r in rows])))
+        conn.execute(arch.insert(), rows)
+
+def _select_rows(table: Table, where, limit: int = ARCHIVE_BATCH) -> List[dict]:
+    with db() as s:
+        return [dict(r._mapping) for r in s.execute(select(table).where(where).order_by(table.c.id).limit(limit))]
+
+def _archive_ledger_batch(cutoff: dt.datetime) -> int:
+    t = LedgerEntry.__table__
+    not_carry = or_(t.c.description.is_(None), t.c.description != LEDGER_CARRY_LABEL)
+    rows = _select_rows(t, and_(t.c.date < cutoff, not_carry))
+    if not rows:
+        return 0
+    _copy_to_archive(t, rows)
+    net = sum(
+        (Decimal(r["amount"] or 0) if r["entry_type"] == LedgerType.INCOME.value else -Decimal(r["amount"] or 0))
+        for r in rows
+    )
+    with db() as s:
+        # Le solde du lot archivé est reporté sur une nouvelle écriture, ce qui
+        # garde /cash exact sans jamais modifier une écriture existante (l'export
+        # incrémental ne voit que les nouveaux id).
+        s.add(LedgerEntry(
+            entry_type=LedgerType.INCOME.value if net >= 0 else LedgerType.EXPENSE.value,
+            amount=abs(net), description=LEDGER_CARRY_LABEL, date=cutoff,
+        ))
+        s.execute(delete(t).where(t.c.id.in_([r["id"] for r in rows])))
+        s.commit()
+    return len(rows)
+
+def _archive_orders_batch(cutoff: dt.datetime) -> int:
+    o, it = Order.__table__, OrderItem.__table__
+    with db() as s:
+        # Les agrégats de ventes doivent avoir vu une commande avant qu'elle parte.
+        watermark = int(meta_get(s, "sales_rollup_order_id", "0"))
+    still_paid = exists().where(LedgerEntry.order_id == o.c.id)
+    orders = _select_rows(o, and_(o.c.created_at < cutoff, o.c.id <= watermark, ~still_paid))
+    if not orders:
+        return 0
+    ids = [r["id"] for r in orders]
+    items = _select_rows(it, it.c.order_id.in_(ids), limit=None)
+    if items:
+        _copy_to_archive(it, items)
+    _copy_to_archive(o, orders)
+    with db() as s:
+        s.execute(delete(it).where(it.c.order_id.in_(ids)))
+        s.execute(delete(o).where(o.c.id.in_(ids)))
+        s.commit()
+    return len(orders)
+
+def _archive_movements_batch(cutoff: dt.datetime) -> int:
+    t = StockMovement.__table__
+    rows = _select_rows(t, t.c.created_at < cutoff)
+    if not rows:
+        return 0
+    _copy_to_archive(t, rows)
+    with db() as s:
+        s.execute(delete(t).where(t.c.id.in_([r["id"] for r in rows])))
+        s.commit()
+    return len(rows)
+
+def _purge_carts_batch(cutoff: dt.datetime) -> int:
+    """Supprime les paniers fermés et les paniers ouverts inactifs depuis CART_TTL_DAYS."""
+    with db() as s:
+        active = exists().where(CartItem.cart_id == Cart.id, CartItem.created_at >= cutoff)
+        ids = s.scalars(
+            select(Cart.id)
+            .where(or_(Cart.is_open == False, and_(Cart.created_at < cutoff, ~active)))
+            .limit(ARCHIVE_BATCH)
+        ).all()
+        if ids:
+            s.execute(delete(CartItem).where(CartItem.cart_id.in_(ids)))
+            s.execute(delete(Cart).where(Cart.id.in_(ids)))
+            s.commit()
+    return len(ids)
+
+async def run_archive() -> Dict[str, int]:
+    async with archive_lock():
+        now = dt.datetime.utcnow()
+        # L'historique utilisé par /forecast n'est jamais archivé.
+        cutoff = now - dt.timedelta(days=max(ARCHIVE_AFTER_DAYS, FORECAST_HISTORY_DAYS))
+        steps = [
+            ("paniers", partial(_purge_carts_batch, now - dt.timedelta(days=CART_TTL_DAYS))),
+            ("notifications envoyées", partial(_purge_outbox_batch, now - dt.timedelta(days=OUTBOX_KEEP_DAYS))),
+        ]
+        if await asyncio.to_thread(get_archive_engine) is not None:
+            await asyncio.to_thread(refresh_sales_rollups)
+            steps += [
+                ("écritures", partial(_archive_ledger_batch, cutoff)),
+                ("commandes", partial(_archive_orders_batch, cutoff)),
+                ("mouvements", partial(_archive_movements_batch, cutoff)),
+            ]
+        counts: Dict[str, int] = {}
+        for name, step in steps:
+            total = 0
+            while True:
+                n = await asyncio.to_thread(step)
+                total += n
+                if not n:
+                    break
+                await asyncio.sleep(ARCHIVE_PAUSE)
+            counts[name] = total
+        return counts
+
+async def archive_loop():
+    while True:
+        await asyncio.sleep(ARCHIVE_INTERVAL_HOURS * 3600)
+        try:
+            log.info("Archivage: %s", await run_archive())
+        except Exception:
+            log.exception("Archivage en échec")
+
+# ---------------------------------------------------------------------------
+# Sauvegarde à chaud (API backup SQLite / pg_dump), compressée et tournante
+# ---------------------------------------------------------------------------
+# SQLite : copie par paquets de BACKUP_PAGES pages depuis une connexion en
+# lecture seule, avec une pause de BACKUP_PAUSE_MS entre deux paquets ; la
+# copie tourne dans un thread, la boucle asyncio continue de servir. Si des
+# écritures font redémarrer la copie plus de BACKUP_MAX_RESTARTS fois, elle
+# se termine en une passe (en WAL, un lecteur ne bloque pas les écritures).
+# PostgreSQL : pg_dump --format=custom (déjà compressé).
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_KEEP = env_int("BACKUP_KEEP", 7)
+BACKUP_INTERVAL_HOURS = env_int("BACKUP_INTERVAL_HOURS", 24)
+BACKUP_PAGES = env_int("BACKUP_PAGES", 256)
+BACKUP_PAUSE = env_int("BACKUP_PAUSE_MS", 20) / 1000
+BACKUP_MAX_RESTARTS = env_int("BACKUP_MAX_RESTARTS", 3)
+BACKUP_SEND_MAX_BYTES = 45 * 1024 * 1024  # limite d'envoi de documents des bots : 50 Mo
+BACKUP_PREFIX = "jefflebot-"
+
+def backup_lock() -> asyncio.Lock:
+    return shop_lock("backup", asyncio.Lock)
+
+class _BackupRestarted(Exception):
+    pass
+
+def sqlite_backup(src_path: str, dest_path: str) -> int:
+    """Copie en ligne de ``src_path`` vers ``dest_path`` ; renvoie le nombre de pages."""
+    import pathlib
+    import sqlite3
+    src = sqlite3.connect(pathlib.Path(src_path).resolve().as_uri() + "?mode=ro", uri=True)
+    dst = sqlite3.connect(dest_path)
+    seen = {"remaining": None, "restarts": 0, "total": 0}
+
+    def progress(status, remaining, total):
+        if seen["remaining"] is not None and remaining > seen["remaining"]:
+            seen["restarts"] += 1
+            if seen["restarts"] > BACKUP_MAX_RESTARTS:
+                raise _BackupRestarted
+        seen["remaining"], seen["total"] = remaining, total
+        if remaining:
+            time.sleep(BACKUP_PAUSE)
+
+    try:
+        try:
+            src.backup(dst, pages=BACKUP_PAGES, progress=progress)
+        except _BackupRestarted:
+            log.info("Sauvegarde: %s redémarrages, copie en une passe", seen["restarts"])
+            src.backup(dst, pages=-1)
+    finally:
+        src.close()
+        dst.close()
+    return seen["total"]
+
+def _gzip_file(path: str, dest: str):
+    import gzip
+    import shutil
+    with open(path, "rb") as f_in, gzip.open(dest, "wb", compresslevel=6) as f_out:
+        shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+
+def rotate_backups(directory: Optional[str] = None, keep: Optional[int] = None) -> List[str]:
+    """Supprime les sauvegardes au-delà des ``keep`` plus récentes ; renvoie les fichiers supprimés."""
+    directory = directory or tenant_path(BACKUP_DIR)
+    keep = BACKUP_KEEP if keep is None else keep
+    if not os.path.isdir(directory):
+        return []
+    snapshots = sorted(f for f in os.listdir(directory) if f.startswith(BACKUP_PREFIX))
+    removed = snapshots[:-keep] if keep > 0 else []
+    for name in removed:
+        os.remove(os.path.join(directory, name))
+    return removed
+
+async def _pg_dump(url, dest: str, schema: Optional[str] = None):
+    env = dict(os.environ)
+    if url.password:
+        env["PGPASSWORD"] = url.password
+    args = ["pg_dump", "--format=custom", "--file", dest, "--dbname", url.database or ""]
+    if schema:
+        # Boutique en mode schéma : base partagée, on ne sauvegarde que son schéma.
+        args += ["--schema", schema]
+    if url.host:
+        args += ["--host", url.host]
+    if url.port:
+        args += ["--port", str(url.port)]
+    if url.username:
+        args += ["--username", url.username]
+    proc = await asyncio.create_subprocess_exec(*args, env=env, stderr=asyncio.subprocess.PIPE)
+    _, err = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"pg_dump: {err.decode(errors='replace').strip()[:300]}")
+
+async def run_backup() -> Dict[str, object]:
+    """Sauvegarde la base principale dans BACKUP_DIR puis applique la rotation."""
+    url = make_url(current_db_url())
+    backend = url.get_backend_name()
+    stamp = dt.datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    directory = tenant_path(BACKUP_DIR)
+    async with backup_lock():
+        os.makedirs(directory, exist_ok=True)
+        t0 = time.perf_counter()
+        if backend == "sqlite":
+            if url.database in (None, "", ":memory:"):
+                raise RuntimeError("base en mémoire : rien à sauvegarder")
+            dest = os.path.join(directory, f"{BACKUP_PREFIX}{stamp}.db.gz")
+            tmp = dest[:-3] + ".part"
+            try:
+                pages = await asyncio.to_thread(sqlite_backup, url.database, tmp)
+                await asyncio.to_thread(_gzip_file, tmp, dest)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        elif backend == "postgresql":
+            dest = os.path.join(directory, f"{BACKUP_PREFIX}{stamp}.dump")
+            pages = None
+            tenant = _tenant.get()
+            await _pg_dump(url, dest, tenant.schema if tenant is not None else None)
+        else:
+            raise RuntimeError(f"sauvegarde non prise en charge pour {backend}")
+        elapsed = time.perf_counter() - t0
+        removed = rotate_backups(directory)
+    return {"path": dest, "size": os.path.getsize(dest), "seconds": elapsed, "pages": pages, "removed": len(removed)}
+
+def refresh_read_snapshot() -> Optional[int]:
+    """Recopie la base vers l'instantané de lecture ; renvoie le nombre de pages."""
+    path = read_snapshot_path()
+    if path is None:
+        return None
+    routes = read_routes()
+    started = time.time()
+    tmp = path + ".part"
+    try:
+        pages = sqlite_backup(make_url(current_db_url()).database, tmp)
+        # La copie hérite du mode WAL de la source : on la repasse en journal
+        # classique pour qu'aucun -wal ne survive au remplacement du fichier.
+        import sqlite3
+        con = sqlite3.connect(tmp)
+        try:
+            con.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            con.close()
+        os.replace(tmp, path)
+        # Connexions ouvertes sur l'ancien fichier : fermées, les suivantes lisent le nouveau.
+        routes.release()
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    # Tout ce qui était validé au début de la copie y figure.
+    routes.snapshot_at = started
+    return pages
+
+async def read_snapshot_loop():
+    while True:
+        try:
+            await asyncio.to_thread(refresh_read_snapshot)
+        except Exception:
+            log.exception("Instantané de lecture en échec")
+        await asyncio.sleep(READ_SNAPSHOT_S)
+
+async def backup_loop():
+    while True:
+        await asyncio.sleep(BACKUP_INTERVAL_HOURS * 3600)
+        try:
+            info = await run_backup()
+            log.info("Sauvegarde %s: %.1f Mo en %.1f s", info["path"], info["size"] / 1e6, info["seconds"])
+        except Exception:
+            log.exception("Sauvegarde en échec")
+
+@router.message(Command("backup"))
+async def cmd_backup(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("Accès refusé")
+    if backup_lock().locked():
+        return await message.answer("Sauvegarde déjà en cours…")
+    send = message.text.strip().split()[1:] == ["fichier"]
+    await message.answer("💾 Sauvegarde lancée…")
+    try:
+        info = await run_backup()
+    except Exception as e:
+        log.exception("Sauvegarde en échec")
+        return await message.answer(f"❌ Sauvegarde impossible: {html.escape(str(e))}")
+    lines = [
+        f"💾 <b>Sauvegarde terminée</b> en {info['seconds']:.1f} s",
+        f"Fichier: <code>{html.escape(os.path.basename(info['path']))}</code>",
+        f"Taille: {info['size'] / 1e6:.2f} Mo" + (f" ({info['pages']} pages copiées)" if info["pages"] else ""),
+        f"Rotation: {BACKUP_KEEP} conservées, {info['removed']} supprimée(s)",
+    ]
+    await message.answer("\n".join(lines))
+    if send:
+        if info["size"] > BACKUP_SEND_MAX_BYTES:
+            return await message.answer("Fichier trop volumineux pour Telegram, récupérez-le sur le serveur.")
+        await message.answer_document(FSInputFile(info["path"]))
+
+@router.message(Command("throttle"))
+async def cmd_throttle(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("Accès refusé")
+    lines = [
+        "🚦 <b>Anti-flood</b>",
+        f"Utilisateurs suivis: {len(throttle.buckets)} / {THROTTLE_MAX_USERS}",
+        f"Événements acceptés: {throttle.passed} – rejetés: {sum(throttle.throttled.values())}",
+    ]
+    lines += [f"• {html.escape(key)}: {n}" for key, n in throttle.throttled.most_common(10)]
+    await message.answer("\n".join(lines))
+
+@router.message(Command("archive"))
+async def cmd_archive(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("Accès refusé")
+    if archive_lock().locked():
+        return await message.answer("Archivage déjà en cours…")
+    await message.answer("🗄️ Archivage lancé…")
+    t0 = time.perf_counter()
+    counts = await run_archive()
+    lines = [f"🗄️ <b>Archivage terminé</b> en {time.perf_counter() - t0:.1f} s"]
+    lines += [f"• {name}: {n}" for name, n in counts.items()]
+    if get_archive_engine() is None:
+        lines.append("ℹ️ ARCHIVE_DB_URL non défini : seuls les paniers ont été purgés.")
+    await message.answer("\n".join(lines))
+
+# ---------------------------------------------------------------------------
+# Profilage à la demande (/profile <secondes>)
+# ---------------------------------------------------------------------------
+# Hors fenêtre de profilage, seul reste un test de booléen dans le middleware
+# des handlers ; PROFILE_HOOK=0 ne l'enregistre même pas. Pendant la fenêtre :
+# - un thread échantillonne la pile du thread de la boucle asyncio
+#   (sys._current_frames) toutes les PROFILE_SAMPLE_MS ms -> piles repliées
+#   (format flamegraph.pl / speedscope) ;
+# - mode debug asyncio : callbacks > PROFILE_SLOW_MS ms relevés, plus une
+#   sonde de latence de la boucle ;
+# - durée de chaque instruction SQL (événements du moteur, posés puis retirés) ;
+# - temps mur / CPU par handler (CPU approximatif : inclut les tâches qui
+#   s'exécutent pendant les await du handler).
+PROFILE_HOOK = env_bool("PROFILE_HOOK", True)
+PROFILE_MAX_SECONDS = env_int("PROFILE_MAX_SECONDS", 120)
+PROFILE_SAMPLE_MS = env_int("PROFILE_SAMPLE_MS", 5)
+PROFILE_SLOW_MS = env_int("PROFILE_SLOW_MS", 100)
+
+_SLOW_CALLBACK_RE = re.compile(r"^Executing (.*) took ([\d.]+) seconds$", re.S)
+
+class _SlowCallbackHandler(logging.Handler):
+    """Capte les avertissements « Executing <...> took X seconds » du mode debug asyncio."""
+
+    def __init__(self, sink: Dict[str, List[float]]):
+        super().__init__(logging.WARNING)
+        self.sink = sink
+
+    def emit(self, record: logging.LogRecord):
+        m = _SLOW_CALLBACK_RE.match(record.getMessage())
+        if not m:
+            return
+        coro = re.search(r"coro=<(\S+?)\(?\)? ", m.group(1))
+        stat = self.sink[coro.group(1) if coro else m.group(1)[:80]]
+        stat[0] += 1
+        stat[1] = max(stat[1], float(m.group(2)))
+
+class Profiler:
+    def __init__(self):
+        self.active = False
+        self._reset()
+
+    def _reset(self):
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self.lags: List[float] = []
+        self.slow_callbacks: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0])  # n, max
+        self.sql: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0, 0.0])  # n, total, max
+        self.handlers: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0, 0.0])  # n, mur, cpu
+
+    # --- échantillonnage de la pile de la boucle ---
+    def _sample_loop(self, thread_id: int, stop: threading.Event):
+        interval = PROFILE_SAMPLE_MS / 1000
+        while not stop.wait(interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_qualname}")
+                frame = frame.f_back
+            names.reverse()
+            self.samples += 1
+            if names[-1].startswith("selectors.py:"):
+                self.idle_samples += 1
+            self.stacks[";".join(names)] += 1
+
+    async def _probe_lag(self):
+        step = 0.05
+        while True:
+            t0 = time.perf_counter()
+            await asyncio.sleep(step)
+            self.lags.append(max(0.0, time.perf_counter() - t0 - step))
+
+    # --- SQL ---
+    def _before_sql(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("profile_t0", []).append(time.perf_counter())
+
+    def _after_sql(self, conn, cursor, statement, parameters, context, executemany):
+        # Requête lancée avant l'activation du profileur : pas de départ à mesurer.
+        starts = conn.info.get("profile_t0")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        stat = self.sql[" ".join(statement.split())[:120]]
+        stat[0] += 1
+        stat[1] += elapsed
+        stat[2] = max(stat[2], elapsed)
+
+    # --- handlers (appelé par ProfileMiddleware) ---
+    def record_handler(self, key: str, wall: float, cpu: float):
+        stat = self.handlers[key]
+        stat[0] += 1
+        stat[1] += wall
+        stat[2] += cpu
+
+    async def run(self, seconds: float) -> Tuple[List[str], str]:
+        """Profile la boucle courante pendant ``seconds`` ; renvoie (rapport, piles repliées)."""
+        self._reset()
+        loop = asyncio.get_running_loop()
+        engine = get_engine()
+        asyncio_log = logging.getLogger("asyncio")
+        slow_handler = _SlowCallbackHandler(self.slow_callbacks)
+        debug, slow_duration = loop.get_debug(), loop.slow_callback_duration
+        stop = threading.Event()
+        sampler = threading.Thread(target=self._sample_loop, args=(threading.get_ident(), stop), daemon=True)
+        event.listen(engine, "before_cursor_execute", self._before_sql)
+        event.listen(engine, "after_cursor_execute", self._after_sql)
+        asyncio_log.addHandler(slow_handler)
+        loop.slow_callback_duration = PROFILE_SLOW_MS / 1000
+        loop.set_debug(True)
+        probe = asyncio.create_task(self._probe_lag())
+        self.active = True
+        t0 = time.perf_counter()
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self.active = False
+            stop.set()
+            probe.cancel()
+            loop.set_debug(debug)
+            loop.slow_callback_duration = slow_duration
+            asyncio_log.removeHandler(slow_handler)
+            event.remove(engine, "before_cursor_execute", self._before_sql)
+            event.remove(engine, "after_cursor_execute", self._after_sql)
+            await asyncio.to_thread(sampler.join)
+        return self.report(time.perf_counter() - t0), self.collapsed()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+    def report(self, elapsed: float) -> List[str]:
+        busy = self.samples - self.idle_samples
+        lines = [
+            f"🔬 <b>Profil</b> – {elapsed:.1f} s, {self.samples} échantillons",
+            f"Boucle occupée: {100 * busy / self.samples if self.samples else 0:.0f}% des échantillons",
+        ]
+        if self.lags:
+            lines.append(f"Latence boucle: moy {1000 * sum(self.lags) / len(self.lags):.1f} ms – max {1000 * max(self.lags):.1f} ms")
+        slow = sorted(self.slow_callbacks.items(), key=lambda kv: -kv[1][1])
+        lines.append(f"\n<b>Callbacks lents</b> (&gt; {PROFILE_SLOW_MS} ms): {sum(n for n, _ in self.slow_callbacks.values())}")
+        lines += [f"• {html.escape(name)}: {n}× – max {1000 * worst:.0f} ms" for name, (n, worst) in slow[:8]]
+        hot = Counter()
+        for stack, n in self.stacks.items():
+            leaf = stack.rsplit(";", 1)[-1]
+            if not leaf.startswith("selectors.py:"):
+                hot[leaf] += n
+        if hot:
+            lines.append("\n<b>Fonctions chaudes</b> (feuille de pile):")
+            lines += [f"• {html.escape(name)}: {100 * n / busy:.0f}%" for name, n in hot.most_common(8)]
+        if self.handlers:
+            lines.append("\n<b>Handlers</b> (n – mur total/moy – CPU):")
+            for key, (n, wall, cpu) in sorted(self.handlers.items(), key=lambda kv: -kv[1][1])[:10]:
+                lines.append(f"• {html.escape(key)}: {n} – {1000 * wall:.0f}/{1000 * wall / n:.1f} ms – {1000 * cpu:.0f} ms")
+        if self.sql:
+            lines.append("\n<b>SQL</b> (n – total – max):")
+            for stmt, (n, total, worst) in sorted(self.sql.items(), key=lambda kv: -kv[1][1])[:8]:
+                lines.append(f"• {n} – {1000 * total:.1f} ms – {1000 * worst:.1f} ms\n  <code>{html.escape(stmt)}</code>")
+        return lines
+
+class ProfileMiddleware(BaseMiddleware):
+    def __init__(self, profiler: Profiler):
+        self.profiler = profiler
+
+    async def __call__(self, handler, event, data):
+        if not self.profiler.active:
+            return await handler(event, data)
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            return await handler(event, data)
+        finally:
+            self.profiler.record_handler(
+                ThrottleMiddleware.cost_key(event, data),
+                time.perf_counter() - wall, time.thread_time() - cpu,
+            )
+
+profiler = Profiler()
+if PROFILE_HOOK:
+    for _observer in (router.message, router.callback_query, router.inline_query):
+        _observer.middleware(ProfileMiddleware(profiler))
+
+@router.message(Command("profile"))
+async def cmd_profile(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("Accès refusé")
+    if not PROFILE_HOOK:
+        return await message.answer("Profilage désactivé (PROFILE_HOOK=0).")
+    parts = message.text.strip().split()
+    try:
+        seconds = float(parts[1]) if len(parts) > 1 else 10.0
+    except ValueError:
+        return await message.answer(f"Usage: /profile [secondes, max {PROFILE_MAX_SECONDS}]")
+    if profiler.active:
+        return await message.answer("Profilage déjà en cours…")
+    seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+    await message.answer(f"🔬 Profilage pendant {seconds:g} s…")
+    lines, folded = await profiler.run(seconds)
+    await answer_chunks(message, lines)
+    if folded:
+        name = f"profile-{dt.datetime.utcnow():%Y%m%d-%H%M%S}.folded"
+        await message.answer_document(
+            BufferedInputFile(folded.encode("utf-8"), filename=name),
+            caption="Piles repliées (flamegraph.pl / speedscope)",
+        )
+
+def export_products_csv() -> str:
+    import csv
+    path = os.path.join(tenant_path("."), "products_export.csv")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with db_read() as s:
         prods = s.query(Product).order_by(Product.name.asc()).all()
     with open(path, "w", newline="", encoding="utf-8") as f:
         w = csv.writer(f)
@@ -1104,8 +3844,10 @@ def export_products_csv() -> str:
     return path
 
 def export_orders_csv() -> str:
-    path = "orders_export.csv"
-    with db() as s:
+    import csv
+    path = os.path.join(tenant_path("."), "orders_export.csv")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with db_read() as s:
         orders = s.query(Order).order_by(Order.created_at.desc()).all()
         items = s.query(OrderItem).all()
     items_by_order: Dict[int, List[OrderItem]] = {}
@@ -1121,18 +3863,453 @@ def export_orders_csv() -> str:
             w.writerow([o.id, o.created_at, o.status, o.total, " | ".join(lines)])
     return path
 
+# ---------------------------------------------------------------------------
+# Export colonnaire (Parquet) pour la comptabilité / BI
+# ---------------------------------------------------------------------------
+# Un fichier Parquet par table et par export, colonnes typées d'après le
+# modèle (Numeric -> decimal128, DateTime -> timestamp UTC…), écrit par lots
+# de EXPORT_BATCH lignes lus en keyset sur l'id. Filigrane par table dans
+# app_meta (export_<table>_id) : un export incrémental ne lit que les lignes
+# ajoutées depuis le précédent (tables en ajout seul ; les changements de
+# statut d'une commande déjà exportée demandent un export complet).
+# pyarrow est importé à la demande.
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+EXPORT_BATCH = env_int("EXPORT_BATCH", 5000)
+EXPORT_TABLES = (Order, OrderItem, LedgerEntry, Payroll, Shift, StockMovement)
+
+def export_lock() -> asyncio.Lock:
+    return shop_lock("export", asyncio.Lock)
+
+def arrow_type(column):
+    import pyarrow as pa
+    t = column.type
+    if isinstance(t, Boolean):
+        return pa.bool_()
+    if isinstance(t, Integer):
+        return pa.int64()
+    if isinstance(t, Numeric):
+        return pa.decimal128(t.precision or 18, t.scale or 0)
+    if isinstance(t, DateTime):
+        return pa.timestamp("us", tz="UTC")
+    if isinstance(t, Date):
+        return pa.date32()
+    return pa.string()
+
+def arrow_schema(table: Table):
+    import pyarrow as pa
+    return pa.schema([pa.field(c.name, arrow_type(c), nullable=not c.primary_key) for c in table.columns])
+
+def export_table(model, full: bool = False, directory: Optional[str] = None) -> Tuple[int, Optional[str]]:
+    """Exporte les lignes de ``model`` au-delà du filigrane ; renvoie (lignes, chemin)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    t = model.__table__
+    key = f"export_{t.name}_id"
+    with db() as s:
+        since = 0 if full else int(meta_get(s, key, "0"))
+    schema = arrow_schema(t)
+    out_dir = os.path.join(directory or tenant_path(EXPORT_DIR), t.name)
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = dt.datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(out_dir, f"{t.name}-{stamp}-{'full' if full else since}.parquet")
+    writer, last, count = None, since, 0
+    try:
+        while True:
+            with db_read() as s:
+                rows = s.execute(select(t).where(t.c.id > last).order_by(t.c.id).limit(EXPORT_BATCH)).all()
+            if not rows:
+                break
+            columns = {name: [r[i] for r in rows] for i, name in enumerate(schema.names)}
+            batch = pa.RecordBatch.from_pydict(columns, schema=schema)
+            if writer is None:
+                writer = pq.ParquetWriter(path, schema, compression="zstd")
+            writer.write_batch(batch)
+            count += len(rows)
+            last = rows[-1].id
+            if len(rows) < EXPORT_BATCH:
+                break
+    except Exception:
+        if writer is not None:
+            writer.close()
+            os.remove(path)
+        raise
+    if writer is None:
+        return 0, None
+    writer.close()
+    with db() as s:
+        meta_set(s, key, str(max(last, int(meta_get(s, key, "0")))))
+        s.commit()
+    return count, path
+
+def export_all(full: bool = False, directory: Optional[str] = None) -> Dict[str, Tuple[int, Optional[str]]]:
+    return {m.__tablename__: export_table(m, full, directory) for m in EXPORT_TABLES}
+
+async def run_export(full: bool = False) -> Dict[str, Tuple[int, Optional[str]]]:
+    async with export_lock():
+        return await asyncio.to_thread(export_all, full)
+
+@router.message(Command("export"))
+async def cmd_export(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("Accès refusé")
+    if export_lock().locked():
+        return await message.answer("Export déjà en cours…")
+    full = message.text.strip().split()[1:] == ["tout"]
+    t0 = time.perf_counter()
+    try:
+        results = await run_export(full)
+    except ImportError:
+        return await message.answer("pyarrow n'est pas installé (pip install pyarrow).")
+    lines = [f"📤 <b>Export {'complet' if full else 'incrémental'}</b> en {time.perf_counter() - t0:.1f} s"]
+    lines += [f"• {name}: {n} ligne(s)" for name, (n, _) in results.items()]
+    await message.answer("\n".join(lines))
+    for n, path in results.values():
+        if path and os.path.getsize(path) <= BACKUP_SEND_MAX_BYTES:
+            await message.answer_document(FSInputFile(path))
+
+# ---------------------------------------------------------------------------
+# Application (fabrique)
+# ---------------------------------------------------------------------------
+class AppConfig:
+    def __init__(self, bot_token: str = BOT_TOKEN, admin_chat_id: int = ADMIN_CHAT_ID, db_url: str = DB_URL,
+                 auto_migrate: bool = True, read_db_url: Optional[str] = None):
+        self.bot_token = bot_token
+        self.admin_chat_id = admin_chat_id
+        self.db_url = db_url
+        self.auto_migrate = auto_migrate
+        self.read_db_url = read_db_url
+
+    @classmethod
+    def from_env(cls) -> "AppConfig":
+        return cls(
+            bot_token=os.getenv("BOT_TOKEN", BOT_TOKEN),
+            admin_chat_id=env_int("ADMIN_CHAT_ID", ADMIN_CHAT_ID),
+            db_url=os.getenv("DB_URL", DB_URL),
+            auto_migrate=env_bool("DB_AUTO_MIGRATE", True),
+            read_db_url=os.getenv("DB_READ_URL") or None,
+        )
+
+class App:
+    """Application mono-boutique : bot, dispatcher, et sa base (moteur créé au
+    premier accès), sa réplique de lecture et ses caches, comme un Tenant."""
+
+    def __init__(self, config: AppConfig, bot: Bot, dp: Dispatcher):
+        self.config = config
+        self.bot = bot
+        self.dp = dp
+        self.engine: Optional[Engine] = None
+        self.reads = ReadRoutes(config.read_db_url)
+        self.search = ProductSearch()
+        self.job_search = JobSearch()
+        self.forecast_cache: Dict[str, object] = {}
+        self.feed_cache: Dict[str, object] = {}
+        self.locks: Dict[str, object] = {}
+
+    def get_engine(self) -> Engine:
+        if self.engine is None:
+            self.engine = make_engine(self.config.db_url)
+        return self.engine
+
+    @contextmanager
+    def context(self):
+        """Contexte de l'application pour les tâches de fond et la CLI."""
+        token = _app.set(self)
+        try:
+            yield self
+        finally:
+            _app.reset(token)
+
+    async def close(self):
+        self.reads.release()
+        if self.engine is not None:
+            self.engine.dispose()
+            self.engine = None
+        await self.bot.session.close()
+
+class AppMiddleware(BaseMiddleware):
+    """Pose l'application (base, admin, caches) pour la durée de l'update."""
+
+    def __init__(self, app: App):
+        self.app = app
+
+    async def __call__(self, handler, event, data):
+        with self.app.context():
+            return await handler(event, data)
+
+def app_router() -> Router:
+    """Routeur neuf portant les handlers et middlewares de ``router`` : un
+    routeur n'a qu'un parent, chaque Dispatcher reçoit donc le sien."""
+    fresh = Router(name="jefflebot")
+    for name, observer in router.observers.items():
+        target = fresh.observers[name]
+        target.handlers.extend(observer.handlers)
+        for mw in observer.outer_middleware:
+            target.outer_middleware(mw)
+        for mw in observer.middleware:
+            target.middleware(mw)
+    return fresh
+
+def create_app(config: Optional[AppConfig] = None) -> App:
+    """Assemble bot et dispatcher sans ouvrir la base (moteur paresseux)."""
+    config = config or AppConfig.from_env()
+    # ✅ Correction ici pour aiogram >= 3.7
+    bot = Bot(config.bot_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    dp = Dispatcher()
+    app = App(config, bot, dp)
+    dp.update.outer_middleware(AppMiddleware(app))
+    dp.include_router(app_router())
+    return app
+
+# ---------------------------------------------------------------------------
+# Multi-boutiques : plusieurs bots, un processus, données isolées
+# ---------------------------------------------------------------------------
+# TENANTS_FILE désigne un registre JSON :
+#   [{"key": "dakar", "bot_token": "...", "admin_chat_id": 1, "db_url": "sqlite:///data/dakar.db"},
+#    {"key": "thies", "bot_token": "...", "admin_chat_id": 2, "schema": "shop_thies"}]
+# Chaque boutique a sa base : URL dédiée (db_url ; par défaut
+# sqlite:///TENANTS_DIR/<key>.db, pool réduit à TENANT_POOL_SIZE) ou schéma
+# PostgreSQL sur le moteur partagé de TENANTS_DB_URL (un seul pool, requêtes
+# traduites par schema_translate_map). Un seul Dispatcher sert tous les bots ;
+# TenantMiddleware retrouve la boutique d'après l'id du bot de l'update.
+# Seules les TENANT_WARM_MAX boutiques ayant reçu le plus récemment un update
+# gardent connexions et caches (index de recherche, prévisions) ; les autres
+# les reconstruisent à la demande. Les tâches de fond ne réchauffent personne.
+TENANTS_FILE = os.getenv("TENANTS_FILE", "")
+TENANTS_DIR = os.getenv("TENANTS_DIR", "tenants")
+TENANTS_DB_URL = os.getenv("TENANTS_DB_URL", "")
+TENANT_POOL_SIZE = env_int("TENANT_POOL_SIZE", 1)
+TENANT_MAX_OVERFLOW = env_int("TENANT_MAX_OVERFLOW", 2)
+TENANT_WARM_MAX = env_int("TENANT_WARM_MAX", 32)
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = env_int("WEBHOOK_PORT", 8080)
+
+_TENANT_KEY_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,62}$")
+_SCHEMA_RE = re.compile(r"^[a-z_][a-z0-9_]{0,62}$")
+_shared_engines: Dict[str, Engine] = {}
+
+class Tenant:
+    def __init__(self, key: str, config: AppConfig, schema: Optional[str] = None,
+                 archive_url: Optional[str] = None, registry: Optional["TenantRegistry"] = None):
+        self.key = key
+        self.config = config
+        self.schema = schema
+        self.archive_url = archive_url
+        self.registry = registry
+        self.engine: Optional[Engine] = None
+        self.archive_engine: Optional[Engine] = None
+        self.search = ProductSearch()
+        self.job_search = JobSearch()
+        self.reads = ReadRoutes(config.read_db_url, schema)
+        self.forecast_cache: Dict[str, object] = {}
+        self.feed_cache: Dict[str, object] = {}
+        self.locks: Dict[str, object] = {}
+
+    @property
+    def bot_id(self) -> int:
+        return int(self.config.bot_token.split(":", 1)[0])
+
+    def get_engine(self) -> Engine:
+        if self.engine is None:
+            if self.schema:
+                shared = _shared_engines.get(self.config.db_url)
+                if shared is None:
+                    shared = _shared_engines[self.config.db_url] = make_engine(self.config.db_url)
+                self.engine = shared.execution_options(schema_translate_map={None: self.schema})
+            else:
+                self.engine = make_engine(self.config.db_url, pool_size=TENANT_POOL_SIZE, max_overflow=TENANT_MAX_OVERFLOW)
+        return self.engine
+
+    def migrate(self):
+        eng = self.get_engine()
+        if self.schema:
+            with eng.begin() as conn:
+                conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{self.schema}"'))
+        migrate(eng)
+
+    def release(self):
+        """Boutique refroidie : connexions du pool fermées, caches vidés."""
+        self.search = ProductSearch()
+        self.job_search = JobSearch()
+        self.forecast_cache = {}
+        self.feed_cache = {}
+        self.reads.release()
+        # Moteur partagé (schéma) ou base en mémoire : rien à fermer, ou tout à perdre.
+        in_memory = make_url(self.config.db_url).database in (None, "", ":memory:")
+        if self.engine is not None and not self.schema and not in_memory:
+            self.engine.dispose()
+        if self.archive_engine is not None:
+            self.archive_engine.dispose()
+
+class TenantRegistry:
+    def __init__(self, tenants: List[Tenant], warm_max: int = TENANT_WARM_MAX):
+        self.tenants = tenants
+        self.by_key = {t.key: t for t in tenants}
+        self.by_bot_id = {t.bot_id: t for t in tenants}
+        if len(self.by_key) != len(tenants) or len(self.by_bot_id) != len(tenants):
+            raise ValueError("registre des boutiques : clé ou bot en double")
+        self.warm_max = max(1, warm_max)
+        self._warm: "OrderedDict[str, Tenant]" = OrderedDict()
+        self._warm_lock = threading.Lock()
+        for t in tenants:
+            t.registry = self
+
+    def __iter__(self):
+        return iter(self.tenants)
+
+    def __len__(self) -> int:
+        return len(self.tenants)
+
+    def touch(self, tenant: Tenant):
+        """Boutique active (update reçu) : la plus récente des chaudes. Les tâches
+        de fond (outbox, sauvegardes…) n'appellent pas touch : elles ne font pas
+        sortir une boutique réellement active."""
+        cold = []
+        with self._warm_lock:
+            warm = self._warm
+            if tenant.key in warm:
+                warm.move_to_end(tenant.key)
+                return
+            warm[tenant.key] = tenant
+            while len(warm) > self.warm_max:
+                cold.append(warm.popitem(last=False)[1])
+        for t in cold:
+            t.release()
+
+def load_tenants(path: str, warm_max: int = TENANT_WARM_MAX) -> TenantRegistry:
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    tenants = []
+    for e in entries:
+        key, schema = e["key"], e.get("schema")
+        if not _TENANT_KEY_RE.match(key):
+            raise ValueError(f"clé de boutique invalide: {key!r}")
+        if schema and not _SCHEMA_RE.match(schema):
+            raise ValueError(f"schéma invalide pour {key}: {schema!r}")
+        db_url = e.get("db_url") or (TENANTS_DB_URL if schema else f"sqlite:///{TENANTS_DIR}/{key}.db")
+        if not db_url:
+            raise ValueError(f"{key}: schéma sans db_url ni TENANTS_DB_URL")
+        config = AppConfig(bot_token=e["bot_token"], admin_chat_id=int(e["admin_chat_id"]), db_url=db_url,
+                           auto_migrate=e.get("auto_migrate", env_bool("DB_AUTO_MIGRATE", True)),
+                           read_db_url=e.get("read_db_url"))
+        tenants.append(Tenant(key, config, schema=schema, archive_url=e.get("archive_db_url")))
+    return TenantRegistry(tenants, warm_max)
+
+@contextmanager
+def using_tenant(tenant: Optional[Tenant]):
+    token = _tenant.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _tenant.reset(token)
+
+def tenant_task(tenant: Tenant, coro) -> asyncio.Task:
+    """Tâche de fond exécutée dans le contexte de ``tenant`` (copié à la création)."""
+    with using_tenant(tenant):
+        return asyncio.create_task(coro)
+
+class TenantMiddleware(BaseMiddleware):
+    def __init__(self, registry: TenantRegistry):
+        self.registry = registry
+
+    async def __call__(self, handler, event, data):
+        tenant = self.registry.by_bot_id.get(data["bot"].id)
+        if tenant is None:
+            log.warning("Update d'un bot hors registre: %s", data["bot"].id)
+            return None
+        self.registry.touch(tenant)
+        with using_tenant(tenant):
+            return await handler(event, data)
+
+async def _serve_webhooks(dp: Dispatcher, bots: Dict[str, Bot]):
+    import hashlib
+    from aiohttp import web
+    from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+    web_app = web.Application()
+    for key, bot in bots.items():
+        secret = hashlib.sha256(bot.token.encode()).hexdigest()[:32]
+        SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret).register(web_app, path=f"/webhook/{key}")
+        await bot.set_webhook(f"{WEBHOOK_BASE_URL.rstrip('/')}/webhook/{key}", secret_token=secret)
+    setup_application(web_app, dp, bots=list(bots.values()))
+    runner = web.AppRunner(web_app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    log.info("Webhooks: %d bots sur %s:%d", len(bots), WEBHOOK_HOST, WEBHOOK_PORT)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+async def run_tenants(registry: TenantRegistry):
+    """Un Dispatcher pour tous les bots du registre (polling ou webhooks)."""
+    dp = Dispatcher()
+    dp.include_router(app_router())
+    dp.update.outer_middleware(TenantMiddleware(registry))
+    bots: Dict[str, Bot] = {}
+    tasks = []
+    for t in registry:
+        bots[t.key] = bot = Bot(t.config.bot_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+        with using_tenant(t):
+            if t.config.auto_migrate:
+                t.migrate()
+        tasks.append(tenant_task(t, outbox_loop(bot)))
+        if ARCHIVE_INTERVAL_HOURS > 0:
+            tasks.append(tenant_task(t, archive_loop()))
+        if BACKUP_INTERVAL_HOURS > 0:
+            tasks.append(tenant_task(t, backup_loop()))
+        with using_tenant(t):
+            if read_snapshot_path():
+                tasks.append(tenant_task(t, read_snapshot_loop()))
+    log.info("Multi-boutiques: %d boutiques, démarrage en %.0f ms", len(registry), (time.perf_counter() - _IMPORT_T0) * 1000)
+    if WEBHOOK_BASE_URL:
+        await _serve_webhooks(dp, bots)
+    else:
+        await dp.start_polling(*bots.values())
+
 async def main():
+    if TENANTS_FILE:
+        return await run_tenants(load_tenants(TENANTS_FILE))
+    app = create_app()
+    with app.context():
+        if app.config.auto_migrate:
+            migrate()
+        log.info("Démarrage à froid: %.0f ms", (time.perf_counter() - _IMPORT_T0) * 1000)
+        tasks = [asyncio.create_task(outbox_loop(app.bot))]
+        if ARCHIVE_INTERVAL_HOURS > 0:
+            tasks.append(asyncio.create_task(archive_loop()))
+        if BACKUP_INTERVAL_HOURS > 0:
+            tasks.append(asyncio.create_task(backup_loop()))
+        if read_snapshot_path():
+            tasks.append(asyncio.create_task(read_snapshot_loop()))
     try:
-        await bot.send_message(ADMIN_CHAT_ID, "✅ Jefflebot FR en ligne (polling)")
+        await app.bot.send_message(app.config.admin_chat_id, "✅ Jefflebot FR en ligne (polling)")
     except Exception:
         pass
-    await dp.start_polling(bot)
+    await app.dp.start_polling(app.bot)
 
 if __name__ == "__main__":
-    import sys
-    try:
-        import sqlalchemy
-    except Exception:
-        print("Installez les dépendances: pip install aiogram SQLAlchemy python-dotenv")
-        sys.exit(1)
-    asyncio.run(main())
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    # En multi-boutiques, les commandes CLI s'appliquent à chaque boutique du registre.
+    scopes = list(load_tenants(TENANTS_FILE)) if TENANTS_FILE else [None]
+    if sys.argv[1:] == ["migrate"]:
+        for tenant in scopes:
+            with using_tenant(tenant):
+                if tenant is not None:
+                    tenant.migrate()
+                else:
+                    migrate()
+            print(f"{tenant.key + ': ' if tenant else ''}Schéma à jour ✅")
+    elif sys.argv[1:] == ["rollups"]:
+        for tenant in scopes:
+            with using_tenant(tenant), db() as s:
+                n = rebuild_worker_daily(s)
+                s.commit()
+            print(f"{tenant.key + ': ' if tenant else ''}{n} cumul(s) travailleur/jour recalculé(s)")
+    elif sys.argv[1:2] == ["export"]:
+        # export nocturne par cron : python jefflebot_fr.py export [--full]
+        for tenant in scopes:
+            with using_tenant(tenant):
+                for name, (n, path) in export_all(full="--full" in sys.argv[2:]).items():
+                    print(f"{tenant.key + '/' if tenant else ''}{name}: {n} ligne(s) {path or ''}")
+    else:
+        asyncio.run(main())
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Fabrique d'application : plusieurs apps par processus, base et admin par application."""
+from __future__ import annotations
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("DB_URL", "sqlite://")
+
+import jefflebot_fr as jb
+
+
+def test_create_app_twice_with_own_admin_and_database(tmp_path):
+    default_admin, default_engine = jb.ADMIN_CHAT_ID, jb.get_engine()
+    apps = [
+        jb.create_app(jb.AppConfig(bot_token=f"{100 + i}:TOKEN", admin_chat_id=500 + i,
+                                   db_url=f"sqlite:///{tmp_path}/shop{i}.db"))
+        for i in range(2)
+    ]
+    try:
+        assert jb.ADMIN_CHAT_ID == default_admin and jb.admin_chat_id() == default_admin
+        assert jb.get_engine() is default_engine
+        routers = [app.dp.sub_routers[0] for app in apps]
+        assert routers[0] is not routers[1] and jb.router.parent_router is None
+        assert len(routers[0].message.handlers) == len(jb.router.message.handlers)
+
+        for i, app in enumerate(apps):
+            with app.context():
+                jb.migrate()
+                with jb.db() as s:
+                    s.add(jb.Product(name=f"Produit {i}", sku=f"P{i}", price=100))
+                    s.commit()
+
+        async def seen(event, data):
+            with jb.db_read() as s:
+                return jb.admin_chat_id(), s.scalars(jb.select(jb.Product.name)).all()
+
+        for i, app in enumerate(apps):
+            [mw] = [m for m in app.dp.update.outer_middleware if isinstance(m, jb.AppMiddleware)]
+            assert asyncio.run(mw(seen, None, {})) == (500 + i, [f"Produit {i}"])
+            with app.context():
+                assert jb.is_admin(500 + i) and not jb.is_admin(default_admin)
+                assert [h[1] for h in jb.search_index().search("produit")] == [f"Produit {i}"]
+    finally:
+        for app in apps:
+            asyncio.run(app.close())
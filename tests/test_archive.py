@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Archivage du grand livre : reports ajoutés, jamais modifiés, vus par l'export."""
+from __future__ import annotations
+import asyncio
+import datetime as dt
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("DB_URL", "sqlite://")
+
+import jefflebot_fr as jb
+
+
+def balance() -> float:
+    signed = jb.case((jb.LedgerEntry.entry_type == jb.LedgerType.INCOME.value, jb.LedgerEntry.amount),
+                     else_=-jb.LedgerEntry.amount)
+    with jb.db() as s:
+        return float(s.scalar(jb.select(jb.func.sum(signed))))
+
+
+def add_entries(when: dt.datetime, amounts):
+    with jb.db() as s:
+        s.add_all(
+            jb.LedgerEntry(entry_type=jb.LedgerType.INCOME.value if a > 0 else jb.LedgerType.EXPENSE.value,
+                           amount=abs(a), date=when)
+            for a in amounts
+        )
+        s.commit()
+
+
+def test_archive_appends_carry_entries_seen_by_exports(tmp_path, monkeypatch):
+    import pyarrow.parquet as pq
+    monkeypatch.delenv("ARCHIVE_DB_URL", raising=False)
+    monkeypatch.setattr(jb, "ARCHIVE_AFTER_DAYS", 30)
+    monkeypatch.setattr(jb, "FORECAST_HISTORY_DAYS", 30)
+    monkeypatch.setattr(jb, "ARCHIVE_PAUSE", 0)
+    jb.configure_database(f"sqlite:///{tmp_path}/shop.db")
+    try:
+        jb.migrate()
+        now = dt.datetime.utcnow()
+        add_entries(now - dt.timedelta(days=400), [1000, -300, 500, 200])
+        add_entries(now, [50])
+        before = balance()
+        exports = tmp_path / "exports"
+        jb.export_table(jb.LedgerEntry, directory=str(exports))
+
+        asyncio.run(jb.run_archive())
+        with jb.db() as s:
+            carries = s.execute(jb.select(jb.LedgerEntry.id, jb.LedgerEntry.amount)
+                                .where(jb.LedgerEntry.description == jb.LEDGER_CARRY_LABEL)).all()
+        assert balance() == before and len(carries) == 1
+
+        add_entries(now - dt.timedelta(days=100), [-400])
+        asyncio.run(jb.run_archive())
+        with jb.db() as s:
+            after = s.execute(jb.select(jb.LedgerEntry.id, jb.LedgerEntry.amount)
+                              .where(jb.LedgerEntry.description == jb.LEDGER_CARRY_LABEL)).all()
+        assert balance() == before - 400 and after[:1] == carries and len(after) == 2
+
+        n, path = jb.export_table(jb.LedgerEntry, directory=str(exports))
+        exported = pq.read_table(path).to_pydict()
+        assert n == 2 and exported["description"] == [jb.LEDGER_CARRY_LABEL] * 2
+    finally:
+        jb.configure_database("sqlite://")
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Sauvegarde SQLite : archive gzip restaurable, fichier temporaire, rotation."""
+from __future__ import annotations
+import asyncio
+import gzip
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("DB_URL", "sqlite://")
+
+import jefflebot_fr as jb
+
+
+def test_backup_is_restorable_and_rotated(tmp_path, monkeypatch):
+    backups = tmp_path / "backups"
+    backups.mkdir()
+    monkeypatch.setattr(jb, "BACKUP_DIR", str(backups))
+    monkeypatch.setattr(jb, "BACKUP_KEEP", 3)
+    monkeypatch.setattr(jb, "BACKUP_PAUSE", 0)
+    monkeypatch.setattr(jb, "BACKUP_PAGES", 4)
+    for day in range(1, 5):
+        (backups / f"{jb.BACKUP_PREFIX}2020010{day}-000000.db.gz").write_bytes(b"old")
+    jb.configure_database(f"sqlite:///{tmp_path}/shop.db")
+    try:
+        jb.migrate()
+        with jb.db() as s:
+            s.add_all(jb.Product(name=f"Produit {i}", sku=f"P{i}", price=100 + i) for i in range(200))
+            s.commit()
+        info = asyncio.run(jb.run_backup())
+    finally:
+        jb.configure_database("sqlite://")
+
+    assert info["pages"] > 0 and info["removed"] == 2
+    names = sorted(os.listdir(backups))
+    assert len(names) == jb.BACKUP_KEEP and not any(n.endswith(".part") for n in names)
+    assert names[-1] == os.path.basename(info["path"])
+    assert names[0] == f"{jb.BACKUP_PREFIX}20200103-000000.db.gz"
+
+    restored = tmp_path / "restored.db"
+    with gzip.open(info["path"], "rb") as f:
+        restored.write_bytes(f.read())
+    con = sqlite3.connect(restored)
+    try:
+        assert con.execute("PRAGMA integrity_check").fetchone() == ("ok",)
+        assert con.execute("SELECT count(*) FROM products").fetchone() == (200,)
+    finally:
+        con.close()
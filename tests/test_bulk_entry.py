@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""Saisie groupée /paybulk et /presencebulk : texte du lot, lignes rejetées."""
+from __future__ import annotations
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("DB_URL", "sqlite://")
+
+import jefflebot_fr as jb
+
+
+@pytest.mark.parametrize("text, lines", [
+    ("/paybulk 2000 5000 cash\n2001 10 mobile", ["2000 5000 cash", "2001 10 mobile"]),
+    ("/presencebulk\n2001 2026-03-02", ["2001 2026-03-02"]),
+    ("/paybulk", []),
+])
+def test_bulk_payload_keeps_text_after_command(text, lines):
+    payload = asyncio.run(jb._bulk_payload(SimpleNamespace(text=text, document=None), None))
+    assert [" ".join(v) for _, v, _ in jb.parse_bulk(payload, lambda parts: parts)] == lines
+
+
+def test_bad_lines_are_reported_with_their_number():
+    def parse_line(parts):
+        if not parts[0].isdigit():
+            raise ValueError("id invalide")
+        return tuple(parts)
+
+    rows = jb.parse_bulk("# commentaire\n2000 5000\n\nabc 10\n2001;10", parse_line)
+    assert rows == [(2, ("2000", "5000"), None), (4, None, "id invalide"), (5, ("2001", "10"), None)]
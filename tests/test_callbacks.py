@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Dispatch des callbacks : anciens boutons et charges inattendues."""
+from __future__ import annotations
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("DB_URL", "sqlite://")
+
+import jefflebot_fr as jb
+
+
+class Call:
+    def __init__(self, data: str):
+        self.data = data
+        self.from_user = SimpleNamespace(id=1, first_name="Awa", last_name="", username="awa")
+        self.answers = []
+
+    async def answer(self, *a, **kw):
+        self.answers.append((a, kw))
+
+
+def test_arity_follows_handler_signature():
+    assert jb.callback_arity(jb.cb_noop) == (0, 0)
+    assert jb.callback_arity(jb.cb_page) == (1, 1)
+    low, high = jb.callback_arity(jb.CALLBACK_ACTIONS["ls.job"][0])
+    assert (low, high) == (0, 2)
+
+
+@pytest.mark.parametrize("data", [jb.pack_cb("pg"), jb.pack_cb("pg", 1, 2), jb.pack_cb("zz", 1), "pg~!!"])
+def test_stale_buttons_get_expired_alert(data):
+    call = Call(data)
+    asyncio.run(jb.cb_dispatch(call, None))
+    assert call.answers == [((jb.CB_EXPIRED,), {"show_alert": True})]
+
+
+def test_inline_button_from_unknown_user_creates_account():
+    jb.configure_database("sqlite://")
+    jb.migrate()
+    try:
+        with jb.db() as s:
+            s.add(jb.Product(name="Savon", sku="SAV", price=500))
+            s.commit()
+        call = Call(jb.pack_cb("a", 1))
+        asyncio.run(jb.cb_dispatch(call, None))
+        assert call.answers == [(("Ajouté au panier 🧺",), {})]
+        with jb.db() as s:
+            u = s.query(jb.User).filter_by(tg_id=1).one()
+            assert u.first_name == "Awa" and u.role == jb.UserRole.CUSTOMER.value
+            assert s.query(jb.CartItem).join(jb.Cart).filter(jb.Cart.user_id == u.id).count() == 1
+    finally:
+        jb.configure_database("sqlite://")
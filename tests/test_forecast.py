@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Prévision de réassort : plancher de moyenne mobile, cache journalier."""
+from __future__ import annotations
+import datetime as real_dt
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("DB_URL", "sqlite://")
+
+import jefflebot_fr as jb
+
+
+@pytest.fixture
+def paused_product():
+    """10 ventes/j pendant 20 jours, puis plus rien depuis 5 jours."""
+    jb.configure_database("sqlite://")
+    jb.migrate()
+    jb.forecast_cache().clear()
+    now = real_dt.datetime.utcnow()
+    with jb.db() as s:
+        p = jb.Product(name="Savon", sku="SAV", price=500, stock_qty=30)
+        s.add(p)
+        s.flush()
+        s.add_all(
+            jb.StockMovement(product_id=p.id, qty_change=-10, reason="vente", created_at=now - real_dt.timedelta(days=d))
+            for d in range(5, 25)
+        )
+        s.commit()
+    yield
+    jb.forecast_cache().clear()
+    jb.configure_database("sqlite://")
+
+
+def test_moving_average_floors_smoothed_level(paused_product):
+    [(name, _, stock, daily, avg, cover, reorder)] = jb.restock_forecast(14)
+    assert avg == pytest.approx(200 / jb.FORECAST_MA_WINDOW)
+    assert daily == avg  # le niveau lissé (~1.7/j) est retombé sous la moyenne
+    assert cover == pytest.approx(stock / avg) and reorder == 70
+
+
+def test_cache_expires_with_the_day(paused_product, monkeypatch):
+    first = jb.restock_forecast(14)
+    assert jb.restock_forecast(14) is first
+
+    class Tomorrow(real_dt.datetime):
+        @classmethod
+        def utcnow(cls):
+            return real_dt.datetime.utcnow() + real_dt.timedelta(days=1)
+
+    monkeypatch.setattr(jb, "dt", SimpleNamespace(
+        datetime=Tomorrow, date=real_dt.date, time=real_dt.time, timedelta=real_dt.timedelta))
+    assert jb.restock_forecast(14) is not first
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Messages longs : coupés sur des lignes entières, HTML toujours valide."""
+from __future__ import annotations
+import datetime as dt
+import os
+import re
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("DB_URL", "sqlite://")
+
+import jefflebot_fr as jb
+
+
+def balanced(text: str) -> bool:
+    tags = re.findall(r"<(/?)(\w+)[^>]*>", text)
+    opened = [name for close, name in tags if not close]
+    closed = [name for close, name in tags if close]
+    return sorted(opened) == sorted(closed) and not re.search(r"&[^;\s]*$", text) and text.count("<") == len(tags)
+
+
+def test_fit_lines_keeps_whole_lines():
+    lines = [f"<b>Ligne {i}</b> &amp; suite" for i in range(500)]
+    text = jb.fit_lines(lines)
+    assert len(text) <= jb.MESSAGE_LIMIT and balanced(text)
+    kept = text.split("\n")
+    assert kept[:-1] == lines[:len(kept) - 1] and kept[-1] == f"… (+{len(lines) - len(kept) + 1})"
+    assert jb.fit_lines(["court"]) == "court"
+    single = jb.fit_lines(["<i>" + "x &amp; " * 1000 + "</i>"], 100)
+    assert len(single) <= 100 and balanced(single) and single.endswith("…")
+
+
+def test_digest_and_feed_stay_under_the_limit():
+    now = dt.datetime(2026, 3, 2, 9)
+    rows = [SimpleNamespace(text=f"🆕 Nouvelle commande #{i} – Total <b>{'9' * 400}</b> CFA", amount=1, created_at=now)
+            for i in range(20)]
+    digest = jb.render_outbox_group("order", rows, now)
+    assert len(digest) <= jb.MESSAGE_LIMIT and balanced(digest) and re.search(r"… \(\+\d+\)$", digest)
+    posts = [SimpleNamespace(text="\n".join(f"<b>Promo {i}</b> savon &amp; huile" for i in range(400)), created_at=now)]
+    [page] = jb.render_feed(posts)
+    assert len(page) <= jb.MESSAGE_LIMIT and balanced(page)
@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+"""
+Budget de requêtes SQL par handler.
+
+Chaque handler du routeur est exécuté contre une base SQLite en mémoire
+pré-remplie, avec des stubs Message / CallbackQuery / FSMContext / Bot. Les
+instructions SQL sont comptées via l'événement before_cursor_execute du
+moteur. Le test échoue si un handler dépasse son budget déclaré, ou si son
+nombre de requêtes change avec le volume de données (N+1).
+
+Ajouter un handler sans budget ni scénario fait échouer test_every_handler_has_budget.
+"""
+from __future__ import annotations
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("DB_URL", "sqlite://")
+
+from sqlalchemy import event
+
+import jefflebot_fr as jb
+
+ADMIN = jb.ADMIN_CHAT_ID
+CUSTOMER = 1000
+WORKER = 2000
+SMALL, LARGE = 3, 30
+
+
+# ---------------------------------------------------------------------------
+# Stubs
+# ---------------------------------------------------------------------------
+class StubMessage:
+    def __init__(self, text: str = "", uid: int = ADMIN):
+        self.text = text
+        self.caption = None
+        self.document = None
+        self.from_user = SimpleNamespace(id=uid, first_name="Test", last_name="", username="test")
+        self.chat = SimpleNamespace(id=uid)
+        self.sent = []
+
+    async def answer(self, text, **kw):
+        self.sent.append(text)
+        return self
+
+    async def edit_text(self, text, **kw):
+        self.sent.append(text)
+        return self
+
+    async def edit_reply_markup(self, **kw):
+        return self
+
+    async def answer_document(self, document, **kw):
+        self.sent.append(document)
+        return self
+
+
+class StubCall:
+    def __init__(self, data: str = "", uid: int = ADMIN):
+        self.data = data
+        self.from_user = SimpleNamespace(id=uid, first_name="Test", last_name="", username="test")
+        self.message = StubMessage(uid=uid)
+
+    async def answer(self, *a, **kw):
+        pass
+
+
+class StubInlineQuery:
+    def __init__(self, query: str, uid: int = CUSTOMER):
+        self.id = "1"
+        self.query = query
+        self.from_user = SimpleNamespace(id=uid)
+
+    async def answer(self, results, **kw):
+        pass
+
+
+class StubState:
+    def __init__(self, **data):
+        self.data = dict(data)
+        self.state = None
+
+    async def set_state(self, state):
+        self.state = state
+
+    async def get_state(self):
+        return self.state
+
+    async def update_data(self, **kw):
+        self.data.update(kw)
+
+    async def get_data(self):
+        return dict(self.data)
+
+    async def clear(self):
+        self.data, self.state = {}, None
+
+
+class StubBot:
+    async def send_message(self, chat_id, text, **kw):
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Jeu de données
+# ---------------------------------------------------------------------------
+def seed(n: int) -> SimpleNamespace:
+    """Base neuve avec n lignes de chaque sorte ; le panier et la commande suivis ont n articles."""
+    jb.configure_database("sqlite://")
+    jb.migrate()
+    jb.product_search.index = None
+    jb.job_search.text = None
+    jb._forecast_cache.clear()
+    jb._feed_cache.clear()
+    with jb.db() as s:
+        admin = jb.User(tg_id=ADMIN, role=jb.UserRole.ADMIN.value)
+        customers = [jb.User(tg_id=CUSTOMER + i, first_name=f"Client {i}") for i in range(n)]
+        workers = [jb.User(tg_id=WORKER + i, role=jb.UserRole.WORKER.value) for i in range(n)]
+        products = [jb.Product(name=f"Produit {i}", sku=f"SKU{i}", price=100 + i, stock_qty=50) for i in range(n)]
+        s.add_all([admin, *customers, *workers, *products])
+        s.flush()
+        cart = jb.Cart(user_id=customers[0].id, is_open=True)
+        s.add(cart)
+        s.add_all(jb.Cart(user_id=u.id, is_open=False) for u in customers[1:])
+        s.flush()
+        items = [jb.CartItem(cart_id=cart.id, product_id=p.id, qty=2) for p in products]
+        order = jb.Order(user_id=customers[0].id, customer_name="Client 0", total=0)
+        s.add_all([*items, order])
+        s.flush()
+        s.add_all(jb.OrderItem(order_id=order.id, product_id=p.id, qty=1, unit_price=p.price) for p in products)
+        s.add_all(jb.Order(user_id=u.id, customer_name=u.first_name, total=100) for u in customers[1:])
+        s.add_all(jb.StockMovement(product_id=p.id, qty_change=-1, reason="vente", ref_type="order", ref_id=order.id) for p in products)
+        for i in range(n):
+            s.add(jb.LedgerEntry(entry_type=jb.LedgerType.INCOME.value, amount=1000, description=f"vente {i}"))
+            s.add(jb.LedgerEntry(entry_type=jb.LedgerType.EXPENSE.value, amount=100, description=f"achat {i}"))
+            s.add(jb.Payroll(worker_id=workers[i].id, amount=5000, method="cash"))
+            s.add(jb.Shift(worker_id=workers[i].id, status=jb.ShiftStatus.PRESENT.value))
+            s.add(jb.JobApplication(applicant_tg_id=CUSTOMER + i, applicant_name=f"Candidat {i}", contact="-",
+                                    position="vendeur", resume="caisse et stock"))
+            s.add(jb.Post(text=f"Annonce {i}"))
+            s.add(jb.OutboxMessage(chat_id=ADMIN, text=f"notif {i}"))
+        s.commit()
+        jb.rebuild_worker_daily(s)
+        s.commit()
+        return SimpleNamespace(order_id=order.id, item_id=items[0].id, product_id=products[0].id)
+
+
+def msg(text: str = "", uid: int = ADMIN) -> StubMessage:
+    return StubMessage(text, uid)
+
+
+def call(uid: int = ADMIN) -> StubCall:
+    return StubCall(uid=uid)
+
+
+def state(**data) -> StubState:
+    return StubState(**data)
+
+
+def cb(action: str):
+    return jb.CALLBACK_ACTIONS[action][0]
+
+
+# ---------------------------------------------------------------------------
+# Scénarios : clé de budget -> coroutine à exécuter sur le jeu de données w
+# Handlers du routeur par nom de fonction, actions de callback en "cb:<action>".
+# ---------------------------------------------------------------------------
+TODAY = jb.dt.datetime.utcnow().date().toordinal()
+BULK_PAY = f"/paybulk\n{WORKER} 5000 cash\n{WORKER + 1} 4000 mobile prime\n999 10 cash"
+BULK_PRESENCE = f"/presencebulk\n{WORKER} PRESENT caisse\n{WORKER + 1} ABSENT\n999 PRESENT"
+
+SCENARIOS = {
+    "cmd_start": lambda w: jb.cmd_start(msg("/start", uid=CUSTOMER + 999), state()),
+    "cmd_help": lambda w: jb.cmd_help(msg("/help")),
+    "cmd_admin": lambda w: jb.cmd_admin(msg("/admin")),
+    "btn_admin": lambda w: jb.btn_admin(msg("🛠️ Admin")),
+    "btn_order": lambda w: jb.btn_order(msg("🛒 Passer une commande", uid=CUSTOMER)),
+    "cmd_catalogue": lambda w: jb.cmd_catalogue(msg("/catalogue", uid=CUSTOMER)),
+    "cmd_search": lambda w: jb.cmd_search(msg("/search produit", uid=CUSTOMER)),
+    "inline_search": lambda w: jb.inline_search(StubInlineQuery("produit")),
+    "btn_track": lambda w: jb.btn_track(msg("📦 Suivre ma commande", uid=CUSTOMER)),
+    "track_by_id": lambda w: jb.track_by_id(msg(str(w.order_id), uid=CUSTOMER)),
+    "btn_posts": lambda w: jb.btn_posts(msg("📰 Dernières annonces", uid=CUSTOMER)),
+    "btn_job": lambda w: jb.btn_job(msg("👔 Postuler à un emploi", uid=CUSTOMER), state()),
+    "job_name": lambda w: jb.job_name(msg("Awa", uid=CUSTOMER), state()),
+    "job_contact": lambda w: jb.job_contact(msg("+237600000000", uid=CUSTOMER), state()),
+    "job_position": lambda w: jb.job_position(msg("vendeuse", uid=CUSTOMER), state()),
+    "job_resume": lambda w: jb.job_resume(
+        msg("3 ans d'expérience", uid=CUSTOMER),
+        state(name="Awa", contact="+237600000000", position="vendeuse"),
+    ),
+    "cb_dispatch": lambda w: jb.cb_dispatch(StubCall(jb.pack_cb("_"), uid=CUSTOMER), state()),
+    "cmd_payer": lambda w: jb.cmd_payer(msg(f"/payer {w.order_id} 500", uid=CUSTOMER)),
+    "cmd_addproduct": lambda w: jb.cmd_addproduct(msg("/addproduct"), state()),
+    "pf_name": lambda w: jb.pf_name(msg("Savon"), state()),
+    "pf_sku": lambda w: jb.pf_sku(msg("sav1"), state()),
+    "pf_price": lambda w: jb.pf_price(msg("250"), state()),
+    "pf_stock": lambda w: jb.pf_stock(msg("12"), state(name="Savon", sku="SAV1", price=250.0)),
+    "cmd_listproducts": lambda w: jb.cmd_listproducts(msg("/listproducts")),
+    "cmd_toggleproduct": lambda w: jb.cmd_toggleproduct(msg("/toggleproduct SKU0")),
+    "cmd_price": lambda w: jb.cmd_price(msg("/price SKU0 300")),
+    "cmd_stockin": lambda w: jb.cmd_stockin(msg("/stockin"), state()),
+    "cmd_stockout": lambda w: jb.cmd_stockout(msg("/stockout"), state()),
+    "saf_product": lambda w: jb.saf_product(msg("sku0"), state(direction="in")),
+    "saf_qty": lambda w: jb.saf_qty(msg("5"), state(direction="in", product_id=w.product_id)),
+    "saf_reason": lambda w: jb.saf_reason(msg("casse"), state(direction="out", product_id=w.product_id, qty=2)),
+    "cmd_inventory": lambda w: jb.cmd_inventory(msg("/inventory")),
+    "cmd_recette": lambda w: jb.cmd_recette(msg("/recette"), state()),
+    "cmd_depense": lambda w: jb.cmd_depense(msg("/depense"), state()),
+    "ledger_amount": lambda w: jb.ledger_amount(msg("1500"), state(kind=jb.LedgerType.INCOME.value)),
+    "ledger_desc": lambda w: jb.ledger_desc(msg("vente comptoir"), state(kind=jb.LedgerType.INCOME.value, amount=1500.0)),
+    "cmd_cash": lambda w: jb.cmd_cash(msg("/cash")),
+    "cmd_pay": lambda w: jb.cmd_pay(msg("/pay"), state()),
+    "pr_worker": lambda w: jb.pr_worker(msg(str(WORKER)), state()),
+    "pr_amount": lambda w: jb.pr_amount(msg("5000"), state(worker_tg=WORKER)),
+    "pr_method": lambda w: jb.pr_method(msg("cash"), state(worker_tg=WORKER, amount=5000.0)),
+    "pr_note": lambda w: jb.pr_note(msg("-"), state(worker_tg=WORKER, amount=5000.0, method="cash")),
+    "cmd_paylist": lambda w: jb.cmd_paylist(msg("/paylist")),
+    "cmd_addworker": lambda w: jb.cmd_addworker(msg(f"/addworker {CUSTOMER + 1}")),
+    "cmd_presence": lambda w: jb.cmd_presence(msg(f"/presence {WORKER} PRESENT caisse")),
+    "cmd_paybulk": lambda w: jb.cmd_paybulk(msg(BULK_PAY), StubBot()),
+    "cmd_presencebulk": lambda w: jb.cmd_presencebulk(msg(BULK_PRESENCE), StubBot()),
+    "cmd_workers": lambda w: jb.cmd_workers(msg("/workers")),
+    "cmd_statement": lambda w: jb.cmd_statement(msg(f"/statement {WORKER}")),
+    "cmd_crew": lambda w: jb.cmd_crew(msg("/crew")),
+    "cmd_post": lambda w: jb.cmd_post(msg("/post Arrivage de savon")),
+    "cmd_broadcast": lambda w: jb.cmd_broadcast(msg("/broadcast produit:SKU0")),
+    "cmd_jobs": lambda w: jb.cmd_jobs(msg("/jobs statut:recu poste:vend caisse"), state()),
+    "cmd_jobstatus": lambda w: jb.cmd_jobstatus(
+        msg("/jobstatus preselection filtre"), state(**{"ls.job": {"status": "recu", "query": "caisse"}}),
+    ),
+    "cmd_stats": lambda w: jb.cmd_stats(msg("/stats")),
+    "cmd_top": lambda w: jb.cmd_top(msg("/top 7")),
+    "cmd_heatmap": lambda w: jb.cmd_heatmap(msg("/heatmap 4")),
+    "cmd_compare": lambda w: jb.cmd_compare(msg("/compare")),
+    "cmd_forecast": lambda w: jb.cmd_forecast(msg("/forecast 14")),
+    "cmd_throttle": lambda w: jb.cmd_throttle(msg("/throttle")),
+    "cmd_archive": lambda w: jb.cmd_archive(msg("/archive")),
+    "cmd_profile": lambda w: jb.cmd_profile(msg("/profile 0.2")),
+    "cmd_backup": lambda w: jb.cmd_backup(msg("/backup")),
+    "cmd_export": lambda w: jb.cmd_export(msg("/export")),
+    "cb:_": lambda w: cb("_")(call(CUSTOMER), state()),
+    "cb:fd": lambda w: cb("fd")(call(CUSTOMER), state(), 1),
+    "cb:pg": lambda w: cb("pg")(call(CUSTOMER), state(), 1),
+    "cb:a": lambda w: cb("a")(call(CUSTOMER), state(), w.product_id),
+    "cb:co": lambda w: cb("co")(call(CUSTOMER), state()),
+    "cb:cb": lambda w: cb("cb")(call(CUSTOMER), state()),
+    "cb:ci": lambda w: cb("ci")(call(CUSTOMER), state(), w.item_id),
+    "cb:cd": lambda w: cb("cd")(call(CUSTOMER), state(), w.item_id),
+    "cb:cx": lambda w: cb("cx")(call(CUSTOMER), state(), w.item_id),
+    "cb:ck": lambda w: cb("ck")(call(CUSTOMER), state()),
+    "cb:ps": lambda w: cb("ps")(call(), state(), WORKER, TODAY - 29, TODAY),
+    "cb:adm.stats": lambda w: cb("adm.stats")(call(), state()),
+    "cb:adm.export": lambda w: cb("adm.export")(call(), state()),
+}
+for _action in jb.CALLBACK_ACTIONS:
+    if _action.startswith("ls."):
+        SCENARIOS[f"cb:{_action}"] = (lambda a: lambda w: cb(a)(call(), state(), 1, 1))(_action)
+for _section in jb.ADMIN_SECTIONS:
+    SCENARIOS[f"cb:adm.{_section}"] = (lambda a: lambda w: cb(a)(call(), state()))(f"adm.{_section}")
+
+# Nombre maximal d'instructions SQL par exécution du scénario (jeu SMALL).
+# /paybulk et /presencebulk : lot de 3 lignes, indépendant du volume en base.
+# Paies et pointages : + 1 UPSERT des cumuls worker_daily par transaction.
+# /jobs et /jobstatus filtrés par mots-clés : + 1 pour construire l'index JobSearch à froid.
+BUDGETS = {
+    "cmd_start": 2,
+    "cmd_help": 0,
+    "cmd_admin": 0,
+    "btn_admin": 0,
+    "btn_order": 2,
+    "cmd_catalogue": 2,
+    "cmd_search": 1,
+    "inline_search": 1,
+    "btn_track": 0,
+    "track_by_id": 2,
+    "btn_posts": 1,
+    "btn_job": 0,
+    "job_name": 0,
+    "job_contact": 0,
+    "job_position": 0,
+    "job_resume": 2,
+    "cb_dispatch": 0,
+    "cmd_payer": 4,
+    "cmd_addproduct": 0,
+    "pf_name": 0,
+    "pf_sku": 0,
+    "pf_price": 0,
+    "pf_stock": 2,
+    "cmd_listproducts": 1,
+    "cmd_toggleproduct": 2,
+    "cmd_price": 2,
+    "cmd_stockin": 0,
+    "cmd_stockout": 0,
+    "saf_product": 1,
+    "saf_qty": 0,
+    "saf_reason": 3,
+    "cmd_inventory": 1,
+    "cmd_recette": 0,
+    "cmd_depense": 0,
+    "ledger_amount": 0,
+    "ledger_desc": 1,
+    "cmd_cash": 1,
+    "cmd_pay": 0,
+    "pr_worker": 0,
+    "pr_amount": 0,
+    "pr_method": 0,
+    "pr_note": 4,
+    "cmd_paylist": 2,
+    "cmd_addworker": 2,
+    "cmd_presence": 3,
+    "cmd_paybulk": 9,
+    "cmd_presencebulk": 4,
+    "cmd_workers": 1,
+    "cmd_statement": 2,
+    "cmd_crew": 1,
+    "cmd_post": 1,
+    "cmd_broadcast": 2,
+    "cmd_jobs": 2,
+    "cmd_jobstatus": 4,
+    "cmd_stats": 2,
+    "cmd_top": 11,
+    "cmd_heatmap": 11,
+    "cmd_compare": 12,
+    "cmd_forecast": 3,
+    "cmd_throttle": 0,
+    "cmd_archive": 5,
+    "cmd_profile": 0,
+    "cmd_backup": 0,
+    "cmd_export": 30,
+    "cb:_": 0,
+    "cb:fd": 1,
+    "cb:pg": 2,
+    "cb:a": 4,
+    "cb:co": 3,
+    "cb:cb": 2,
+    "cb:ci": 3,
+    "cb:cd": 3,
+    "cb:cx": 3,
+    "cb:ck": 10,
+    "cb:ps": 2,
+    "cb:adm.stats": 3,
+    "cb:adm.export": 3,
+}
+for _key in SCENARIOS:
+    if _key.startswith("cb:ls."):
+        # une page keyset, plus le total du pied de page s'il y en a un
+        BUDGETS.setdefault(_key, 2 if jb.LISTINGS[_key[len("cb:ls."):]].footer is None else 3)
+    elif _key.startswith("cb:adm."):
+        BUDGETS.setdefault(_key, 0)
+
+
+def router_handler_names():
+    names = set()
+    for observer in (jb.router.message, jb.router.callback_query, jb.router.inline_query):
+        names.update(h.callback.__name__ for h in observer.handlers)
+    return names
+
+
+def count_queries(key: str, n: int) -> list:
+    w = seed(n)
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = jb.get_engine()
+    event.listen(engine, "before_cursor_execute", on_execute)
+    try:
+        asyncio.run(SCENARIOS[key](w))
+    finally:
+        event.remove(engine, "before_cursor_execute", on_execute)
+    return statements
+
+
+@pytest.fixture(autouse=True)
+def _isolated(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("ARCHIVE_DB_URL", raising=False)
+    yield
+    jb.configure_database("sqlite://")
+
+
+def test_every_handler_has_budget():
+    expected = router_handler_names() | {f"cb:{a}" for a in jb.CALLBACK_ACTIONS}
+    assert expected - SCENARIOS.keys() == set(), "handler sans scénario"
+    assert SCENARIOS.keys() - BUDGETS.keys() == set(), "scénario sans budget"
+    assert BUDGETS.keys() <= SCENARIOS.keys()
+
+
+@pytest.mark.parametrize("key", sorted(SCENARIOS))
+def test_query_budget(key):
+    statements = count_queries(key, SMALL)
+    assert len(statements) <= BUDGETS[key], (
+        f"{key}: {len(statements)} requêtes pour un budget de {BUDGETS[key]}\n" + "\n".join(statements)
+    )
+
+
+@pytest.mark.parametrize("key", sorted(SCENARIOS))
+def test_query_count_independent_of_rows(key):
+    small, large = count_queries(key, SMALL), count_queries(key, LARGE)
+    assert len(small) == len(large), (
+        f"{key}: {len(small)} requêtes avec {SMALL} lignes, {len(large)} avec {LARGE}\n" + "\n".join(large)
+    )
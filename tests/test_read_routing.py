@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Routage des lectures : instantané SQLite, lecture de ses propres écritures."""
+from __future__ import annotations
+import os
+import sys
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("DB_URL", "sqlite://")
+
+import jefflebot_fr as jb
+
+ADMIN = 42
+
+
+@pytest.fixture
+def shop(tmp_path, monkeypatch):
+    monkeypatch.setattr(jb, "READ_SNAPSHOT_S", 60)
+    jb.configure_database(f"sqlite:///{tmp_path}/shop.db")
+    jb.migrate()
+    with jb.db() as s:
+        s.add_all(jb.User(tg_id=100 + i, role=jb.UserRole.CUSTOMER.value) for i in range(3))
+        s.commit()
+    yield
+    jb.configure_database("sqlite://")
+
+
+def add_ledger(amount: int, actor=None):
+    token = jb._actor.set(actor)
+    try:
+        with jb.db() as s:
+            s.add(jb.LedgerEntry(entry_type=jb.LedgerType.INCOME.value, amount=amount))
+            s.commit()
+    finally:
+        jb._actor.reset(token)
+
+
+def read_total(actor=None) -> float:
+    token = jb._actor.set(actor)
+    try:
+        with jb.db_read() as s:
+            return float(s.scalar(jb.select(jb.func.coalesce(jb.func.sum(jb.LedgerEntry.amount), 0))))
+    finally:
+        jb._actor.reset(token)
+
+
+def test_reads_use_primary_until_snapshot_exists(shop):
+    with jb.db_read() as s:
+        assert s.get_bind() is jb.get_engine()
+    assert jb.refresh_read_snapshot() > 0
+    with jb.db_read() as s:
+        assert s.get_bind() is not jb.get_engine()
+        assert s.get_bind().url.database.endswith("shop_read.db")
+
+
+def test_writer_reads_own_writes_others_read_snapshot(shop):
+    jb.refresh_read_snapshot()
+    add_ledger(500, actor=ADMIN)
+    assert read_total(actor=ADMIN) == 500
+    assert read_total(actor=7) == 0
+    jb.refresh_read_snapshot()
+    assert read_total(actor=7) == 500
+    assert jb.read_routes().engine_for(ADMIN) is not None
+
+
+def test_snapshot_is_read_only(shop):
+    jb.refresh_read_snapshot()
+    with jb.db_read() as s:
+        s.add(jb.Post(text="x"))
+        with pytest.raises(OperationalError):
+            s.commit()
+
+
+def test_broadcast_segment_from_snapshot(shop):
+    jb.refresh_read_snapshot()
+    with jb.db() as s:
+        assert jb.enqueue_segment(s, "clients", "bonjour") == 3
+        s.commit()
+    with jb.db() as s:
+        assert sorted(s.scalars(jb.select(jb.OutboxMessage.chat_id))) == [100, 101, 102]
+
+
+def test_zero_replica_lag_does_not_break_commits(tmp_path, monkeypatch):
+    monkeypatch.setattr(jb, "READ_REPLICA_LAG_S", 0)
+    jb.configure_database(f"sqlite:///{tmp_path}/primary.db", read_url=f"sqlite:///{tmp_path}/primary.db")
+    try:
+        jb.migrate()
+        add_ledger(100, actor=ADMIN)
+        assert read_total(actor=ADMIN) == 100
+    finally:
+        jb.configure_database("sqlite://")
+
+
+def test_write_is_noted_once_visible_to_other_connections(shop, monkeypatch):
+    seen = []
+    note_write = jb.ReadRoutes.note_write
+
+    def spy(self, user_id):
+        with jb.get_engine().connect() as other:
+            seen.append(other.scalar(jb.select(jb.func.count()).select_from(jb.LedgerEntry)))
+        note_write(self, user_id)
+
+    monkeypatch.setattr(jb.ReadRoutes, "note_write", spy)
+    add_ledger(500, actor=ADMIN)
+    assert seen == [1]
+
+
+def test_schema_tenant_reads_its_schema_on_the_replica(tmp_path):
+    replica = f"sqlite:///{tmp_path}/replica.db"
+    for name, path in (("Dakar", "replica.db"), ("Thiès", "shop_thies.db")):
+        jb.configure_database(f"sqlite:///{tmp_path}/{path}")
+        jb.migrate()
+        with jb.db() as s:
+            s.add(jb.Product(name=name, sku=name[:3], price=100))
+            s.commit()
+    jb.configure_database("sqlite://")
+    config = jb.AppConfig(bot_token="1:A", admin_chat_id=1, db_url=replica, read_db_url=replica)
+    tenant = jb.Tenant("thies", config, schema="shop_thies")
+    engine = tenant.reads.engine_for(None)
+    assert engine.get_execution_options()["schema_translate_map"] == {None: "shop_thies"}
+
+    @jb.event.listens_for(engine, "connect")
+    def attach(dbapi_conn, record):
+        dbapi_conn.execute(f"ATTACH DATABASE '{tmp_path}/shop_thies.db' AS shop_thies")
+
+    with jb.using_tenant(tenant), jb.db_read() as s:
+        assert s.scalars(jb.select(jb.Product.name)).all() == ["Thiès"]
+    tenant.release()
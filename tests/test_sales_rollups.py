@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Agrégats de ventes : rafraîchissements concurrents, filigrane, jours recalculés."""
+from __future__ import annotations
+import datetime as dt
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("DB_URL", "sqlite://")
+
+import jefflebot_fr as jb
+
+ORDERS = 500
+
+
+@pytest.fixture
+def orders(tmp_path, monkeypatch):
+    monkeypatch.setattr(jb, "ROLLUP_BATCH", 50)
+    jb.configure_database(f"sqlite:///{tmp_path}/shop.db")
+    jb.migrate()
+    now = dt.datetime(2026, 3, 2, 9)
+    with jb.db() as s:
+        s.execute(jb.insert(jb.Order), [
+            {"customer_name": "x", "total": 100, "created_at": now + dt.timedelta(minutes=i)} for i in range(ORDERS)
+        ])
+        s.commit()
+    yield
+    jb.configure_database("sqlite://")
+
+
+def hourly_totals() -> tuple:
+    with jb.db() as s:
+        return s.execute(jb.select(jb.func.sum(jb.SalesHourly.orders), jb.func.sum(jb.SalesHourly.revenue))).one()
+
+
+def test_concurrent_refreshes_count_each_order_once(orders):
+    done = []
+    threads = [threading.Thread(target=lambda: done.append(jb.refresh_sales_rollups())) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(done) == ORDERS
+    n, revenue = hourly_totals()
+    assert n == ORDERS and float(revenue) == ORDERS * 100
+
+
+def test_stale_watermark_is_not_applied(orders):
+    with jb.db() as s:
+        assert jb.meta_swap(s, "sales_rollup_order_id", None, 10)
+        s.commit()
+    with jb.db() as s:
+        assert not jb.meta_swap(s, "sales_rollup_order_id", None, 20)
+        s.rollback()
+        assert not jb.meta_swap(s, "sales_rollup_order_id", "5", 20)
+        assert jb.meta_swap(s, "sales_rollup_order_id", "10", 20)
+        s.commit()
+        assert jb.meta_get(s, "sales_rollup_order_id") == "20"
+
+
+def rollup_of(day: dt.date) -> tuple:
+    with jb.db() as s:
+        start = dt.datetime.combine(day, dt.time.min)
+        hourly = s.execute(
+            jb.select(jb.func.sum(jb.SalesHourly.orders), jb.func.sum(jb.SalesHourly.revenue))
+            .where(jb.SalesHourly.hour >= start, jb.SalesHourly.hour < start + dt.timedelta(days=1))
+        ).one()
+        daily = s.execute(
+            jb.select(jb.func.sum(jb.ProductSalesDaily.qty)).where(jb.ProductSalesDaily.day == day)
+        ).scalar()
+    return hourly[0], float(hourly[1] or 0), daily
+
+
+def test_changed_orders_recompute_their_day(tmp_path):
+    jb.configure_database(f"sqlite:///{tmp_path}/shop.db")
+    jb.migrate()
+    day = dt.datetime.utcnow().replace(hour=9, minute=0) - dt.timedelta(days=2)
+    try:
+        with jb.db() as s:
+            p = jb.Product(name="Savon", sku="SAV", price=100)
+            orders = [jb.Order(customer_name="x", total=100 * n, created_at=day) for n in (1, 2)]
+            s.add_all([p, *orders])
+            s.flush()
+            s.add_all(jb.OrderItem(order_id=o.id, product_id=p.id, qty=n, unit_price=100) for n, o in enumerate(orders, 1))
+            s.commit()
+        jb.refresh_sales_rollups()
+        assert rollup_of(day.date()) == (2, 300.0, 3)
+        with jb.db() as s:
+            s.get(jb.Order, 1).total = 150
+            s.query(jb.Order).filter_by(id=2).one().status = jb.OrderStatus.PAID.value
+            s.delete(s.query(jb.OrderItem).filter_by(order_id=2).one())
+            s.commit()
+            assert s.scalars(jb.select(jb.SalesRollupDirty.day)).all() == [day.date()]
+        jb.refresh_sales_rollups()
+        assert rollup_of(day.date()) == (2, 350.0, 1)
+        with jb.db() as s:
+            assert s.query(jb.SalesRollupDirty).count() == 0
+    finally:
+        jb.configure_database("sqlite://")
+
+
+def test_watermark_waits_for_recent_orders_when_ids_precede_commits(orders, monkeypatch):
+    monkeypatch.setattr(jb, "_rollup_lag", lambda s: 60)
+    with jb.db() as s:
+        s.add(jb.Order(customer_name="late", total=100, created_at=dt.datetime.utcnow()))
+        s.add(jb.Order(customer_name="later", total=100, created_at=dt.datetime(2026, 1, 1)))
+        s.commit()
+    assert jb.refresh_sales_rollups() == ORDERS
+    with jb.db() as s:
+        assert jb.meta_get(s, "sales_rollup_order_id") == str(ORDERS)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""Mode multi-boutiques : isolation des données, admin et caches par boutique."""
+from __future__ import annotations
+import asyncio
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("DB_URL", "sqlite://")
+
+import jefflebot_fr as jb
+
+
+def make_registry(n: int = 2, warm_max: int = 8) -> jb.TenantRegistry:
+    tenants = [
+        jb.Tenant(f"shop{i}", jb.AppConfig(bot_token=f"{100 + i}:TOKEN", admin_chat_id=10 + i, db_url="sqlite://"))
+        for i in range(n)
+    ]
+    registry = jb.TenantRegistry(tenants, warm_max=warm_max)
+    for t in registry:
+        with jb.using_tenant(t):
+            t.migrate()
+    return registry
+
+
+def test_data_search_and_admin_are_isolated():
+    a, b = make_registry().tenants
+    with jb.using_tenant(a):
+        with jb.db() as s:
+            s.add(jb.Product(name="Savon noir", sku="SAV", price=500))
+            s.commit()
+        assert [h[1] for h in jb.search_index().search("savon")] == ["Savon noir"]
+        assert jb.is_admin(10) and not jb.is_admin(11)
+    with jb.using_tenant(b):
+        with jb.db() as s:
+            assert s.query(jb.Product).count() == 0
+        assert jb.search_index().search("savon") == []
+        assert jb.is_admin(11) and not jb.is_admin(10)
+    assert jb._tenant.get() is None
+    assert jb.get_engine() not in (a.engine, b.engine)
+
+
+def test_cold_tenants_release_caches():
+    registry = make_registry(n=3, warm_max=2)
+    first = registry.tenants[0]
+    with jb.using_tenant(first):
+        jb.search_index().search("x")
+        jb.forecast_cache()["key"] = "stale"
+    assert first.search.index is not None
+    registry.touch(first)
+    for t in registry.tenants[1:]:
+        registry.touch(t)
+    assert list(registry._warm) == ["shop1", "shop2"]
+    assert first.search.index is None and first.forecast_cache == {}
+
+
+def test_background_work_does_not_rewarm_shops():
+    registry = make_registry(n=3, warm_max=2)
+    busy, idle = registry.tenants[1:]
+    mw = jb.TenantMiddleware(registry)
+
+    async def handler(event, data):
+        return None
+
+    for t in (busy, idle):
+        asyncio.run(mw(handler, None, {"bot": SimpleNamespace(id=t.bot_id)}))
+    with jb.using_tenant(registry.tenants[0]):
+        with jb.db() as s:  # outbox, sauvegarde… d'une boutique inactive
+            s.query(jb.OutboxMessage).count()
+    assert list(registry._warm) == ["shop1", "shop2"]
+
+
+def test_middleware_routes_updates_by_bot_id():
+    registry = make_registry()
+    seen = []
+
+    async def handler(event, data):
+        seen.append((jb._tenant.get().key, jb.admin_chat_id()))
+
+    mw = jb.TenantMiddleware(registry)
+    for t in reversed(registry.tenants):
+        asyncio.run(mw(handler, None, {"bot": SimpleNamespace(id=t.bot_id)}))
+    asyncio.run(mw(handler, None, {"bot": SimpleNamespace(id=999)}))
+    assert seen == [("shop1", 11), ("shop0", 10)]
+
+
+def test_load_tenants(tmp_path, monkeypatch):
+    monkeypatch.setattr(jb, "TENANTS_DIR", str(tmp_path))
+    path = tmp_path / "tenants.json"
+    path.write_text(json.dumps([
+        {"key": "dakar", "bot_token": "1:A", "admin_chat_id": 5},
+        {"key": "thies", "bot_token": "2:B", "admin_chat_id": "6", "db_url": "sqlite://"},
+    ]))
+    registry = jb.load_tenants(str(path))
+    assert registry.by_key["dakar"].config.db_url == f"sqlite:///{tmp_path}/dakar.db"
+    assert registry.by_bot_id[2].config.admin_chat_id == 6
+
+    path.write_text(json.dumps([
+        {"key": "dakar", "bot_token": "1:A", "admin_chat_id": 5},
+        {"key": "dakar", "bot_token": "2:B", "admin_chat_id": 6},
+    ]))
+    with pytest.raises(ValueError):
+        jb.load_tenants(str(path))
+    path.write_text(json.dumps([{"key": "x", "bot_token": "1:A", "admin_chat_id": 5, "schema": "bad;name"}]))
+    with pytest.raises(ValueError):
+        jb.load_tenants(str(path))
+
+
+def test_schema_tenant_backup_dumps_only_its_schema(tmp_path, monkeypatch):
+    monkeypatch.setattr(jb, "BACKUP_DIR", str(tmp_path))
+    calls = []
+
+    class Proc:
+        returncode = 0
+
+        async def communicate(self):
+            return b"", b""
+
+    async def fake_exec(*args, **kw):
+        calls.append(args)
+        with open(args[args.index("--file") + 1], "wb") as f:
+            f.write(b"dump")
+        return Proc()
+
+    monkeypatch.setattr(jb.asyncio, "create_subprocess_exec", fake_exec)
+    tenant = jb.Tenant("thies", jb.AppConfig(bot_token="1:A", admin_chat_id=1, db_url="postgresql://u@db/shops"),
+                       schema="shop_thies")
+    with jb.using_tenant(tenant):
+        info = asyncio.run(jb.run_backup())
+    args = calls[0]
+    assert args[args.index("--schema") + 1] == "shop_thies"
+    assert os.path.dirname(info["path"]) == str(tmp_path / "thies")
+
+
+def test_maintenance_locks_are_per_shop():
+    a, b = make_registry().tenants
+
+    async def go():
+        with jb.using_tenant(a):
+            await jb.backup_lock().acquire()
+            assert jb.backup_lock().locked() and not jb.export_lock().locked()
+        with jb.using_tenant(b):
+            assert not jb.backup_lock().locked() and not jb.archive_lock().locked()
+        assert not jb.backup_lock().locked()
+        with jb.using_tenant(a):
+            jb.backup_lock().release()
+
+    asyncio.run(go())
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Cumuls journaliers par travailleur : tenue à jour, recalcul, relevés."""
+from __future__ import annotations
+import datetime as dt
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("DB_URL", "sqlite://")
+
+import jefflebot_fr as jb
+
+WORKER = 2000
+
+
+@pytest.fixture
+def worker():
+    jb.configure_database("sqlite://")
+    jb.migrate()
+    with jb.db() as s:
+        w = jb.User(tg_id=WORKER, first_name="Awa", role=jb.UserRole.WORKER.value)
+        s.add(w)
+        s.commit()
+    yield w
+    jb.configure_database("sqlite://")
+
+
+def rollups() -> dict:
+    with jb.db() as s:
+        return {(r.worker_id, r.day): (float(r.paid), r.payments, r.present, r.absent) for r in s.query(jb.WorkerDaily)}
+
+
+def test_incremental_rollups_match_rebuild(worker):
+    with jb.db() as s:
+        jb.record_payroll(s, worker, 5000, "cash")
+        jb.record_payroll(s, worker, 2500.5, "mobile")
+        jb.record_shift(s, worker, jb.ShiftStatus.PRESENT.value)
+        s.commit()
+    with jb.db() as s:
+        jb.record_payroll(s, worker, 99999, "cash")
+        s.rollback()
+        jb.record_shift(s, worker, jb.ShiftStatus.ABSENT.value)
+        s.commit()
+    today = dt.datetime.utcnow().date()
+    incremental = rollups()
+    assert incremental == {(worker.id, today): (7500.5, 2, 1, 1)}
+    with jb.db() as s:
+        assert jb.rebuild_worker_daily(s) == 1
+        s.commit()
+    assert rollups() == incremental
+
+
+def test_migrate_backfills_existing_history(tmp_path):
+    url = f"sqlite:///{tmp_path}/old.db"
+    jb.configure_database(url)
+    tables = [t for t in jb.Base.metadata.sorted_tables if t.name != "worker_daily"]
+    jb.Base.metadata.create_all(jb.get_engine(), tables=tables)
+    with jb.db() as s:
+        w = jb.User(tg_id=WORKER, role=jb.UserRole.WORKER.value)
+        s.add(w)
+        s.flush()
+        s.add(jb.Payroll(worker_id=w.id, amount=3000, date=dt.datetime(2026, 3, 2, 9)))
+        s.add(jb.Shift(worker_id=w.id, status=jb.ShiftStatus.PRESENT.value, date=dt.datetime(2026, 3, 2, 8)))
+        s.commit()
+    jb.migrate()
+    assert rollups() == {(1, dt.date(2026, 3, 2)): (3000.0, 1, 1, 0)}
+    jb.configure_database("sqlite://")
+
+
+def test_statement_and_payslip(worker):
+    with jb.db() as s:
+        jb.record_payroll(s, worker, 4000, "cash")
+        jb.record_shift(s, worker, jb.ShiftStatus.PRESENT.value)
+        s.commit()
+    start, end = jb.parse_period([], default_days=30)
+    with jb.db_read() as s:
+        w, days = jb.worker_statement(s, WORKER, start, end)
+    lines = jb.render_statement(w, days, start, end)
+    assert "Awa" in lines[0] and "4000.0 CFA" in lines[-1] and "Jours présents: <b>1</b>" in lines[-1]
+    name, content = jb.build_payslip(WORKER, start, end)
+    assert name.startswith(f"bulletin-{WORKER}-") and b"4000.0 CFA" in content
+    assert jb.build_payslip(1, start, end) is None
+    with pytest.raises(ValueError):
+        jb.parse_period(["2026-02-01", "2026-01-01"], default_days=7)